@@ -1,20 +1,14 @@
+import glob
 import logging
+import os
+import shutil
 import sys
+import tempfile
 
 import click
-import httpx
 import uvicorn
 
-from a2a.server.apps import A2AStarletteApplication
-from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import (
-    BasePushNotificationSender,
-    InMemoryPushNotificationConfigStore,
-    InMemoryTaskStore,
-)
 from dotenv import load_dotenv
-from agent_configurator import create_agent_card
-from agent_executor import KGragAgentExecutor
 
 
 load_dotenv()
@@ -27,35 +21,72 @@ class MissingAPIKeyError(Exception):
     """Exception for missing API key."""
 
 
+def prepare_metrics_dir() -> str | None:
+    """
+    Prepare the directory where the workers write their metrics, so that
+    `/metrics` aggregates them (`prometheus_client` multiprocess mode).
+
+    `PROMETHEUS_MULTIPROC_DIR` is emptied of the files of a previous run,
+    or set to a new temporary directory.
+
+    Returns:
+        str | None: The temporary directory to remove on exit, if any.
+    """
+    metrics_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+            os.remove(path)
+        return None
+    metrics_dir = tempfile.mkdtemp(prefix='kgrag-metrics-')
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = metrics_dir
+    return metrics_dir
+
+
 @click.command()
 @click.option('--host', 'host', default='localhost')
 @click.option('--port', 'port', default=10000)
-def main(host, port):
+@click.option('--workers', 'workers', default=1,
+              help='Number of worker processes.')
+@click.option('--warmup/--no-warmup', 'warmup', default=None,
+              help='Warm every worker up before it reports ready '
+              '(default: WARMUP_ENABLED).')
+def main(host, port, workers, warmup):
     """
     Main entry point for the application.
     """
     try:
-        httpx_client = httpx.AsyncClient()
-        push_config_store = InMemoryPushNotificationConfigStore()
-        push_sender = BasePushNotificationSender(
-            httpx_client=httpx_client,
-            config_store=push_config_store
-        )
+        if warmup is not None:
+            # Read by the settings of every worker
+            os.environ['WARMUP_ENABLED'] = 'true' if warmup else 'false'
 
-        request_handler = DefaultRequestHandler(
-            agent_executor=KGragAgentExecutor(),
-            task_store=InMemoryTaskStore(),
-            push_config_store=push_config_store,
-            push_sender=push_sender
-        )
+        if workers > 1:
+            # Every worker builds its own application from the factory;
+            # the address of the agent card reaches them through the
+            # environment
+            os.environ['AGENT_HOST'] = host
+            os.environ['AGENT_PORT'] = str(port)
+            # Read by prometheus_client when each worker imports it
+            metrics_dir = prepare_metrics_dir()
+            try:
+                uvicorn.run(
+                    'server:create_app',
+                    factory=True,
+                    host=host,
+                    port=port,
+                    workers=workers
+                )
+            finally:
+                if metrics_dir is not None:
+                    shutil.rmtree(metrics_dir, ignore_errors=True)
+            return
 
-        server = A2AStarletteApplication(
-            agent_card=create_agent_card(host, port),
-            http_handler=request_handler
-        )
+        # The agent is only imported by the process serving it: the
+        # supervisor of the workers above never loads it
+        from server import create_app
 
         uvicorn.run(
-            server.build(),
+            create_app(host, port),
             host=host,
             port=port
         )
@@ -0,0 +1,184 @@
+"""
+Admission control for the agent executor.
+
+A burst of A2A requests would otherwise fan out into an unbounded number of
+concurrent LLM and MCP calls. The controller admits at most
+`AGENT_MAX_CONCURRENCY` runs at a time, parks the excess in a bounded
+priority queue and rejects requests straight away when the queue is full or
+when they waited longer than the queue-time budget.
+"""
+
+import asyncio
+import heapq
+import itertools
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+from config import settings
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request cannot be admitted."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+
+
+@dataclass
+class AdmissionStats:
+    """Counters of the admission controller."""
+
+    admitted: int = 0
+    queued: int = 0
+    rejected_queue_full: int = 0
+    rejected_timeout: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded, prioritized wait queue.
+
+    Waiting requests are served by priority class first and arrival order
+    second. A slot released by a finished run is handed over directly to
+    the next waiter, so late arrivals cannot overtake the queue.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        max_queue: int | None = None,
+        queue_timeout: float | None = None,
+        priorities: list[str] | None = None
+    ):
+        """
+        Initialize the controller.
+
+        Args:
+            max_concurrency (int | None): The number of runs admitted at a
+                time. `AGENT_MAX_CONCURRENCY` by default.
+            max_queue (int | None): The number of requests allowed to wait.
+                `AGENT_MAX_QUEUE` by default.
+            queue_timeout (float | None): Seconds a request may wait for a
+                slot. `AGENT_QUEUE_TIMEOUT` by default.
+            priorities (list[str] | None): The priority classes, from the
+                highest to the lowest (default `AGENT_PRIORITIES`).
+        """
+        if max_concurrency is None:
+            max_concurrency = settings.AGENT_MAX_CONCURRENCY
+        if max_queue is None:
+            max_queue = settings.AGENT_MAX_QUEUE
+        if queue_timeout is None:
+            queue_timeout = settings.AGENT_QUEUE_TIMEOUT
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.priorities = priorities or settings.AGENT_PRIORITIES
+        self.stats = AdmissionStats()
+        self._active = 0
+        self._queued = 0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def active(self) -> int:
+        """The number of runs currently admitted."""
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        """The number of requests waiting for a slot."""
+        return self._queued
+
+    def _get_rank(self, priority: str | None) -> int:
+        """
+        Map a priority class to its rank; unknown classes get the
+        middle rank.
+        """
+        if priority in self.priorities:
+            return self.priorities.index(priority)
+        return len(self.priorities) // 2
+
+    async def _acquire(self, priority: str | None) -> None:
+        """
+        Wait for a free slot.
+
+        Raises:
+            AdmissionRejectedError: If the queue is full or the
+                queue-time budget is exhausted.
+        """
+        if self._active < self.max_concurrency and self._queued == 0:
+            self._active += 1
+            return
+
+        if self._queued >= self.max_queue:
+            self.stats.rejected_queue_full += 1
+            raise AdmissionRejectedError("too many requests queued")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters,
+            (self._get_rank(priority), next(self._sequence), future)
+        )
+        self._queued += 1
+        self.stats.queued += 1
+        try:
+            done, _ = await asyncio.wait(
+                {future},
+                timeout=self.queue_timeout
+            )
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation
+                self._release()
+            else:
+                future.cancel()
+                self._queued -= 1
+            raise
+
+        if not done:
+            future.cancel()
+            self._queued -= 1
+            self.stats.rejected_timeout += 1
+            raise AdmissionRejectedError(
+                f"no capacity within {self.queue_timeout:g}s"
+            )
+
+    def _release(self) -> None:
+        """Hand the slot over to the next waiter, or free it."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Timed out or cancelled while waiting
+                continue
+            self._queued -= 1
+            future.set_result(None)
+            return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def admit(self, priority: str | None = None) -> AsyncIterator[None]:
+        """
+        Hold an execution slot for the duration of the context.
+
+        Args:
+            priority (str | None): The priority class of the request.
+
+        Raises:
+            AdmissionRejectedError: If the request cannot be admitted.
+        """
+        await self._acquire(priority)
+        self.stats.admitted += 1
+        try:
+            yield
+        finally:
+            self._release()
@@ -1,26 +1,101 @@
 import uuid
-from typing import Literal, AsyncIterable, Any
+from functools import cache
+from typing import Literal, AsyncIterable, Any, Iterable
 from langgraph.prebuilt import create_react_agent
 from langchain_core.runnables import RunnableConfig
-from langmem.short_term import SummarizationNode
-from langchain_core.messages.utils import count_tokens_approximately
-from memory_agent import MemoryCheckpointer, MemoryPersistence
-from langgraph.config import get_store
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
+from memory_agent import MemoryPersistence
 from log import logger, get_metadata
-from kgrag import kgrag
+from llm_clients import get_chat_model
 from config import settings
-from mcp_client import mcp_client
+from mcp_client import mcp_pool
 from langmem import create_manage_memory_tool, create_search_memory_tool
 from pydantic import BaseModel
-from kgrag_store import State
-
-summarize_node = SummarizationNode(
-    token_counter=count_tokens_approximately,
-    model=kgrag._get_model(),
-    max_tokens=384,
-    max_summary_tokens=128,
-    output_messages_key="llm_input_messages",
+from checkpointer import get_checkpointer
+from agent_graph import AgentGraphCache
+from session_locks import ThreadLocks
+from token_counter import (
+    IncrementalSummarizationNode,
+    IncrementalTokenCounter,
 )
+from background_summary import SummaryScheduler
+from semantic_cache import SemanticCache
+from response_cache import ResponseCache
+from tool_cache import ToolResultCache
+from memory_prompt import MemoryPrompt
+from embedding_cache import CachedEmbeddings, CachedTextEmbedding
+from metrics import MetricsCallbackHandler, span, timed, trace_request
+from langgraph.store.memory import InMemoryStore
+
+# Arguments of the MCP tools naming the data collection they work on
+COLLECTION_ARGUMENTS = ("collection_name", "collection")
+
+
+@cache
+def get_summarize_node() -> IncrementalSummarizationNode:
+    """
+    Build the summarization pre-model hook on first use, with the shared
+    chat model.
+
+    Summaries are computed in background after each turn (see
+    background_summary); the hook summarizes synchronously only when the
+    history not yet summarized would exceed the hard context limit.
+    Returns:
+        IncrementalSummarizationNode: The pre-model hook.
+    """
+    return IncrementalSummarizationNode(
+        token_counter=IncrementalTokenCounter(),
+        model=get_chat_model(),
+        max_tokens=settings.SUMMARY_MAX_TOKENS,
+        max_tokens_before_summary=settings.SUMMARY_HARD_LIMIT,
+        max_summary_tokens=settings.SUMMARY_MAX_SUMMARY_TOKENS,
+        output_messages_key="llm_input_messages",
+    )
+
+
+def get_host_persistence_config() -> dict[str, str | int]:
+    """
+    Get the Redis configuration of the persistence from the settings.
+
+    Returns:
+        dict[str, str | int]: The host, port, db and max connections.
+    """
+    return {
+        "host": settings.REDIS_HOST,
+        "port": settings.REDIS_PORT,
+        "db": settings.REDIS_DB,
+        "max_connections": settings.REDIS_MAX_CONNECTIONS
+    }
+
+
+class AgentMemoryPersistence(MemoryPersistence):
+    """
+    `MemoryPersistence` loading the sentence model of the vector store
+    once.
+
+    `get_embedding_model_vs` builds a new `TextEmbedding` on every call;
+    the model is kept in `model_embedding_vs`, so the one loaded by the
+    warm-up is reused by the vector stores of the process, and wrapped by
+    the embedding cache, so the repeated texts do not reach it.
+    """
+
+    def get_embedding_model_vs(self) -> Any:
+        if self.model_embedding_vs is None:
+            model = super().get_embedding_model_vs()
+            if model is not None:
+                model = CachedTextEmbedding(
+                    model,
+                    f"{self.model_embedding_vs_type}:"
+                    f"{self.model_embedding_vs_name}"
+                )
+            self.model_embedding_vs = model
+        return self.model_embedding_vs
 
 
 class ResponseFormat(BaseModel):
@@ -31,56 +106,443 @@ class ResponseFormat(BaseModel):
 
 
 class KGragAgent:
-    thread_id: str = str(uuid.uuid4())
+    thread_id: str | None = None
     SUPPORTED_CONTENT_TYPES: list[str] = ['text', 'text/plain']
     memory_store: MemoryPersistence
-    host_persistence_config: dict[str, str | int] = {
-        "host": settings.REDIS_HOST,
-        "port": settings.REDIS_PORT,
-        "db": settings.REDIS_DB
-    }
+    graph_cache: AgentGraphCache
+    thread_locks: ThreadLocks
+    semantic_cache: SemanticCache
+    response_cache: ResponseCache
+    tool_cache: ToolResultCache
+    memory_prompt: MemoryPrompt
+    summary_scheduler: SummaryScheduler
+    _host_persistence_config: dict[str, str | int] | None = None
 
     def __init__(self, **kwargs):
         """
         Initialize the KGragAgent with the given parameters.
         """
         self.thread_id = kwargs.get("thread_id", self.thread_id)
-        self.host_persistence_config = kwargs.get(
-            "host_persistence_config", self.host_persistence_config
+        self._host_persistence_config = kwargs.get(
+            "host_persistence_config"
         )
         self.memory_store = self._get_memory()
+        self.store = self._get_store()
+        self.memory_prompt = MemoryPrompt(self.store)
+        self.graph_cache = kwargs.get("graph_cache", AgentGraphCache())
+        # The wrapped tools and the catalog version they were built for
+        self._tools: tuple[str | None, list] | None = None
+        self.thread_locks = ThreadLocks()
+        self.summary_scheduler = SummaryScheduler(
+            get_summarize_node,
+            self.thread_locks,
+            max_tokens_before_summary=settings.SUMMARY_MAX_TOKENS
+        )
+        self.semantic_cache = kwargs.get(
+            "semantic_cache", SemanticCache(self.memory_store)
+        )
+        self.tool_cache = kwargs.get("tool_cache", ToolResultCache())
+        self.response_cache = kwargs.get(
+            "response_cache",
+            ResponseCache(
+                get_checkpointer(self.host_persistence_config).conn
+            )
+        )
+
+    @property
+    def host_persistence_config(self) -> dict[str, str | int]:
+        """
+        The Redis configuration of the persistence, the one given to the
+        agent or the one of the settings, read on first use.
+        """
+        if self._host_persistence_config is None:
+            self._host_persistence_config = get_host_persistence_config()
+        return self._host_persistence_config
 
-    def prompt(self, state):
-        """Prepare the messages for the LLM."""
-        # Get store from configured contextvar;
-        # Same as that provided to `create_react_agent`
-        store = get_store()
-        memories = store.search(
-            # Search within the same namespace as the one
-            # we've configured for the agent
-            ("memories",),
-            query=state["messages"][-1].content,
+    def _get_store(self) -> InMemoryStore:
+        """
+        Create the store of the long-term memories.
+
+        The embedding model of the memory persistence is wrapped by the
+        embedding cache, shared by the store and every other user of
+        `memory_store.model_embedding` (e.g. the semantic cache).
+        Returns:
+            InMemoryStore: The store indexed with the cached embeddings.
+        """
+        if self.memory_store.model_embedding is None:
+            return self.memory_store.get_in_memory_store()
+        embeddings = CachedEmbeddings(
+            self.memory_store.model_embedding,
+            settings.MODEL_EMBEDDING
+        )
+        self.memory_store.model_embedding = embeddings
+        return InMemoryStore(
+            index={
+                "embed": embeddings,
+                "dims": self.memory_store.collection_dim
+            }
         )
-        system_msg = f"""You are a helpful assistant.
 
-        ## Memories
-        <memories>
-        {memories}
-        </memories>
+    async def prompt(
+        self,
+        state: dict[str, Any],
+        config: RunnableConfig
+    ):
         """
-        return [{"role": "system", "content": system_msg}, *state["messages"]]
+        Prepare the messages for the LLM, injecting the long-term
+        memories relevant to the user request in the system prompt.
+        """
+        return await self.memory_prompt.prompt(state, config)
 
     async def _get_tools(self):
         """
         Get the tools available for the agent.
+
+        The wrapped tools are built once per tool-catalog version, the
+        version keying the compiled graph.
         """
-        tools = await mcp_client.get_tools()
+        mcp_tools = await mcp_pool.get_tools()
+        version = mcp_pool.tools_version
+        if self._tools is not None and self._tools[0] == version:
+            return self._tools[1]
+        tools = self.tool_cache.wrap_tools(mcp_tools)
         tools.extend([
-            create_manage_memory_tool(namespace=("memories",)),
+            self.memory_prompt.wrap_manage_tool(
+                create_manage_memory_tool(namespace=("memories",))
+            ),
             create_search_memory_tool(namespace=("memories",))
         ])
+        self._tools = (version, tools)
         return tools
 
+    @staticmethod
+    def _get_graph_key() -> tuple:
+        """
+        Get the key of the compiled graph: the model identity and the
+        version of the tool catalog.
+        """
+        return (
+            settings.LLM_MODEL_TYPE,
+            settings.LLM_MODEL_NAME,
+            settings.LLM_URL,
+            mcp_pool.tools_version
+        )
+
+    async def _get_agent(self, checkpointer):
+        """
+        Get the compiled ReAct agent bound to the given checkpointer.
+
+        The graph is compiled once per model and tool-catalog version and
+        reused by every request and thread. While the cached catalog is
+        valid, a compiled graph is served without loading the tools.
+        Args:
+            checkpointer (BaseCheckpointSaver): The checkpointer of the
+                current request.
+        Returns:
+            CompiledStateGraph: The agent graph ready to be invoked.
+        """
+        if mcp_pool.tools_fresh:
+            agent = self.graph_cache.lookup(
+                self._get_graph_key(),
+                checkpointer=checkpointer
+            )
+            if agent is not None:
+                return agent
+        with span("get_tools"):
+            tools = await self._get_tools()
+        with span("build_agent"):
+            return self.graph_cache.get(
+                self._get_graph_key(),
+                lambda: self._build_agent(tools),
+                checkpointer=checkpointer
+            )
+
+    def _build_agent(self, tools: list):
+        """
+        Compile the ReAct agent with the given tools.
+
+        The state schema is imported here with the knowledge graph store,
+        on the first compilation.
+        Args:
+            tools (list): The tools of the agent.
+        Returns:
+            CompiledStateGraph: The agent graph, without checkpointer.
+        """
+        from kgrag_store import State
+
+        return create_react_agent(
+            get_chat_model(),
+            tools=tools,
+            store=self.store,
+            prompt=self.prompt,
+            state_schema=State,
+            pre_model_hook=get_summarize_node()
+        )
+
+    def _get_stream_modes(self) -> list[str]:
+        """
+        Get the LangGraph stream modes used by `stream`.
+
+        Node updates drive the progress messages and the final answer;
+        with `AGENT_STREAM_MODE=messages` the LLM tokens are streamed too.
+        """
+        if settings.AGENT_STREAM_MODE == "messages":
+            return ["updates", "messages"]
+        return ["updates"]
+
+    @staticmethod
+    def _get_token(event: tuple[Any, dict[str, Any]]) -> str:
+        """
+        Extract the text of a token chunk generated by the agent node.
+
+        Chunks of other nodes (e.g. the summarization hook) and tool-call
+        chunks are ignored.
+        Args:
+            event (tuple): The (message chunk, metadata) pair streamed
+                with the `messages` mode.
+        Returns:
+            str: The text of the chunk, or an empty string.
+        """
+        message, metadata = event
+        if (
+            metadata.get("langgraph_node") != "agent"
+            or not isinstance(message, AIMessageChunk)
+            or message.tool_call_chunks
+        ):
+            return ""
+        content = message.content
+        if isinstance(content, list):
+            content = "".join(
+                block.get("text", "") if isinstance(block, dict)
+                else str(block)
+                for block in content
+            )
+        return content
+
+    @staticmethod
+    def _is_ingestion_tool(name: str | None) -> bool:
+        """Return True if the tool adds data to the knowledge base."""
+        return bool(name) and "ingest" in name.lower()
+
+    @staticmethod
+    def _get_tool_collection(args: dict[str, Any] | None) -> str:
+        """
+        Get the data collection named by the arguments of a tool call,
+        `COLLECTION_NAME` when they name none.
+        """
+        for name in COLLECTION_ARGUMENTS:
+            value = (args or {}).get(name)
+            if isinstance(value, str) and value:
+                return value
+        return settings.COLLECTION_NAME
+
+    @staticmethod
+    def _get_ingestion_calls(message: BaseMessage) -> dict[str, str]:
+        """
+        Get the ingestion tool calls requested by an agent message.
+
+        Returns:
+            dict[str, str]: The collection ingested by each call, by
+                tool call id.
+        """
+        return {
+            call["id"]: KGragAgent._get_tool_collection(call["args"])
+            for call in getattr(message, "tool_calls", None) or []
+            if KGragAgent._is_ingestion_tool(call["name"])
+        }
+
+    @staticmethod
+    def _is_cacheable(tools_used: set[str]) -> bool:
+        """
+        Return True if the answer of a turn can be served to other users.
+
+        Turns that ingested data or wrote to the memory of the agent have
+        side effects a cached answer would silently skip.
+        """
+        return not any(
+            KGragAgent._is_ingestion_tool(name) or name == "manage_memory"
+            for name in tools_used
+        )
+
+    @staticmethod
+    async def _get_history(
+        agent,
+        config: RunnableConfig
+    ) -> list[BaseMessage]:
+        """
+        Get the messages of the thread before the current turn.
+
+        Args:
+            agent (CompiledStateGraph): The agent graph of the request.
+            config (RunnableConfig): The configuration of the request.
+        Returns:
+            list[BaseMessage]: The history, empty on the first turn.
+        """
+        state = await agent.aget_state(config)
+        return list(state.values.get("messages", [])) if state else []
+
+    async def _get_cached_results(
+        self,
+        agent,
+        config: RunnableConfig,
+        prompt: str,
+        history: list[BaseMessage],
+        collection: str
+    ) -> list[dict[str, Any]] | None:
+        """
+        Look up the response of a prompt in the caches.
+
+        The exact-match cache is tried first and replays the recorded
+        results of the same prompt after the same history; the semantic
+        cache only provides the final answer, and
+        only on the first turn of a thread: a follow-up ("and the second
+        one?") is similar to many prompts of other conversations. On a
+        hit the turn is recorded in the thread, so that follow-up
+        questions see it in the conversation history.
+        Args:
+            agent (CompiledStateGraph): The agent graph of the request.
+            config (RunnableConfig): The configuration of the request.
+            prompt (str): The user prompt.
+            history (list[BaseMessage]): The messages of the thread
+                before the turn.
+            collection (str): The data collection the request queries.
+        Returns:
+            list[dict] | None: The results to yield, or None on a miss.
+        """
+        results = await self.response_cache.get(
+            ResponseCache.get_key(
+                prompt,
+                mcp_pool.tools_version,
+                history,
+                collection
+            )
+        )
+        if results is None:
+            if history:
+                return None
+            answer = await self.semantic_cache.lookup(prompt, collection)
+            if answer is None:
+                return None
+            results = [{
+                'is_task_complete': True,
+                'require_user_input': False,
+                'content': answer,
+            }]
+        await agent.aupdate_state(
+            config,
+            {
+                "messages": [
+                    HumanMessage(prompt),
+                    AIMessage(results[-1]['content'])
+                ]
+            },
+            as_node="agent"
+        )
+        return results
+
+    async def _store_results(
+        self,
+        prompt: str,
+        results: list[dict[str, Any]],
+        history: list[BaseMessage],
+        collection: str
+    ) -> None:
+        """
+        Store the response of a prompt in the caches.
+
+        Args:
+            prompt (str): The user prompt.
+            results (list[dict]): The results yielded for the prompt,
+                the last one being the final answer.
+            history (list[BaseMessage]): The messages of the thread
+                before the turn; the semantic cache only stores the
+                answers of first turns.
+            collection (str): The data collection the request queries.
+        """
+        await self.response_cache.set(
+            ResponseCache.get_key(
+                prompt,
+                mcp_pool.tools_version,
+                history,
+                collection
+            ),
+            results
+        )
+        if not history:
+            await self.semantic_cache.store(
+                prompt,
+                results[-1]['content'],
+                collection
+            )
+
+    async def _invalidate_caches(self, collections: Iterable[str]) -> None:
+        """
+        Drop the cached tool results and answers, computed on a knowledge
+        base that new data just changed.
+
+        Args:
+            collections (Iterable[str]): The data collections that
+                changed; only their answers are dropped from the
+                semantic cache.
+        """
+        self.tool_cache.clear()
+        await self.response_cache.clear()
+        for collection in collections:
+            await self.semantic_cache.invalidate(collection)
+
+    @staticmethod
+    def _get_tools_used(messages: list[BaseMessage]) -> set[str]:
+        """
+        Get the tools called in the last turn of a thread.
+
+        Args:
+            messages (list[BaseMessage]): The messages of the thread.
+        Returns:
+            set[str]: The names of the tools called after the last user
+                message.
+        """
+        tools_used: set[str] = set()
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, ToolMessage) and message.name:
+                tools_used.add(message.name)
+        return tools_used
+
+    @staticmethod
+    def _get_ingested_collections(messages: list[BaseMessage]) -> set[str]:
+        """
+        Get the data collections the last turn of a thread ingested into.
+
+        Args:
+            messages (list[BaseMessage]): The messages of the thread.
+        Returns:
+            set[str]: The collections of the ingestion tool calls after
+                the last user message.
+        """
+        collections: set[str] = set()
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            collections.update(
+                KGragAgent._get_ingestion_calls(message).values()
+            )
+        return collections
+
+    def _schedule_summary(self, thread_id: str) -> None:
+        """
+        Summarize the thread in background once the current turn ends.
+
+        Args:
+            thread_id (str): The thread of the current turn.
+        """
+        self.summary_scheduler.schedule(
+            thread_id,
+            lambda: self._get_agent(
+                get_checkpointer(self.host_persistence_config)
+            )
+        )
+
     def _get_memory(self):
         """
         Retrieves the memory persistence configuration and initializes
@@ -173,7 +635,7 @@ class KGragAgent:
                     "model_embedding_vs_type is 'local'"
                 )
             )
-        return MemoryPersistence(
+        return AgentMemoryPersistence(
             model_embeggind_type=settings.LLM_MODEL_TYPE,
             model_embedding_name=settings.MODEL_EMBEDDING,
             model_embedding_url=settings.LLM_EMBEDDING_URL,
@@ -199,7 +661,10 @@ class KGragAgent:
                 "configurable": {
                     "thread_id": thread_id,
                     "recursion_limit": settings.MAX_RECURSION_LIMIT,
-                }
+                },
+                # Times the LLM calls, the tool calls and the
+                # summarization hook of the run
+                "callbacks": [MetricsCallbackHandler()]
             }
 
         input_data = {"messages": [{"role": "user", "content": prompt}]}
@@ -230,66 +695,96 @@ class KGragAgent:
 
     async def invoke(
         self,
-        prompt: str
+        prompt: str,
+        thread_id: str | None = None,
+        collection: str | None = None
     ):
         """
         Asynchronously runs the agent with the given prompt.
 
         Args:
             prompt (str): The user input prompt to be processed by the agent.
-            tools (list): A list of tools available for the agent to use.
-            thread_id (str): A unique identifier for the thread,
-                used for tracking and logging.
+            thread_id (str | None): The identifier of the conversation
+                thread. Turns of the same thread run one at a time;
+                a new thread is started when it is not provided.
+            collection (str | None): The data collection the request
+                queries, scoping its cached answers. `COLLECTION_NAME` by
+                default.
         """
+        thread_id = thread_id or self.thread_id or str(uuid.uuid4())
+        collection = collection or settings.COLLECTION_NAME
+
+        with trace_request(thread_id):
+            async with self.thread_locks.hold(thread_id):
+                config, input_data = self._get_agent_params(
+                    prompt,
+                    thread_id
+                )
 
-        config, input_data = self._get_agent_params(
-            prompt,
-            self.thread_id
-        )
-
-        async with MemoryCheckpointer.from_conn_info(
-            host=str(self.host_persistence_config["host"]),
-            port=int(self.host_persistence_config["port"]),
-            db=int(self.host_persistence_config["db"])
-        ) as checkpointer:
-
-            await checkpointer.adelete_by_thread_id(self.thread_id)
-
-            agent = create_react_agent(
-                kgrag._get_model(),
-                prompt=prompt,
-                tools=await self._get_tools(),
-                store=self.memory_store.get_in_memory_store(),
-                state_schema=State,
-                pre_model_hook=summarize_node,
-                checkpointer=checkpointer
-            )
-
-            response_agent = await agent.ainvoke(
-                input=input_data,
-                config=config,
-                stream_mode="updates"
-            )
+                with span("checkpointer"):
+                    checkpointer = get_checkpointer(
+                        self.host_persistence_config
+                    )
+                agent = await self._get_agent(checkpointer)
+
+                with span("cache_lookup"):
+                    history = await self._get_history(agent, config)
+                    cached_results = await self._get_cached_results(
+                        agent,
+                        config,
+                        prompt,
+                        history,
+                        collection
+                    )
+                if cached_results is not None:
+                    self._schedule_summary(thread_id)
+                    return cached_results[-1]['content']
+
+                # The final state of the thread, with its messages
+                with span("agent_run"):
+                    response_agent = await agent.ainvoke(
+                        input=input_data,
+                        config=config
+                    )
+                self._schedule_summary(thread_id)
 
-            if (
-                "messages" in response_agent
-                and len(response_agent["messages"]) > 0
-            ):
-                event_messages = response_agent["messages"]
-                event_response = event_messages[-1].content
-                # If there are messages from the agent, return the last message
-                logger.info(
-                    (
-                        f">>> Response event from agent: "
-                        f"{event_response}"
-                    ),
-                    extra=get_metadata(thread_id=self.thread_id)
-                )
-                return event_response
+                if (
+                    "messages" in response_agent
+                    and len(response_agent["messages"]) > 0
+                ):
+                    event_messages = response_agent["messages"]
+                    event_response = event_messages[-1].content
+                    # If there are messages from the agent, return the
+                    # last message
+                    logger.info(
+                        ">>> Response event from agent: %s",
+                        event_response,
+                        extra=get_metadata(thread_id=thread_id)
+                    )
+                    tools_used = self._get_tools_used(event_messages)
+                    ingested = self._get_ingested_collections(
+                        event_messages
+                    )
+                    if ingested:
+                        await self._invalidate_caches(ingested)
+                    if event_response and self._is_cacheable(tools_used):
+                        await self._store_results(
+                            prompt,
+                            [{
+                                'is_task_complete': True,
+                                'require_user_input': False,
+                                'content': event_response,
+                            }],
+                            history,
+                            collection
+                        )
+                    return event_response
 
     async def stream(
         self,
-        prompt: str
+        prompt: str,
+        thread_id: str | None = None,
+        collection: str | None = None
     ) -> AsyncIterable[dict[str, Any]]:
         """
         Asynchronously streams response chunks from the agent based
@@ -297,10 +792,15 @@ class KGragAgent:
 
         Args:
             prompt (str): The user input prompt to be processed by the agent.
-            tools (list): A list of tools available for the agent to use.
-            thread_id (str): A unique identifier for the thread,
-                used for tracking and logging.
+            thread_id (str | None): The identifier of the conversation
+                thread. Turns of the same thread run one at a time;
+                a new thread is started when it is not provided.
+            collection (str | None): The data collection the request
+                queries, scoping its cached answers. `COLLECTION_NAME` by
+                default.
         """
+        thread_id = thread_id or self.thread_id or str(uuid.uuid4())
+        collection = collection or settings.COLLECTION_NAME
 
         result: dict = {
             'is_task_complete': False,
@@ -313,7 +813,7 @@ class KGragAgent:
 
         response_json: dict = {
             "jsonrpc": "2.0",
-            "id": self.thread_id,
+            "id": thread_id,
             "result": result,
             "error": {
                 "code": 500,
@@ -323,55 +823,90 @@ class KGragAgent:
 
         try:
 
-            config, input_data = self._get_agent_params(
-                prompt,
-                self.thread_id
-            )
-
-            async with MemoryCheckpointer.from_conn_info(
-                    host=str(self.host_persistence_config["host"]),
-                    port=int(self.host_persistence_config["port"]),
-                    db=int(self.host_persistence_config["db"])
-            ) as checkpointer:
-
-                # Delete checkpoints older than 15 minutes
-                # for the current thread
-                await checkpointer.adelete_by_thread_id(
-                    thread_id=self.thread_id,
-                    filter_minutes=15
-                )
-
-                agent = create_react_agent(
-                    kgrag._get_model(),
-                    prompt=prompt,
-                    tools=await self._get_tools(),
-                    store=self.memory_store.get_in_memory_store(),
-                    state_schema=State,
-                    pre_model_hook=summarize_node,
-                    checkpointer=checkpointer
+            async with self.thread_locks.hold(thread_id):
+                config, input_data = self._get_agent_params(
+                    prompt,
+                    thread_id
                 )
 
+                # Old checkpoints expire in Redis and are swept in
+                # background (see retention)
+                with span("checkpointer"):
+                    checkpointer = get_checkpointer(
+                        self.host_persistence_config
+                    )
+                agent = await self._get_agent(checkpointer)
+
+                with span("cache_lookup"):
+                    history = await self._get_history(agent, config)
+                    cached_results = await self._get_cached_results(
+                        agent,
+                        config,
+                        prompt,
+                        history,
+                        collection
+                    )
+                if cached_results is not None:
+                    logger.info(
+                        ">>> Response served from the cache",
+                        extra=get_metadata(thread_id=thread_id)
+                    )
+                    self._schedule_summary(thread_id)
+                    for cached_result in cached_results:
+                        response_json["error"] = {}
+                        response_json["result"] = dict(cached_result)
+                        yield response_json
+                    return
+
+                # Results yielded so far, replayed by the response cache
+                recorded: list[dict[str, Any]] = []
+                tools_used: set[str] = set()
+                # Collection of the pending ingestion calls, by call id
+                ingestion_calls: dict[str, str] = {}
+                final_result: dict[str, Any] | None = None
                 index: int = 1
-                async for event in agent.astream(
+                async for mode, event in timed("agent_run", agent.astream(
                     input=input_data,
                     config=config,
-                    stream_mode="updates"
-                ):
+                    stream_mode=self._get_stream_modes()
+                )):
+                    if mode == "messages":
+                        token = self._get_token(event)
+                        if token:
+                            response_json["error"] = {}
+                            response_json["result"] = {
+                                'is_task_complete': False,
+                                'require_user_input': False,
+                                'is_partial': True,
+                                'content': token,
+                            }
+                            recorded.append(response_json["result"])
+                            yield response_json
+                        continue
+
                     event_index: str = f"Event {index}"
+                    # Lazy arguments: the event is only rendered, and
+                    # truncated, when the record is kept
                     logger.debug(
-                        f">>> {event_index} received: {event}",
-                        extra=get_metadata(thread_id=self.thread_id)
+                        ">>> %s received: %s",
+                        event_index,
+                        event,
+                        extra=get_metadata(thread_id=thread_id)
                     )
                     event_item = None
 
                     if "agent" in event:
                         event_item = event["agent"]
+                        for message in event_item.get("messages", []):
+                            ingestion_calls.update(
+                                self._get_ingestion_calls(message)
+                            )
                         agent_process: str = (
                             f'{event_index} - Looking up the knowledge base...'
                         )
                         logger.debug(
                             agent_process,
-                            extra=get_metadata(thread_id=self.thread_id)
+                            extra=get_metadata(thread_id=thread_id)
                         )
                         response_json["error"] = {}
                         response_json["result"] = {
@@ -379,16 +914,31 @@ class KGragAgent:
                             'require_user_input': False,
                             'content': agent_process,
                         }
+                        recorded.append(response_json["result"])
                         yield response_json
 
                     elif "tools" in event:
                         event_item = event["tools"]
+                        for message in event_item.get("messages", []):
+                            tool_name = getattr(message, "name", None)
+                            if not tool_name:
+                                continue
+                            tools_used.add(tool_name)
+                            if self._is_ingestion_tool(tool_name):
+                                # New data: answers computed on the
+                                # collection are stale
+                                await self._invalidate_caches([
+                                    ingestion_calls.pop(
+                                        message.tool_call_id,
+                                        settings.COLLECTION_NAME
+                                    )
+                                ])
                         tool_process: str = (
                             f'{event_index} - Processing the knowledge base...'
                         )
                         logger.debug(
                             tool_process,
-                            extra=get_metadata(thread_id=self.thread_id)
+                            extra=get_metadata(thread_id=thread_id)
                         )
                         response_json["error"] = {}
                         response_json["result"] = {
@@ -396,6 +946,7 @@ class KGragAgent:
                             'require_user_input': False,
                             'content': tool_process,
                         }
+                        recorded.append(response_json["result"])
                         yield response_json
 
                     if event_item is not None:
@@ -403,20 +954,21 @@ class KGragAgent:
                             "messages" in event_item
                             and len(event_item["messages"]) > 0
                         ):
-                            event_messages = event_item["messages"]
-                            event_response = event_messages[-1].content
-                            # If there are messages from the agent, return
-                            # the last message
+                            last_message = event_item["messages"][-1]
+                            event_response = last_message.content
                             logger.info(
-                                (
-                                    f">>> Response event from agent: "
-                                    f"{event_response}"
-                                ),
-                                extra=get_metadata(thread_id=self.thread_id)
+                                ">>> Response event from agent: %s",
+                                event_response,
+                                extra=get_metadata(thread_id=thread_id)
                             )
+                            # The answer is the last agent message that
+                            # does not ask for more tool calls
                             if (
-                                event_response
-                                or (len(event_response) > 0)
+                                "agent" in event
+                                and not getattr(
+                                    last_message, "tool_calls", None
+                                )
+                                and event_response
                             ):
                                 response_json["error"] = {}
                                 response_json["result"] = {
@@ -424,9 +976,26 @@ class KGragAgent:
                                     'require_user_input': False,
                                     'content': event_response,
                                 }
-                                yield response_json
+                                recorded.append(response_json["result"])
+                                if self._is_cacheable(tools_used):
+                                    await self._store_results(
+                                        prompt,
+                                        recorded,
+                                        history,
+                                        collection
+                                    )
+                                final_result = response_json["result"]
                     index += 1
 
+                # The answer is yielded once the run ended: the consumer
+                # stops at the answer, and closing the graph stream any
+                # earlier drops the checkpoint of its last step
+                if final_result is not None:
+                    self._schedule_summary(thread_id)
+                    response_json["error"] = {}
+                    response_json["result"] = final_result
+                    yield response_json
+
         except Exception as e:
             # In caso di errore, restituisce un messaggio di errore
             response_json["result"] = {
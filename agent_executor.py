@@ -1,32 +1,56 @@
+import asyncio
+import time
+import uuid
+from contextlib import aclosing
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
 from a2a.server.tasks import TaskUpdater
 from a2a.types import (
     InvalidParamsError,
     Part,
+    Task,
+    TaskNotCancelableError,
+    TaskNotFoundError,
     TaskState,
     TextPart,
-    UnsupportedOperationError,
 )
 from a2a.utils import (
     new_agent_text_message,
     new_task,
 )
 from a2a.utils.errors import ServerError
+from redis.asyncio import Redis
 from agent import KGragAgent
+from admission import AdmissionController, AdmissionRejectedError
+from cancellation import TaskCancellations
+from metrics import REQUESTS, observe, trace_request
 from log import logger
 
+TERMINAL_STATES = {
+    TaskState.completed,
+    TaskState.canceled,
+    TaskState.failed,
+    TaskState.rejected,
+}
+
 
 class KGragAgentExecutor(AgentExecutor):
     """
     KGrag AgentExecutor Example.
     """
 
-    def __init__(self):
+    def __init__(self, redis: Redis | None = None):
         """
         Initializes the KGragAgentExecutor.
+
+        Args:
+            redis (Redis | None): The Redis client shared by the workers,
+                through which a cancellation reaches the worker running
+                the task; None for a single worker.
         """
         self.agent = KGragAgent()
+        self.cancellations = TaskCancellations(redis)
+        self.admission = AdmissionController()
 
     async def execute(
         self,
@@ -44,57 +68,189 @@ class KGragAgentExecutor(AgentExecutor):
             await event_queue.enqueue_event(task)
         updater = TaskUpdater(event_queue, task.id, task.context_id)
 
+        with trace_request(task.context_id):
+            await self._execute(context, query, task, updater)
+
+    async def _execute(
+        self,
+        context: RequestContext,
+        query: str,
+        task: Task,
+        updater: TaskUpdater
+    ) -> None:
+        """
+        Runs the agent for a task once admitted.
+        """
+        queued_at = time.perf_counter()
         try:
-            async for item in self.agent.stream(query):
-                result = item['result']
-                is_task_complete = result['is_task_complete']
-                require_user_input = result['require_user_input']
-                error = item['error']
+            async with self.admission.admit(self._get_priority(context)):
+                observe('admission', time.perf_counter() - queued_at)
+                # The run is spawned in the context of the request, so
+                # its spans join the request trace
+                run = asyncio.create_task(
+                    self._run_agent(
+                        query,
+                        task,
+                        updater,
+                        self._get_collection(context)
+                    )
+                )
+                self.cancellations.register(task.id, run)
                 try:
+                    succeeded = await run
+                    REQUESTS.labels(
+                        'completed' if succeeded else 'failed'
+                    ).inc()
+                except asyncio.CancelledError:
+                    REQUESTS.labels('canceled').inc()
+                    current = asyncio.current_task()
+                    if current is not None and current.cancelling():
+                        raise
+                    # Canceled through `cancel`, which reports the
+                    # final status
+                    logger.info(f'Task {task.id} canceled')
+                finally:
+                    self.cancellations.unregister(task.id)
+        except AdmissionRejectedError as e:
+            REQUESTS.labels('rejected').inc()
+            logger.warning(f'Task {task.id} rejected: {e.reason}')
+            await updater.reject(
+                new_agent_text_message(
+                    (
+                        'The agent is busy and cannot accept the request '
+                        f'({e.reason}). Please try again later.'
+                    ),
+                    task.context_id,
+                    task.id,
+                )
+            )
 
-                    if not is_task_complete and not require_user_input:
-                        await updater.update_status(
-                            TaskState.working,
-                            new_agent_text_message(
-                                result['content'],
-                                task.context_id,
-                                task.id,
-                            ),
+    @staticmethod
+    def _get_metadata(context: RequestContext, key: str) -> str | None:
+        """
+        Gets a value from the metadata of the A2A message, falling back
+        to the metadata of the request.
+        """
+        message_metadata = (
+            context.message.metadata
+            if context.message and context.message.metadata
+            else {}
+        )
+        value = message_metadata.get(key, context.metadata.get(key))
+        return str(value) if value is not None else None
+
+    def _get_priority(self, context: RequestContext) -> str | None:
+        """
+        Gets the priority class of the request from its metadata.
+        """
+        return self._get_metadata(context, 'priority')
+
+    def _get_collection(self, context: RequestContext) -> str | None:
+        """
+        Gets the data collection the request queries from its metadata;
+        None for `COLLECTION_NAME`.
+        """
+        return self._get_metadata(context, 'collection')
+
+    async def _run_agent(
+        self,
+        query: str,
+        task: Task,
+        updater: TaskUpdater,
+        collection: str | None = None
+    ) -> bool:
+        """
+        Runs the agent for a task and reports its progress.
+
+        Args:
+            query (str): The user input.
+            task (Task): The task.
+            updater (TaskUpdater): The updater of the task.
+            collection (str | None): The data collection the request
+                queries; None for `COLLECTION_NAME`.
+        Returns:
+            bool: False if the run failed.
+        """
+        artifact_id = str(uuid.uuid4())
+        streamed = False
+
+        try:
+            # One LangGraph thread per A2A conversation: turns of the same
+            # context are serialized by the agent, different contexts run
+            # in parallel. The stream is closed as soon as the loop exits,
+            # so the thread lock is released before the next turn arrives.
+            async with aclosing(
+                self.agent.stream(
+                    query,
+                    thread_id=task.context_id,
+                    collection=collection
+                )
+            ) as stream:
+                async for item in stream:
+                    result = item['result']
+                    is_task_complete = result['is_task_complete']
+                    require_user_input = result['require_user_input']
+                    error = item['error']
+                    try:
+
+                        if result.get('is_partial'):
+                            # LLM token: append it to the streamed artifact
+                            await updater.add_artifact(
+                                [Part(root=TextPart(text=result['content']))],
+                                artifact_id=artifact_id,
+                                name='conversion_result',
+                                append=streamed,
+                                last_chunk=False,
+                            )
+                            streamed = True
+                        elif not is_task_complete and not require_user_input:
+                            await updater.update_status(
+                                TaskState.working,
+                                new_agent_text_message(
+                                    result['content'],
+                                    task.context_id,
+                                    task.id,
+                                ),
+                            )
+                        elif require_user_input:
+                            await updater.update_status(
+                                TaskState.input_required,
+                                new_agent_text_message(
+                                    result['content'],
+                                    task.context_id,
+                                    task.id,
+                                ),
+                                final=True,
+                            )
+                            break
+                        else:
+                            # The final answer replaces the streamed chunks,
+                            # which may include text of intermediate LLM turns
+                            await updater.add_artifact(
+                                [Part(root=TextPart(text=result['content']))],
+                                artifact_id=artifact_id,
+                                name='conversion_result',
+                                append=False,
+                                last_chunk=True,
+                            )
+                            await updater.complete()
+                            break
+
+                    except Exception as e:
+                        logger.error(
+                            f'An error occurred while streaming the response: '
+                            f'{e}\n'
+                            f'{error}'
                         )
-                    elif require_user_input:
                         await updater.update_status(
-                            TaskState.input_required,
+                            TaskState.failed,
                             new_agent_text_message(
-                                result['content'],
+                                error,
                                 task.context_id,
                                 task.id,
-                            ),
-                            final=True,
+                            )
                         )
-                        break
-                    else:
-                        await updater.add_artifact(
-                            [Part(root=TextPart(text=result['content']))],
-                            name='conversion_result',
-                        )
-                        await updater.complete()
-                        break
-
-                except Exception as e:
-                    logger.error(
-                        f'An error occurred while streaming the response: '
-                        f'{e}\n'
-                        f'{error}'
-                    )
-                    await updater.update_status(
-                        TaskState.failed,
-                        new_agent_text_message(
-                            error,
-                            task.context_id,
-                            task.id,
-                        )
-                    )
-                    raise e
+                        raise e
         except Exception as e:
             logger.error(
                 f'An error occurred while executing the agent: {e}'
@@ -109,6 +265,8 @@ class KGragAgentExecutor(AgentExecutor):
                 final=True
             )
             await updater.complete()
+            return False
+        return True
 
     def _validate_request(
         self,
@@ -126,5 +284,25 @@ class KGragAgentExecutor(AgentExecutor):
     ) -> None:
         """
         Cancels the current task.
+
+        The running agent is cancelled cooperatively: the pending LLM and
+        MCP calls are aborted and their connections closed, while the
+        checkpoints of the thread are kept so the session can be resumed.
+        A run owned by another worker is cancelled by that worker.
         """
-        raise ServerError(error=UnsupportedOperationError())
+        task = context.current_task
+        if not task:
+            raise ServerError(error=TaskNotFoundError())
+        if task.status.state in TERMINAL_STATES:
+            raise ServerError(error=TaskNotCancelableError())
+
+        await self.cancellations.cancel(task.id)
+
+        updater = TaskUpdater(event_queue, task.id, task.context_id)
+        await updater.cancel(
+            new_agent_text_message(
+                'The task has been canceled.',
+                task.context_id,
+                task.id,
+            )
+        )
@@ -0,0 +1,175 @@
+"""
+Cache of compiled ReAct agent graphs.
+
+Building the agent with `create_react_agent` compiles a LangGraph state
+graph, binds the tools to the model and validates the result. None of this
+depends on the request, so compiled graphs are cached by model and
+tool-catalog version and only the per-request pieces (thread id and
+checkpointer) are applied on each call.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Sequence
+from langchain_core.tools import BaseTool
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.graph.state import CompiledStateGraph
+from log import logger
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters of a cache."""
+
+    hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Fraction of lookups served from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, int | float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hit_ratio, 4)
+        }
+
+
+def get_tools_version(tools: Sequence[BaseTool]) -> str:
+    """
+    Compute a stable version string for a tool catalog.
+
+    The version changes whenever a tool is added or removed, or its
+    description or argument schema changes.
+
+    Args:
+        tools (Sequence[BaseTool]): The tools bound to the agent.
+
+    Returns:
+        str: A short hexadecimal digest of the catalog.
+    """
+    catalog = []
+    for tool in sorted(tools, key=lambda t: t.name):
+        schema = tool.args_schema
+        if schema is not None and not isinstance(schema, dict):
+            schema = schema.model_json_schema()
+        catalog.append([tool.name, tool.description, schema])
+    payload = json.dumps(catalog, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class AgentGraphCache:
+    """
+    LRU cache of compiled agent graphs.
+
+    The cached graphs are compiled without a checkpointer; `get` returns a
+    shallow copy bound to the checkpointer of the current request, so the
+    same compiled graph can serve any number of threads concurrently.
+    """
+
+    def __init__(self, max_size: int = 8):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size (int): The maximum number of compiled graphs to keep.
+        """
+        self.max_size = max_size
+        self.stats = CacheStats()
+        self._graphs: OrderedDict[Hashable, CompiledStateGraph] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        key: Hashable,
+        builder: Callable[[], CompiledStateGraph],
+        checkpointer: BaseCheckpointSaver | None = None
+    ) -> CompiledStateGraph:
+        """
+        Return the compiled graph for `key`, building it on a miss.
+
+        Args:
+            key (Hashable): The cache key, typically the model identity
+                and the tool-catalog version.
+            builder (Callable): A function compiling the graph
+                without a checkpointer.
+            checkpointer (BaseCheckpointSaver | None): The checkpointer
+                to bind to the returned graph.
+
+        Returns:
+            CompiledStateGraph: The graph ready to be invoked.
+        """
+        with self._lock:
+            graph = self._lookup(key)
+            if graph is None:
+                self.stats.misses += 1
+                graph = builder()
+                self._graphs[key] = graph
+                while len(self._graphs) > self.max_size:
+                    self._graphs.popitem(last=False)
+                logger.info(
+                    f"Agent graph compiled for {key} "
+                    f"(cache stats: {self.stats.as_dict()})"
+                )
+
+        return self._bind(graph, checkpointer)
+
+    def lookup(
+        self,
+        key: Hashable,
+        checkpointer: BaseCheckpointSaver | None = None
+    ) -> CompiledStateGraph | None:
+        """
+        Return the compiled graph for `key` if it is cached.
+
+        Lets the caller skip the preparation of the builder (e.g. loading
+        and wrapping the tools) on a hit. Only hits are counted: a miss is
+        counted by the `get` that follows it.
+
+        Args:
+            key (Hashable): The cache key.
+            checkpointer (BaseCheckpointSaver | None): The checkpointer
+                to bind to the returned graph.
+
+        Returns:
+            CompiledStateGraph | None: The graph ready to be invoked, or
+                None if it is not cached.
+        """
+        with self._lock:
+            graph = self._lookup(key)
+        if graph is None:
+            return None
+        return self._bind(graph, checkpointer)
+
+    def _lookup(self, key: Hashable) -> CompiledStateGraph | None:
+        """Return a cached graph and count the hit; hold the lock."""
+        graph = self._graphs.get(key)
+        if graph is not None:
+            self._graphs.move_to_end(key)
+            self.stats.hits += 1
+        return graph
+
+    @staticmethod
+    def _bind(
+        graph: CompiledStateGraph,
+        checkpointer: BaseCheckpointSaver | None
+    ) -> CompiledStateGraph:
+        """Return a shallow copy of a graph bound to a checkpointer."""
+        if checkpointer is None:
+            return graph
+        update: dict[str, Any] = {"checkpointer": checkpointer}
+        return graph.copy(update)
+
+    def clear(self) -> None:
+        """Drop every cached graph."""
+        with self._lock:
+            self._graphs.clear()
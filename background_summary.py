@@ -0,0 +1,195 @@
+"""
+Background summarization of the conversation threads.
+
+The summarization pre-model hook used to call the LLM inside the ReAct
+loop as soon as the history went over the token limit, so the user paid a
+full extra generation before the real answer started. The summary is now
+computed after a turn completes, off the critical path, and written in the
+`context.running_summary` of the checkpointed thread state; the hook of
+the next turn picks it up and only sends the summary plus the newer
+messages to the model. The job holds the lock of the thread only to read
+its state and to apply the summary, which is dropped and computed again if
+a turn moved the thread in the meantime.
+
+The hook keeps summarizing synchronously, as a fallback, only when the
+history not yet summarized exceeds the hard context limit
+(`SUMMARY_HARD_LIMIT`).
+"""
+
+import asyncio
+from typing import Awaitable, Callable
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+from langgraph.types import StateSnapshot
+from langmem.short_term import asummarize_messages
+from session_locks import ThreadLocks
+from token_counter import IncrementalSummarizationNode
+from metrics import span
+from log import logger, get_metadata
+
+
+class SummaryScheduler:
+    """
+    Runs at most one pending summarization job per thread.
+    """
+
+    def __init__(
+        self,
+        get_summarize_node: Callable[[], IncrementalSummarizationNode],
+        thread_locks: ThreadLocks,
+        max_tokens_before_summary: int
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            get_summarize_node (Callable): Returns the pre-model hook,
+                whose model, token counter and prompts are reused; it is
+                only called by the first job.
+            thread_locks (ThreadLocks): The locks serializing the turns of
+                a thread; a job runs when the thread is idle.
+            max_tokens_before_summary (int): The tokens not yet summarized
+                that trigger a background summarization.
+        """
+        self.get_summarize_node = get_summarize_node
+        self.thread_locks = thread_locks
+        self.max_tokens_before_summary = max_tokens_before_summary
+        self._jobs: dict[str, asyncio.Task] = {}
+
+    def schedule(
+        self,
+        thread_id: str,
+        get_agent: Callable[[], Awaitable[CompiledStateGraph]]
+    ) -> None:
+        """
+        Schedule the summarization of a thread after the current turn.
+
+        Args:
+            thread_id (str): The thread to summarize.
+            get_agent (Callable): Returns the agent graph bound to the
+                checkpointer of the thread.
+        """
+        job = self._jobs.get(thread_id)
+        if job is not None and not job.done():
+            return
+        self._jobs[thread_id] = asyncio.create_task(
+            self._run(thread_id, get_agent),
+            name=f"summary-{thread_id}"
+        )
+
+    async def _run(
+        self,
+        thread_id: str,
+        get_agent: Callable[[], Awaitable[CompiledStateGraph]]
+    ) -> None:
+        """
+        Summarize a thread and store the summary in its state.
+
+        The thread lock is only held to read the state and to apply the
+        summary, so a turn starting meanwhile is not delayed by the LLM
+        call; a summary computed on a state the turn has since moved is
+        dropped and computed again on the new state.
+        """
+        node = self.get_summarize_node()
+        try:
+            while not await self._summarize(node, thread_id, get_agent):
+                logger.debug(
+                    "Thread moved during the background summarization: "
+                    "summarizing again",
+                    extra=get_metadata(thread_id=thread_id)
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(
+                f"Background summarization failed: {e}",
+                extra=get_metadata(thread_id=thread_id)
+            )
+        finally:
+            if self._jobs.get(thread_id) is asyncio.current_task():
+                del self._jobs[thread_id]
+
+    @staticmethod
+    def _get_checkpoint_id(snapshot: StateSnapshot) -> str | None:
+        """Get the id of the checkpoint of a state snapshot."""
+        return snapshot.config.get("configurable", {}).get("checkpoint_id")
+
+    async def _summarize(
+        self,
+        node: IncrementalSummarizationNode,
+        thread_id: str,
+        get_agent: Callable[[], Awaitable[CompiledStateGraph]]
+    ) -> bool:
+        """
+        Summarize the current state of a thread.
+
+        Returns:
+            bool: False if the thread moved before the summary could be
+                applied, True otherwise.
+        """
+        config: RunnableConfig = {"configurable": {"thread_id": thread_id}}
+        # Wait for the end of the turn that scheduled the job
+        async with self.thread_locks.hold(thread_id):
+            agent = await get_agent()
+            snapshot = await agent.aget_state(config)
+        messages = snapshot.values.get("messages", [])
+        context = snapshot.values.get("context") or {}
+        running_summary = context.get("running_summary")
+        if node.count_unsummarized(
+            messages,
+            running_summary
+        ) < self.max_tokens_before_summary:
+            return True
+
+        with span("background_summary"):
+            result = await asummarize_messages(
+                messages,
+                running_summary=running_summary,
+                model=node.model,
+                max_tokens=node.max_tokens,
+                max_tokens_before_summary=self.max_tokens_before_summary,
+                max_summary_tokens=node.max_summary_tokens,
+                token_counter=node.token_counter,
+                initial_summary_prompt=node.initial_summary_prompt,
+                existing_summary_prompt=node.existing_summary_prompt,
+                final_prompt=node.final_prompt,
+            )
+        if (
+            result.running_summary is None
+            or result.running_summary is running_summary
+        ):
+            return True
+
+        async with self.thread_locks.hold(thread_id):
+            current = await agent.aget_state(config)
+            if (
+                self._get_checkpoint_id(current)
+                != self._get_checkpoint_id(snapshot)
+            ):
+                return False
+            await agent.aupdate_state(
+                config,
+                {
+                    "context": {
+                        **context,
+                        "running_summary": result.running_summary
+                    }
+                },
+                as_node="agent"
+            )
+        logger.info(
+            "Thread summarized in background: "
+            f"{len(result.running_summary.summarized_message_ids)} "
+            "messages",
+            extra=get_metadata(thread_id=thread_id)
+        )
+        return True
+
+    async def close(self) -> None:
+        """Cancel the pending jobs."""
+        jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        if jobs:
+            await asyncio.gather(*jobs, return_exceptions=True)
+        self._jobs.clear()
@@ -0,0 +1,139 @@
+"""
+Benchmark of the checkpoint encodings.
+
+Simulates a thread whose checkpoint is written at every ReAct step, with
+large and partly repeated tool outputs, and compares the Redis bytes and
+the encode/decode time of every checkpoint with:
+
+- `JsonPlusSerializer`, the previous encoding;
+- `CompressedSerializer`, msgpack plus zstd;
+- `CompressedSerializer` with the large message bodies moved to the
+  deduplicated blobs (each distinct body counted once).
+
+Usage:
+    python benchmarks/bench_checkpoint_serde.py --steps 60
+"""
+
+import json
+import os
+import sys
+import time
+import uuid
+import click
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpoint_serde import (  # noqa: E402
+    CompressedSerializer,
+    MessageBlobStore,
+)
+
+# Tool outputs cycle among a few knowledge-graph payloads
+PAYLOADS = [
+    json.dumps({
+        "nodes": [
+            {"id": f"n{topic}-{i}", "label": "Risk",
+             "properties": {"name": f"risk {topic}-{i}",
+                            "description": "Exposure of the supply chain "
+                            f"to the counterparty {i} in region {topic}."}}
+            for i in range(60)
+        ],
+        "relationships": [
+            {"source": f"n{topic}-{i}", "target": f"n{topic}-{i + 1}",
+             "type": "RELATED_TO"}
+            for i in range(59)
+        ],
+    })
+    for topic in range(4)
+]
+
+
+def make_messages(step: int) -> list:
+    """Build the messages added to the thread at a ReAct step."""
+    call_id = str(uuid.uuid4())
+    return [
+        HumanMessage(f"Question {step} about the risk report",
+                     id=str(uuid.uuid4())),
+        AIMessage("", id=str(uuid.uuid4()), tool_calls=[{
+            "name": "query", "args": {"q": f"risks {step}"}, "id": call_id
+        }]),
+        ToolMessage(PAYLOADS[step % len(PAYLOADS)], id=str(uuid.uuid4()),
+                    tool_call_id=call_id),
+        AIMessage(f"Answer {step}: the main risks are ...",
+                  id=str(uuid.uuid4())),
+    ]
+
+
+def make_checkpoint(messages: list) -> dict:
+    """Build a checkpoint holding the history."""
+    return {
+        "v": 4,
+        "id": str(uuid.uuid4()),
+        "ts": "2025-01-01T00:00:00+00:00",
+        "channel_values": {"messages": list(messages)},
+        "channel_versions": {"messages": len(messages)},
+        "versions_seen": {},
+    }
+
+
+def run(serde, steps: int, blobs: MessageBlobStore | None = None) -> dict:
+    """Write and read back a checkpoint at every step."""
+    history: list = []
+    stored: dict[str, int] = {}
+    size = encode = decode = 0.0
+    for step in range(steps):
+        history.extend(make_messages(step))
+        checkpoint = make_checkpoint(history)
+
+        start = time.perf_counter()
+        if blobs is not None:
+            extracted: dict[str, str] = {}
+            checkpoint = blobs.extract_checkpoint(checkpoint, extracted)
+            for digest, body in extracted.items():
+                if digest not in stored:
+                    stored[digest] = len(serde.dumps_typed(body)[1])
+        type_, data = serde.dumps_typed(checkpoint)
+        encode += time.perf_counter() - start
+
+        start = time.perf_counter()
+        serde.loads_typed((type_, data))
+        decode += time.perf_counter() - start
+        size += len(data)
+    return {
+        "bytes": size + sum(stored.values()),
+        "encode": encode / steps * 1e6,
+        "decode": decode / steps * 1e6,
+    }
+
+
+@click.command()
+@click.option('--steps', default=60, help='Checkpoints written.')
+def main(steps: int):
+    """Print the size and the timings of every encoding."""
+    compressed = CompressedSerializer(enabled=True)
+    results = {
+        "jsonplus": run(JsonPlusSerializer(), steps),
+        "zstd": run(compressed, steps),
+        "zstd+blobs": run(
+            compressed,
+            steps,
+            MessageBlobStore(None, compressed, min_size=4096)
+        ),
+    }
+    baseline = results["jsonplus"]["bytes"]
+    print(
+        f"{'encoding':>12} {'total KiB':>12} {'ratio':>8} "
+        f"{'encode µs':>12} {'decode µs':>12}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:>12} {result['bytes'] / 1024:>12.1f} "
+            f"{result['bytes'] / baseline:>8.1%} "
+            f"{result['encode']:>12.1f} {result['decode']:>12.1f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Cold-start time of the agent.
+
+Imports each module in a fresh interpreter `--runs` times and prints the
+median time of the import and of the whole process, then the packages
+with the largest cumulative import time reported by
+`python -X importtime`. With `--budget`, the run exits with status 1
+when the median import of a module takes longer, so the check can guard
+the startup time in CI.
+
+Importing the modules must not connect to any service: the knowledge
+graph, the summarization model and the MCP client are built on first
+use.
+
+Usage:
+    python benchmarks/bench_cold_start.py --module agent --budget 3
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = (
+    "import time\n"
+    "start = time.perf_counter()\n"
+    "import {module}\n"
+    "print(time.perf_counter() - start)\n"
+)
+
+
+def run(module: str, importtime: bool = False) -> tuple[float, float, str]:
+    """
+    Import a module in a new interpreter.
+
+    Returns:
+        tuple: The seconds of the import, the seconds of the process and
+            the standard error (the `-X importtime` report).
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", SCRIPT.format(module=module)]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [ROOT, env.get("PYTHONPATH")])
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        command,
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    wall = time.perf_counter() - start
+    if result.returncode:
+        raise click.ClickException(
+            f"import {module} failed:\n{result.stderr[-2000:]}"
+        )
+    return float(result.stdout.strip().splitlines()[-1]), wall, result.stderr
+
+
+def slowest_packages(
+    report: str,
+    module: str,
+    top: int
+) -> list[tuple[str, float]]:
+    """
+    Return the packages with the largest cumulative import time in a
+    `-X importtime` report of a module.
+    """
+    packages: dict[str, float] = {}
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue
+        # The outermost import of a package has its largest cumulative
+        package = name.strip().split(".")[0]
+        seconds = int(cumulative) / 1e6
+        if package != module and seconds > packages.get(package, 0.0):
+            packages[package] = seconds
+    return sorted(packages.items(), key=lambda item: -item[1])[:top]
+
+
+@click.command()
+@click.option('--module', 'modules', multiple=True,
+              default=('config', 'agent', 'server'),
+              help='Module to import; repeat for more modules.')
+@click.option('--runs', default=5, help='Imports per module.')
+@click.option('--top', default=10, help='Slowest packages listed.')
+@click.option('--budget', type=float,
+              help='Maximum median seconds of an import.')
+def main(modules: tuple[str, ...], runs: int, top: int,
+         budget: float | None):
+    """Print the cold-start time of the modules."""
+    over_budget = []
+    print(f"{'module':>12} {'import s':>10} {'process s':>10}")
+    for module in modules:
+        samples = [run(module) for _ in range(runs)]
+        imported = statistics.median(sample[0] for sample in samples)
+        wall = statistics.median(sample[1] for sample in samples)
+        print(f"{module:>12} {imported:>10.3f} {wall:>10.3f}")
+        if budget is not None and imported > budget:
+            over_budget.append(module)
+
+    for module in modules:
+        print(f"\nSlowest imports of {module}:")
+        report = run(module, importtime=True)[2]
+        for name, seconds in slowest_packages(report, module, top):
+            print(f"{name:>40} {seconds:>8.3f}")
+
+    if over_budget:
+        print(f"\nOver the budget of {budget}s: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
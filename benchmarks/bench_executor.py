@@ -0,0 +1,318 @@
+"""
+Offline load test of the agent executor.
+
+Drives concurrent A2A tasks through `DefaultRequestHandler` and
+`KGragAgentExecutor`, the path of a `message/stream` request, with every
+external service replaced by a local stand-in (see `offline`):
+
+- the LLM by `ScriptedChatModel`, one `query` tool call and one answer
+  per turn, each call taking `--llm-delay` seconds;
+- the kgrag MCP server by `fake_mcp_server`, over SSE, each tool call
+  taking `--tool-delay` seconds;
+- Redis (checkpoints, tasks, caches) by an in-process fakeredis server;
+- Qdrant and the embedding model by deterministic embeddings.
+
+The response, semantic and tool caches are disabled unless `--cache` is
+given, so every task runs the whole ReAct loop. The report lists the
+p50/p95/p99 latency of a task, the time to its first event, the
+throughput and the peak RSS of the process; `--save-baseline` stores it
+and `--baseline` compares a run against it, exiting with status 1 when
+a measure is worse by more than `--tolerance`. The reference run, with
+the default parameters, is `benchmarks/baseline.json`.
+
+Usage:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_executor.py --tasks 200 --concurrency 16
+    python benchmarks/bench_executor.py --baseline benchmarks/baseline.json
+    python benchmarks/bench_executor.py \
+        --save-baseline benchmarks/baseline.json
+"""
+
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+import click
+import numpy as np
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from offline import (  # noqa: E402
+    OfflineMemory,
+    ScriptedChatModel,
+    get_free_port,
+    start_mcp_server,
+    start_redis,
+)
+
+# Measures where a lower value is better; the others (throughput) are
+# better when higher
+LOWER_IS_BETTER = (
+    "latency_p50",
+    "latency_p95",
+    "latency_p99",
+    "ttfe_p50",
+    "ttfe_p95",
+    "ttfe_p99",
+    "peak_rss_mb",
+)
+
+
+@dataclass
+class Sample:
+    """The measures of a task."""
+
+    latency: float
+    ttfe: float
+    state: str
+
+
+def configure(redis_port: int, mcp_port: int, cache: bool) -> None:
+    """
+    Point the settings of the agent to the stand-ins.
+
+    Must run before the modules of the agent are imported, since the
+    settings are read at import time.
+    """
+    os.environ.update({
+        "REDIS_HOST": "127.0.0.1",
+        "REDIS_PORT": str(redis_port),
+        "REDIS_DB": "0",
+        "MCP_SERVER_KGRAG": f"http://127.0.0.1:{mcp_port}/sse",
+        "TASK_STORE": "memory",
+        "EMBEDDING_CACHE_DISK_SIZE": "0",
+        "LOKI_URL": "",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    if not cache:
+        os.environ.update({
+            "RESPONSE_CACHE_ENABLED": "false",
+            "SEMANTIC_CACHE_ENABLED": "false",
+            "TOOL_CACHE_TTL": "0",
+        })
+
+
+def create_handler(llm_delay: float):
+    """
+    Build the A2A request handler of the agent, with the scripted model
+    and the offline memory.
+    """
+    from llm_clients import register_chat_model
+
+    register_chat_model(ScriptedChatModel(delay=llm_delay))
+
+    import agent
+    from a2a.server.request_handlers import DefaultRequestHandler
+    from a2a.server.tasks import InMemoryTaskStore
+    from agent_executor import KGragAgentExecutor
+
+    agent.KGragAgent._get_memory = lambda self: OfflineMemory()
+    return DefaultRequestHandler(
+        agent_executor=KGragAgentExecutor(),
+        task_store=InMemoryTaskStore()
+    )
+
+
+async def run_task(handler, index: int) -> Sample:
+    """Send a message to a new context and wait for its final event."""
+    from a2a.types import (
+        Message,
+        MessageSendParams,
+        Part,
+        Role,
+        Task,
+        TaskStatusUpdateEvent,
+        TextPart,
+    )
+
+    message = Message(
+        role=Role.user,
+        parts=[Part(root=TextPart(
+            text=f"What are the main risks of report {index}?"
+        ))],
+        message_id=uuid.uuid4().hex,
+        context_id=uuid.uuid4().hex
+    )
+    start = time.perf_counter()
+    ttfe = None
+    state = "unknown"
+    async for event in handler.on_message_send_stream(
+        MessageSendParams(message=message)
+    ):
+        if ttfe is None:
+            ttfe = time.perf_counter() - start
+        if isinstance(event, (Task, TaskStatusUpdateEvent)):
+            state = event.status.state.value
+    latency = time.perf_counter() - start
+    return Sample(latency, ttfe if ttfe is not None else latency, state)
+
+
+async def run_load(
+    handler,
+    tasks: int,
+    concurrency: int,
+    warmup: int
+) -> tuple[list[Sample], float]:
+    """
+    Run the tasks with at most `concurrency` in flight.
+
+    Returns:
+        tuple: The samples of the measured tasks and the wall time.
+    """
+    for index in range(warmup):
+        await run_task(handler, -1 - index)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(index: int) -> Sample:
+        async with semaphore:
+            return await run_task(handler, index)
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*[bounded(i) for i in range(tasks)])
+    return list(samples), time.perf_counter() - start
+
+
+def get_peak_rss_mb() -> float:
+    """Return the peak resident memory of the process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def summarize(samples: list[Sample], wall: float) -> dict[str, float]:
+    """Compute the measures of a run."""
+    latencies = np.array([sample.latency for sample in samples])
+    ttfes = np.array([sample.ttfe for sample in samples])
+    states: dict[str, int] = {}
+    for sample in samples:
+        states[sample.state] = states.get(sample.state, 0) + 1
+    report: dict[str, float] = {}
+    for name, values in (("latency", latencies), ("ttfe", ttfes)):
+        for q in (50, 95, 99):
+            report[f"{name}_p{q}"] = float(np.percentile(values, q))
+    report["throughput"] = len(samples) / wall
+    report["peak_rss_mb"] = get_peak_rss_mb()
+    report.update({f"tasks_{state}": n for state, n in states.items()})
+    return report
+
+
+def compare(
+    report: dict[str, float],
+    baseline: dict[str, float],
+    tolerance: float
+) -> list[str]:
+    """
+    Print the run next to the baseline.
+
+    Returns:
+        list[str]: The measures worse than the baseline by more than the
+            tolerance.
+    """
+    regressions = []
+    print(f"{'measure':>14} {'baseline':>12} {'run':>12} {'change':>9}")
+    for name, value in report.items():
+        base = baseline.get(name)
+        if name.startswith("tasks_") or not base:
+            continue
+        change = value / base - 1
+        worse = (
+            change > tolerance if name in LOWER_IS_BETTER
+            else change < -tolerance
+        )
+        if worse:
+            regressions.append(name)
+        print(
+            f"{name:>14} {base:>12.4f} {value:>12.4f} {change:>+9.1%}"
+            + ("  REGRESSION" if worse else "")
+        )
+    return regressions
+
+
+@click.command()
+@click.option('--tasks', default=100, help='Tasks measured.')
+@click.option('--concurrency', default=8, help='Tasks in flight.')
+@click.option('--warmup', default=3, help='Tasks run before measuring.')
+@click.option('--llm-delay', default=0.2, help='Seconds per LLM call.')
+@click.option('--tool-delay', default=0.05, help='Seconds per tool call.')
+@click.option('--nodes', default=40, help='Nodes per tool answer.')
+@click.option('--cache', is_flag=True, help='Keep the caches enabled.')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Baseline report to compare against.')
+@click.option('--save-baseline', type=click.Path(dir_okay=False),
+              help='Store the report as the new baseline.')
+@click.option('--tolerance', default=0.1,
+              help='Relative change allowed against the baseline.')
+def main(
+    tasks: int,
+    concurrency: int,
+    warmup: int,
+    llm_delay: float,
+    tool_delay: float,
+    nodes: int,
+    cache: bool,
+    baseline: str | None,
+    save_baseline: str | None,
+    tolerance: float
+):
+    """Run the load test and print its report."""
+    redis_port, mcp_port = get_free_port(), get_free_port()
+    redis = start_redis(redis_port)
+    mcp_server = start_mcp_server(mcp_port, tool_delay, nodes)
+    params = {
+        "tasks": tasks,
+        "concurrency": concurrency,
+        "llm_delay": llm_delay,
+        "tool_delay": tool_delay,
+        "nodes": nodes,
+        "cache": cache,
+    }
+    try:
+        configure(redis_port, mcp_port, cache)
+        handler = create_handler(llm_delay)
+
+        async def run() -> tuple[list[Sample], float]:
+            from checkpointer import close_checkpointers
+            from mcp_client import mcp_pool
+            try:
+                return await run_load(handler, tasks, concurrency, warmup)
+            finally:
+                await mcp_pool.close()
+                await close_checkpointers()
+
+        samples, wall = asyncio.run(run())
+    finally:
+        mcp_server.terminate()
+        mcp_server.wait()
+        redis.shutdown()
+
+    report = summarize(samples, wall)
+    print(json.dumps({"params": params, "report": report}, indent=2))
+
+    if save_baseline:
+        with open(save_baseline, "w") as f:
+            json.dump({"params": params, "report": report}, f, indent=2)
+        print(f"Baseline stored in {save_baseline}")
+
+    if baseline:
+        with open(baseline) as f:
+            stored = json.load(f)
+        if stored.get("params") != params:
+            print(
+                "Warning: the baseline was run with other parameters: "
+                f"{stored.get('params')}"
+            )
+        regressions = compare(report, stored["report"], tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
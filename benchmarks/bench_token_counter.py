@@ -0,0 +1,150 @@
+"""
+Benchmark of the summarization pre-model hook.
+
+Simulates a thread growing by one message per ReAct step and measures the
+time the hook spends on each step, through `SummarizationNode` and
+`asummarize_messages` as the agent runs it:
+
+- `approximate`: `SummarizationNode` with `count_tokens_approximately`
+  (the previous behaviour);
+- `counter`: `SummarizationNode` with `IncrementalTokenCounter`, still
+  walking the history message by message;
+- `incremental`: `IncrementalSummarizationNode`, the hook of the agent.
+
+The summarization threshold is above the length of the thread, so the
+model is never called and only the counting is measured; `--summary`
+starts the thread with a running summary covering its first half, as
+after a background summarization.
+
+Usage:
+    python benchmarks/bench_token_counter.py --messages 2000
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+import click
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langmem.short_term import RunningSummary, SummarizationNode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_counter import (  # noqa: E402
+    IncrementalSummarizationNode,
+    IncrementalTokenCounter,
+)
+
+TEXT = (
+    "The 2023 risk report lists liquidity, counterparty and operational "
+    "risks, with a focus on the exposure of the supply chain. "
+)
+# Never reached: the hook only counts
+THRESHOLD = 10 ** 9
+
+
+def make_message(step: int):
+    """Build the message added to the thread at a ReAct step."""
+    message_id = str(uuid.uuid4())
+    content = TEXT * (1 + step % 5)
+    match step % 3:
+        case 0:
+            return HumanMessage(content, id=message_id)
+        case 1:
+            return AIMessage(content, id=message_id)
+        case _:
+            return ToolMessage(
+                content,
+                id=message_id,
+                tool_call_id=message_id
+            )
+
+
+def make_node(kind: str) -> SummarizationNode:
+    """Build the hook of a variant."""
+    params = {
+        "model": FakeListChatModel(responses=["summary"]),
+        "max_tokens": THRESHOLD,
+        "max_tokens_before_summary": THRESHOLD,
+        "max_summary_tokens": 128,
+        "output_messages_key": "llm_input_messages",
+    }
+    match kind:
+        case "approximate":
+            return SummarizationNode(
+                token_counter=count_tokens_approximately,
+                **params
+            )
+        case "counter":
+            return SummarizationNode(
+                token_counter=IncrementalTokenCounter(),
+                **params
+            )
+    return IncrementalSummarizationNode(
+        token_counter=IncrementalTokenCounter(),
+        **params
+    )
+
+
+async def run(
+    kind: str,
+    messages: int,
+    checkpoints: list[int],
+    summary: bool
+) -> dict[int, float]:
+    """
+    Grow a thread and time the hook at every step.
+
+    Returns:
+        dict[int, float]: The mean per-step time (µs) over the steps up to
+            each checkpoint.
+    """
+    node = make_node(kind)
+    history = []
+    context = {}
+    elapsed = 0.0
+    results = {}
+    for step in range(1, messages + 1):
+        history.append(make_message(step))
+        if summary and step == messages // 2:
+            context = {"running_summary": RunningSummary(
+                summary="The user asked about the risk reports.",
+                summarized_message_ids={m.id for m in history},
+                last_summarized_message_id=history[-1].id
+            )}
+        start = time.perf_counter()
+        await node.ainvoke({"messages": history, "context": context})
+        elapsed += time.perf_counter() - start
+        if step in checkpoints:
+            results[step] = elapsed / step * 1e6
+    return results
+
+
+@click.command()
+@click.option('--messages', default=2000, help='Length of the thread.')
+@click.option('--summary', is_flag=True,
+              help='Summarize the first half of the thread.')
+def main(messages: int, summary: bool):
+    """Print the per-step cost of the hook for growing threads."""
+    checkpoints = sorted(
+        {n for n in (10, 100, 500, 1000, 2000, messages) if n <= messages}
+    )
+    kinds = ("approximate", "counter", "incremental")
+    results = {
+        kind: asyncio.run(run(kind, messages, checkpoints, summary))
+        for kind in kinds
+    }
+
+    print(f"{'messages':>10}" + "".join(f" {k + ' µs':>16}" for k in kinds))
+    for step in checkpoints:
+        print(
+            f"{step:>10}"
+            + "".join(f" {results[kind][step]:>16.1f}" for kind in kinds)
+        )
+
+
+if __name__ == '__main__':
+    main()
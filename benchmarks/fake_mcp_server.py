@@ -0,0 +1,82 @@
+"""
+Stand-in of the kgrag MCP server for the offline benchmarks.
+
+Serves canned `query` and `ingestion` tools over SSE, answering after a
+fixed delay with a knowledge-graph payload of a fixed size, so the tool
+calls of the agent cost the same on every run.
+
+Usage:
+    python benchmarks/fake_mcp_server.py --port 8765 --delay 0.05
+"""
+
+import asyncio
+import json
+import click
+from mcp.server.fastmcp import FastMCP
+
+
+def make_payload(query: str, nodes: int) -> str:
+    """Build the knowledge-graph answer of a query."""
+    return json.dumps({
+        "query": query,
+        "nodes": [
+            {"id": f"n{i}", "label": "Risk",
+             "properties": {"name": f"risk {i}",
+                            "description": "Exposure of the supply chain "
+                            f"to the counterparty {i}."}}
+            for i in range(nodes)
+        ],
+        "relationships": [
+            {"source": f"n{i}", "target": f"n{i + 1}",
+             "type": "RELATED_TO"}
+            for i in range(nodes - 1)
+        ],
+    })
+
+
+def create_server(
+    host: str,
+    port: int,
+    delay: float,
+    nodes: int
+) -> FastMCP:
+    """
+    Create the MCP server with the canned tools.
+
+    Args:
+        host (str): The host to listen on.
+        port (int): The port to listen on.
+        delay (float): The seconds each tool call takes.
+        nodes (int): The nodes of the knowledge-graph answers.
+    Returns:
+        FastMCP: The server.
+    """
+    server = FastMCP("kgrag", host=host, port=port, log_level="WARNING")
+
+    @server.tool()
+    async def query(query: str) -> str:
+        """Query the KGraph system with a specific query string."""
+        await asyncio.sleep(delay)
+        return make_payload(query, nodes)
+
+    @server.tool()
+    async def ingestion(path: str) -> str:
+        """Ingest the documents found at a path into the KGraph system."""
+        await asyncio.sleep(delay)
+        return json.dumps({"path": path, "status": "ingested"})
+
+    return server
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Host to listen on.')
+@click.option('--port', default=8765, help='Port to listen on.')
+@click.option('--delay', default=0.05, help='Seconds per tool call.')
+@click.option('--nodes', default=40, help='Nodes per query answer.')
+def main(host: str, port: int, delay: float, nodes: int):
+    """Serve the canned kgrag tools over SSE."""
+    create_server(host, port, delay, nodes).run(transport="sse")
+
+
+if __name__ == '__main__':
+    main()
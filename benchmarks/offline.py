@@ -0,0 +1,273 @@
+"""
+Stand-ins of the external services of the agent, for the offline
+benchmarks:
+
+- `ScriptedChatModel`, a chat model calling the `query` tool once per
+  turn and then answering, after a fixed delay per call;
+- `OfflineMemory`, the memory persistence with deterministic embeddings
+  and no Qdrant;
+- `start_redis`, an in-process Redis server (fakeredis);
+- `start_mcp_server`, the canned kgrag MCP server of `fake_mcp_server`
+  in a subprocess.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Iterator
+from fakeredis import TcpFakeServer
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import (
+    ChatGeneration,
+    ChatGenerationChunk,
+    ChatResult,
+)
+
+ANSWER = (
+    "The main risks of the 2023 report are liquidity, counterparty and "
+    "operational risks, with a focus on the exposure of the supply chain."
+)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model answering every turn with a scripted ReAct loop.
+
+    With tools bound, the first call of a turn asks for the `tool_name`
+    tool with the user request, and the call following the tool result
+    answers with `answer`. Without tools (e.g. the summarization) it
+    always answers. Every call takes `delay` seconds, spread over the
+    streamed chunks.
+    """
+
+    delay: float = 0.2
+    chunks: int = 20
+    tool_name: str = "query"
+    answer: str = ANSWER
+    tools_bound: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ScriptedChatModel":
+        return self.model_copy(update={"tools_bound": True})
+
+    def _reply(self, messages: list[BaseMessage]) -> AIMessage:
+        """Build the scripted reply to the messages of a turn."""
+        turn = 0
+        for i, message in enumerate(messages):
+            if isinstance(message, HumanMessage):
+                turn = i
+        answered = any(
+            isinstance(message, ToolMessage) for message in messages[turn:]
+        )
+        input_tokens = count_tokens_approximately(messages)
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": self.chunks,
+            "total_tokens": input_tokens + self.chunks,
+        }
+        if self.tools_bound and not answered:
+            return AIMessage(
+                "",
+                tool_calls=[{
+                    "name": self.tool_name,
+                    "args": {"query": str(messages[turn].content)},
+                    "id": f"call_{uuid.uuid4().hex}",
+                }],
+                usage_metadata=usage
+            )
+        return AIMessage(self.answer, usage_metadata=usage)
+
+    def _split(self, message: AIMessage) -> list[AIMessageChunk]:
+        """Split a reply in the chunks streamed by the model."""
+        if message.tool_calls or not message.content:
+            return [AIMessageChunk(
+                content=message.content,
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]),
+                     "id": call["id"], "index": i}
+                    for i, call in enumerate(message.tool_calls)
+                ],
+                usage_metadata=message.usage_metadata
+            )]
+        text = str(message.content)
+        size = max(1, -(-len(text) // self.chunks))
+        parts = [text[i:i + size] for i in range(0, len(text), size)]
+        return [
+            AIMessageChunk(
+                content=part,
+                usage_metadata=(
+                    message.usage_metadata if i == len(parts) - 1 else None
+                )
+            )
+            for i, part in enumerate(parts)
+        ]
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        time.sleep(self.delay)
+        return ChatResult(
+            generations=[ChatGeneration(message=self._reply(messages))]
+        )
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        await asyncio.sleep(self.delay)
+        return ChatResult(
+            generations=[ChatGeneration(message=self._reply(messages))]
+        )
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        chunks = self._split(self._reply(messages))
+        for chunk in chunks:
+            time.sleep(self.delay / len(chunks))
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager is not None:
+                run_manager.on_llm_new_token(
+                    str(chunk.content),
+                    chunk=generation
+                )
+            yield generation
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        chunks = self._split(self._reply(messages))
+        for chunk in chunks:
+            await asyncio.sleep(self.delay / len(chunks))
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager is not None:
+                await run_manager.on_llm_new_token(
+                    str(chunk.content),
+                    chunk=generation
+                )
+            yield generation
+
+
+class OfflineMemory:
+    """
+    Memory persistence of the agent with deterministic embeddings.
+
+    Only the embeddings are provided: the semantic cache, the only user
+    of the Qdrant client, is disabled by the benchmarks.
+    """
+
+    def __init__(self, size: int = 384):
+        self.collection_dim = size
+        self.model_embedding = DeterministicFakeEmbedding(size=size)
+
+
+def get_free_port() -> int:
+    """Return a free TCP port of the local host."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 20.0) -> None:
+    """
+    Wait until a local TCP port accepts connections.
+
+    Raises:
+        TimeoutError: If the port is still closed after `timeout`.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), 0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing is listening on port {port}")
+
+
+def start_redis(port: int) -> TcpFakeServer:
+    """
+    Start an in-process Redis server on a local port.
+
+    Args:
+        port (int): The port to listen on.
+    Returns:
+        TcpFakeServer: The server; call `shutdown` to stop it.
+    """
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(
+        target=server.serve_forever,
+        name="fake-redis",
+        daemon=True
+    ).start()
+    wait_for_port(port)
+    return server
+
+
+def start_mcp_server(
+    port: int,
+    delay: float,
+    nodes: int
+) -> subprocess.Popen:
+    """
+    Start the canned kgrag MCP server in a subprocess.
+
+    The server runs in its own process, so its CPU time and memory are
+    not counted in the measures of the agent.
+    Args:
+        port (int): The port to listen on.
+        delay (float): The seconds each tool call takes.
+        nodes (int): The nodes of the knowledge-graph answers.
+    Returns:
+        subprocess.Popen: The server process; terminate it when done.
+    """
+    process = subprocess.Popen([
+        sys.executable,
+        os.path.join(os.path.dirname(__file__), "fake_mcp_server.py"),
+        "--port", str(port),
+        "--delay", str(delay),
+        "--nodes", str(nodes),
+    ])
+    try:
+        wait_for_port(port)
+    except TimeoutError:
+        process.terminate()
+        raise
+    return process
@@ -0,0 +1,124 @@
+"""
+Cancellation of the agent runs across workers.
+
+The run of a task lives in the worker that executes it, while a
+`tasks/cancel` may be routed to any worker. `TaskCancellations` keeps the
+runs of the worker and, with Redis (`TASK_STORE=redis`), listens on the
+`kgrag:cancel` channel: the cancellation of a task that is not running
+in the worker is published there, and the worker owning the run cancels
+it.
+"""
+
+import asyncio
+from redis.asyncio import Redis
+from log import logger
+
+CANCEL_CHANNEL = "kgrag:cancel"
+
+
+class TaskCancellations:
+    """
+    Registry of the runs of a worker, cancelled locally or through the
+    Redis channel shared by the workers.
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        channel: str = CANCEL_CHANNEL,
+        retry_interval: float = 1.0
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            redis (Redis | None): The Redis client; None for a single
+                worker.
+            channel (str): The channel of the cancellations.
+            retry_interval (float): Seconds before subscribing again
+                when the connection to Redis breaks.
+        """
+        self.redis = redis
+        self.channel = channel
+        self.retry_interval = retry_interval
+        self._runs: dict[str, asyncio.Task] = {}
+        self._listener: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Listen to the cancellations of the other workers."""
+        if self.redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(
+                self._listen(),
+                name="task-cancellations"
+            )
+
+    def register(self, task_id: str, run: asyncio.Task) -> None:
+        """Record the run of a task started by the worker."""
+        self.start()
+        self._runs[task_id] = run
+
+    def unregister(self, task_id: str) -> None:
+        """Forget the run of a task once it ended."""
+        self._runs.pop(task_id, None)
+
+    async def cancel(self, task_id: str) -> None:
+        """
+        Cancel the run of a task, wherever it is running.
+
+        Args:
+            task_id (str): The task.
+        """
+        run = self._runs.pop(task_id, None)
+        if run is not None:
+            await self._cancel_run(task_id, run)
+        elif self.redis is not None:
+            await self.redis.publish(self.channel, task_id)
+
+    async def _cancel_run(self, task_id: str, run: asyncio.Task) -> None:
+        """Cancel a local run and wait for it to stop."""
+        if run.done():
+            return
+        run.cancel()
+        try:
+            await run
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(
+                f'An error occurred while canceling task {task_id}: {e}'
+            )
+
+    async def _listen(self) -> None:
+        """Cancel the local runs named on the channel."""
+        assert self.redis is not None
+        while True:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                async for message in pubsub.listen():
+                    task_id = message["data"]
+                    if isinstance(task_id, bytes):
+                        task_id = task_id.decode("utf-8")
+                    run = self._runs.pop(task_id, None)
+                    if run is not None:
+                        logger.info(
+                            f'Task {task_id} canceled by another worker'
+                        )
+                        await self._cancel_run(task_id, run)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    f'Cancellation channel unavailable, retrying in '
+                    f'{self.retry_interval}s: {e}'
+                )
+                await asyncio.sleep(self.retry_interval)
+            finally:
+                await pubsub.aclose()
+
+    async def close(self) -> None:
+        """Stop listening to the cancellations."""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
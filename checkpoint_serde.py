@@ -0,0 +1,613 @@
+"""
+Compact encoding of the Redis checkpoints.
+
+Every checkpoint written by `MemoryCheckpointer` holds the whole message
+history of its thread, large tool outputs of the knowledge-graph tools
+included, so the same bodies were written to Redis once per checkpoint.
+Two layers reduce the memory and the network I/O of the checkpoints:
+
+- `CompressedSerializer` wraps the msgpack encoding of `JsonPlusSerializer`
+  and compresses with zstd the payloads over
+  `CHECKPOINT_COMPRESSION_MIN_SIZE` bytes. The compressed payloads are
+  tagged with a `+zstd` type suffix, so the checkpoints written before are
+  still read as they are;
+- `CompactCheckpointer` moves the message bodies over
+  `CHECKPOINT_BLOB_MIN_SIZE` characters out of the checkpoints and of the
+  pending writes into content-addressed blobs, stored once and shared by
+  every checkpoint referencing them, and puts them back when the
+  checkpoints are read. Every write refreshes the expiration of its
+  blobs, which outlive the checkpoints referencing them (see
+  `get_blob_ttl`); a blob missing on read raises `MissingBlobError`
+  rather than serving a history with a hole in it.
+
+The existing checkpoints can be rewritten in the new format with
+`migrate_checkpoints.py`.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Optional, Sequence, Tuple
+from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from memory_agent.memory_redis import REDIS_KEY_SEPARATOR
+from redis.asyncio import Redis
+from retention import RetentionCheckpointer
+from config import settings
+from log import logger
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is a requirement
+    zstandard = None
+
+ZSTD_SUFFIX = "+zstd"
+# Key, in the `additional_kwargs` of a message, of its blob digest
+BLOB_REF = "kgrag_blob"
+BLOB_PREFIX = f"checkpoint_blob{REDIS_KEY_SEPARATOR}"
+# Seconds a blob outlives the checkpoints referencing it
+BLOB_TTL_MARGIN = 60
+
+
+class MissingBlobError(LookupError):
+    """A message body referenced by a checkpoint is not in Redis."""
+
+
+def get_blob_ttl(
+    ttl: int | None = None,
+    max_age: float | None = None,
+    sweep_interval: float | None = None
+) -> int:
+    """
+    Get the expiration of the blobs from the retention of the checkpoints.
+
+    A blob is refreshed by every checkpoint written with it, so it lives
+    longer than any of them: `ttl` when the checkpoints expire, otherwise
+    `max_age` plus the delay before the sweeper deletes them.
+    Args:
+        ttl (int | None): The expiration of the checkpoints (`0` for none).
+            `CHECKPOINT_TTL` by default.
+        max_age (float | None): The age at which the sweeper deletes them (`0`
+            for none). `CHECKPOINT_MAX_AGE` by default.
+        sweep_interval (float | None): Seconds between two sweeps.
+            `CHECKPOINT_SWEEP_INTERVAL` by default.
+    Returns:
+        int: The expiration of the blobs, `0` when the checkpoints are
+            never deleted by age.
+    """
+    if ttl is None:
+        ttl = settings.CHECKPOINT_TTL
+    if max_age is None:
+        max_age = settings.CHECKPOINT_MAX_AGE
+    if sweep_interval is None:
+        sweep_interval = settings.CHECKPOINT_SWEEP_INTERVAL
+    if ttl > 0:
+        return ttl + BLOB_TTL_MARGIN
+    if max_age > 0:
+        return int(max_age + max(0.0, sweep_interval)) + BLOB_TTL_MARGIN
+    return 0
+
+
+class CompressedSerializer(SerializerProtocol):
+    """
+    Serializer compressing the typed payloads of another serializer.
+    """
+
+    def __init__(
+        self,
+        serde: SerializerProtocol | None = None,
+        enabled: bool | None = None,
+        level: int | None = None,
+        min_size: int | None = None
+    ):
+        """
+        Initialize the serializer.
+
+        Args:
+            serde (SerializerProtocol | None): The wrapped serializer,
+                `JsonPlusSerializer` by default.
+            enabled (bool | None): Whether new payloads are compressed; the
+                compressed payloads are read anyway. `CHECKPOINT_COMPRESSION`
+                by default.
+            level (int | None): The zstd compression level.
+                `CHECKPOINT_COMPRESSION_LEVEL` by default.
+            min_size (int | None): The bytes under which a payload is stored
+                uncompressed. `CHECKPOINT_COMPRESSION_MIN_SIZE` by default.
+        """
+        if enabled is None:
+            enabled = settings.CHECKPOINT_COMPRESSION
+        if level is None:
+            level = settings.CHECKPOINT_COMPRESSION_LEVEL
+        if min_size is None:
+            min_size = settings.CHECKPOINT_COMPRESSION_MIN_SIZE
+        self.serde = serde or JsonPlusSerializer()
+        self.enabled = enabled and zstandard is not None
+        self.level = level
+        self.min_size = min_size
+        # zstd contexts must not be shared between threads
+        self._local = threading.local()
+        if enabled and zstandard is None:
+            logger.warning(
+                "zstandard is not installed: checkpoints are stored "
+                "uncompressed"
+            )
+
+    def _get_compressor(self) -> "zstandard.ZstdCompressor":
+        """Return the compressor of the current thread."""
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level)
+            self._local.compressor = compressor
+        return compressor
+
+    def _get_decompressor(self) -> "zstandard.ZstdDecompressor":
+        """Return the decompressor of the current thread."""
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor()
+            self._local.decompressor = decompressor
+        return decompressor
+
+    def dumps(self, obj: Any) -> bytes:
+        return self.serde.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return self.serde.loads(data)
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if not self.enabled or len(data) < self.min_size:
+            return type_, data
+        return (
+            f"{type_}{ZSTD_SUFFIX}",
+            self._get_compressor().compress(data)
+        )
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if type_.endswith(ZSTD_SUFFIX):
+            if zstandard is None:
+                raise RuntimeError(
+                    "zstandard is required to read compressed checkpoints"
+                )
+            type_ = type_[:-len(ZSTD_SUFFIX)]
+            data_ = self._get_decompressor().decompress(data_)
+        return self.serde.loads_typed((type_, data_))
+
+
+@dataclass
+class BlobStats:
+    """Counters of the message blob store."""
+
+    blobs_written: int = 0
+    blobs_reused: int = 0
+    blobs_read: int = 0
+    blobs_missing: int = 0
+    chars_deduplicated: int = 0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "blobs_written": self.blobs_written,
+            "blobs_reused": self.blobs_reused,
+            "blobs_read": self.blobs_read,
+            "blobs_missing": self.blobs_missing,
+            "chars_deduplicated": self.chars_deduplicated,
+        }
+
+
+def _map_messages(value: Any, fn) -> Any:
+    """Apply a function to a message or to the messages of a list."""
+    if isinstance(value, BaseMessage):
+        return fn(value)
+    if isinstance(value, list) and any(
+        isinstance(item, BaseMessage) for item in value
+    ):
+        return [
+            fn(item) if isinstance(item, BaseMessage) else item
+            for item in value
+        ]
+    return value
+
+
+class MessageBlobStore:
+    """
+    Content-addressed store of the large message bodies.
+
+    A body is stored once under the digest of its text, in a Redis hash
+    encoded with the checkpoint serializer; the message keeps only the
+    digest. Every checkpoint referencing a blob refreshes its expiration,
+    so with a `ttl` from `get_blob_ttl` a blob lives longer than the
+    checkpoints using it.
+    """
+
+    def __init__(
+        self,
+        conn: Redis,
+        serde: SerializerProtocol,
+        ttl: int | None = None,
+        min_size: int | None = None,
+        max_known: int = 4096
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            conn (Redis): The Redis client of the checkpointer.
+            serde (SerializerProtocol): The serializer of the blobs.
+            ttl (int | None): Seconds a blob is kept after its last
+                reference (`0` disables the expiration), `get_blob_ttl()`
+                by default.
+            min_size (int | None): The characters over which a body is moved to
+                a blob (`0` disables the store). `CHECKPOINT_BLOB_MIN_SIZE` by
+                default.
+            max_known (int): The digests remembered as already written,
+                whose bodies are not sent again.
+        """
+        if min_size is None:
+            min_size = settings.CHECKPOINT_BLOB_MIN_SIZE
+        self.conn = conn
+        self.serde = serde
+        self.ttl = get_blob_ttl() if ttl is None else ttl
+        self.min_size = min_size
+        self.max_known = max(1, max_known)
+        self.stats = BlobStats()
+        self._known: OrderedDict[str, float] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the bodies are moved to blobs."""
+        return self.min_size > 0
+
+    @staticmethod
+    def get_key(digest: str) -> str:
+        """Return the Redis key of a blob."""
+        return f"{BLOB_PREFIX}{digest}"
+
+    def extract(
+        self,
+        message: BaseMessage,
+        blobs: dict[str, str]
+    ) -> BaseMessage:
+        """
+        Replace the body of a large message with its digest.
+
+        Args:
+            message (BaseMessage): The message.
+            blobs (dict[str, str]): Collects the extracted bodies by
+                digest.
+        Returns:
+            BaseMessage: A copy of the message without its body, or the
+                message itself when it is small.
+        """
+        content = message.content
+        if not isinstance(content, str) or len(content) < self.min_size:
+            return message
+        digest = hashlib.blake2b(
+            content.encode("utf-8"),
+            digest_size=16
+        ).hexdigest()
+        blobs[digest] = content
+        return message.model_copy(update={
+            "content": "",
+            "additional_kwargs": {
+                **message.additional_kwargs,
+                BLOB_REF: digest
+            }
+        })
+
+    @staticmethod
+    def restore(
+        message: BaseMessage,
+        bodies: dict[str, str]
+    ) -> BaseMessage:
+        """
+        Put back the body of a message read from a checkpoint.
+
+        Args:
+            message (BaseMessage): The message.
+            bodies (dict[str, str]): The bodies by digest.
+        Returns:
+            BaseMessage: The message with its body.
+        Raises:
+            MissingBlobError: If the body is not among the bodies read.
+        """
+        digest = message.additional_kwargs.get(BLOB_REF)
+        if digest is None:
+            return message
+        if digest not in bodies:
+            raise MissingBlobError(
+                f"Body {digest} of message {message.id} is missing"
+            )
+        additional_kwargs = dict(message.additional_kwargs)
+        del additional_kwargs[BLOB_REF]
+        return message.model_copy(update={
+            "content": bodies[digest],
+            "additional_kwargs": additional_kwargs
+        })
+
+    async def write(self, blobs: dict[str, str]) -> None:
+        """
+        Store the blobs, sending only the bodies not written recently.
+
+        Args:
+            blobs (dict[str, str]): The bodies by digest.
+        """
+        if not blobs:
+            return
+        now = time.monotonic()
+        known = [
+            digest for digest in blobs
+            if self._known.get(digest, 0.0) > now
+        ]
+        if known:
+            # Refresh the expiration; a blob evicted meanwhile is missing
+            async with self.conn.pipeline(transaction=False) as pipe:
+                for digest in known:
+                    if self.ttl > 0:
+                        pipe.expire(self.get_key(digest), self.ttl)
+                    else:
+                        pipe.exists(self.get_key(digest))
+                results = await pipe.execute()
+            known = [
+                digest for digest, found in zip(known, results) if found
+            ]
+        missing = [digest for digest in blobs if digest not in known]
+        if missing:
+            async with self.conn.pipeline(transaction=False) as pipe:
+                for digest in missing:
+                    type_, value = self.serde.dumps_typed(blobs[digest])
+                    key = self.get_key(digest)
+                    pipe.hset(key, mapping={"type": type_, "value": value})
+                    if self.ttl > 0:
+                        pipe.expire(key, self.ttl)
+                await pipe.execute()
+
+        self.stats.blobs_written += len(missing)
+        self.stats.blobs_reused += len(known)
+        self.stats.chars_deduplicated += sum(
+            len(blobs[digest]) for digest in known
+        )
+        # Bodies are sent again once half of their lifetime has passed
+        remembered_until = now + (self.ttl / 2 if self.ttl > 0 else 3600)
+        for digest in blobs:
+            self._known[digest] = remembered_until
+            self._known.move_to_end(digest)
+        while len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    async def read(self, digests: set[str]) -> dict[str, str]:
+        """
+        Read blobs in one round trip.
+
+        Args:
+            digests (set[str]): The digests of the blobs.
+        Returns:
+            dict[str, str]: The bodies found, by digest.
+        """
+        if not digests:
+            return {}
+        ordered = list(digests)
+        async with self.conn.pipeline(transaction=False) as pipe:
+            for digest in ordered:
+                pipe.hmget(self.get_key(digest), "type", "value")
+            results = await pipe.execute()
+        bodies = {}
+        for digest, (type_, value) in zip(ordered, results):
+            if type_ is None or value is None:
+                continue
+            if isinstance(type_, bytes):
+                type_ = type_.decode()
+            bodies[digest] = self.serde.loads_typed((type_, value))
+        self.stats.blobs_read += len(bodies)
+        self.stats.blobs_missing += len(ordered) - len(bodies)
+        if len(bodies) < len(ordered):
+            logger.error(
+                f"{len(ordered) - len(bodies)} checkpoint blobs missing"
+            )
+        return bodies
+
+    def extract_checkpoint(
+        self,
+        checkpoint: Checkpoint,
+        blobs: dict[str, str]
+    ) -> Checkpoint:
+        """
+        Return a copy of a checkpoint without the large message bodies.
+
+        Args:
+            checkpoint (Checkpoint): The checkpoint, left untouched.
+            blobs (dict[str, str]): Collects the extracted bodies.
+        Returns:
+            Checkpoint: The checkpoint to serialize.
+        """
+        return {
+            **checkpoint,
+            "channel_values": {
+                channel: _map_messages(
+                    value,
+                    lambda message: self.extract(message, blobs)
+                )
+                for channel, value in checkpoint["channel_values"].items()
+            }
+        }
+
+    def extract_writes(
+        self,
+        writes: Sequence[Tuple[str, Any]],
+        blobs: dict[str, str]
+    ) -> list[Tuple[str, Any]]:
+        """
+        Return the pending writes without the large message bodies.
+
+        Args:
+            writes (Sequence[Tuple[str, Any]]): The (channel, value)
+                writes.
+            blobs (dict[str, str]): Collects the extracted bodies.
+        Returns:
+            list[Tuple[str, Any]]: The writes to serialize.
+        """
+        return [
+            (
+                channel,
+                _map_messages(
+                    value,
+                    lambda message: self.extract(message, blobs)
+                )
+            )
+            for channel, value in writes
+        ]
+
+    async def restore_tuple(
+        self,
+        checkpoint_tuple: Optional[CheckpointTuple]
+    ) -> Optional[CheckpointTuple]:
+        """
+        Put back the message bodies of a checkpoint and of its writes.
+
+        Args:
+            checkpoint_tuple (CheckpointTuple | None): The tuple read.
+        Returns:
+            CheckpointTuple | None: The tuple with the bodies.
+        """
+        if checkpoint_tuple is None:
+            return None
+        checkpoint = checkpoint_tuple.checkpoint
+        pending_writes = checkpoint_tuple.pending_writes or []
+
+        digests: set[str] = set()
+
+        def collect(message: BaseMessage) -> BaseMessage:
+            digest = message.additional_kwargs.get(BLOB_REF)
+            if digest is not None:
+                digests.add(digest)
+            return message
+
+        for value in checkpoint["channel_values"].values():
+            _map_messages(value, collect)
+        for _, _, value in pending_writes:
+            _map_messages(value, collect)
+        if not digests:
+            return checkpoint_tuple
+
+        bodies = await self.read(digests)
+
+        def restore(message: BaseMessage) -> BaseMessage:
+            return self.restore(message, bodies)
+
+        checkpoint["channel_values"] = {
+            channel: _map_messages(value, restore)
+            for channel, value in checkpoint["channel_values"].items()
+        }
+        return checkpoint_tuple._replace(
+            pending_writes=[
+                (task_id, channel, _map_messages(value, restore))
+                for task_id, channel, value in pending_writes
+            ] if checkpoint_tuple.pending_writes is not None else None
+        )
+
+
+class CompactCheckpointer(RetentionCheckpointer):
+    """
+    `RetentionCheckpointer` storing compressed checkpoints and the large
+    message bodies once.
+    """
+
+    def __init__(
+        self,
+        conn: Redis,
+        ttl: int | None = None,
+        blob_ttl: int | None = None,
+        blob_min_size: int | None = None
+    ):
+        """
+        Initialize the checkpointer.
+
+        Args:
+            conn (Redis): The Redis client.
+            ttl (int | None): Seconds a checkpoint is kept after being written
+                (`0` disables the expiration). `CHECKPOINT_TTL` by default.
+            blob_ttl (int | None): Seconds a blob is kept after its last
+                reference, `get_blob_ttl(ttl)` by default.
+            blob_min_size (int | None): The characters over which a message
+                body is stored as a blob (`0` disables the blobs).
+                `CHECKPOINT_BLOB_MIN_SIZE` by default.
+        """
+        if ttl is None:
+            ttl = settings.CHECKPOINT_TTL
+        if blob_min_size is None:
+            blob_min_size = settings.CHECKPOINT_BLOB_MIN_SIZE
+        super().__init__(conn, ttl)
+        self.serde = CompressedSerializer(self.serde)
+        self.blobs = MessageBlobStore(
+            conn,
+            self.serde,
+            ttl=get_blob_ttl(ttl) if blob_ttl is None else blob_ttl,
+            min_size=blob_min_size
+        )
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        if self.blobs.enabled:
+            blobs: dict[str, str] = {}
+            checkpoint = self.blobs.extract_checkpoint(checkpoint, blobs)
+            # The blobs are written before the checkpoint referencing them
+            await self.blobs.write(blobs)
+        return await super().aput(
+            config,
+            checkpoint,
+            metadata,
+            new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: Optional[str] = None,
+    ):
+        if self.blobs.enabled:
+            blobs: dict[str, str] = {}
+            writes = self.blobs.extract_writes(writes, blobs)
+            await self.blobs.write(blobs)
+        await super().aput_writes(config, writes, task_id, task_path)
+
+    async def aget_tuple(
+        self,
+        config: RunnableConfig
+    ) -> Optional[CheckpointTuple]:
+        return await self.blobs.restore_tuple(
+            await super().aget_tuple(config)
+        )
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncGenerator[CheckpointTuple, None]:
+        async for checkpoint_tuple in super().alist(
+            config,
+            filter=filter,
+            before=before,
+            limit=limit
+        ):
+            yield await self.blobs.restore_tuple(checkpoint_tuple)
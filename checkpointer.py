@@ -0,0 +1,170 @@
+"""
+Process-wide Redis checkpointer.
+
+Instead of opening a new Redis connection for every request through
+``MemoryCheckpointer.from_conn_info``, the agent shares one
+``MemoryCheckpointer`` per Redis database. Each checkpointer is backed by a
+bounded asyncio connection pool with health checks and automatic reconnects,
+writes its keys with an expiration, stores compressed checkpoints with
+the large message bodies deduplicated (see ``checkpoint_serde``), is swept
+in background by a ``CheckpointSweeper`` (see ``retention``) and is closed
+when the server shuts down.
+"""
+
+from redis.asyncio import BlockingConnectionPool, Redis
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from memory_agent import MemoryCheckpointer
+from checkpoint_serde import BLOB_PREFIX, CompactCheckpointer
+from retention import CheckpointSweeper
+from config import settings
+from log import logger
+
+PoolKey = tuple[str, int, int]
+
+_checkpointers: dict[PoolKey, MemoryCheckpointer] = {}
+_sweepers: dict[PoolKey, CheckpointSweeper] = {}
+
+
+def _get_pool_key(host_persistence_config: dict[str, str | int]) -> PoolKey:
+    """
+    Build the registry key for a Redis persistence configuration.
+
+    Args:
+        host_persistence_config (dict): The Redis configuration with
+            `host`, `port` and `db` keys.
+
+    Returns:
+        tuple: The (host, port, db) tuple identifying the pool.
+    """
+    return (
+        str(host_persistence_config["host"]),
+        int(host_persistence_config["port"]),
+        int(host_persistence_config["db"])
+    )
+
+
+def create_redis_client(
+    host_persistence_config: dict[str, str | int]
+) -> Redis:
+    """
+    Create an asyncio Redis client backed by a bounded connection pool.
+
+    The pool blocks callers for up to `REDIS_POOL_TIMEOUT` seconds when all
+    connections are in use, checks idle connections every
+    `REDIS_HEALTH_CHECK_INTERVAL` seconds and retries commands with
+    exponential backoff when the connection drops.
+
+    Args:
+        host_persistence_config (dict): The Redis configuration:
+            {
+                "host": "localhost",
+                "port": 6379,
+                "db": 0,
+                "max_connections": 20  # optional
+            }
+
+    Returns:
+        Redis: The Redis client owning its connection pool.
+    """
+    host, port, db = _get_pool_key(host_persistence_config)
+    max_connections = int(
+        host_persistence_config.get(
+            "max_connections",
+            settings.REDIS_MAX_CONNECTIONS
+        )
+    )
+    pool = BlockingConnectionPool(
+        host=host,
+        port=port,
+        db=db,
+        max_connections=max_connections,
+        timeout=settings.REDIS_POOL_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_keepalive=True,
+        retry=Retry(
+            ExponentialBackoff(cap=1.0, base=0.05),
+            retries=settings.REDIS_RETRIES
+        )
+    )
+    logger.info(
+        f"Redis pool created for {host}:{port}/{db} "
+        f"(max_connections={max_connections})"
+    )
+    return Redis.from_pool(pool)
+
+
+def get_checkpointer(
+    host_persistence_config: dict[str, str | int]
+) -> MemoryCheckpointer:
+    """
+    Return the shared checkpointer for the given Redis configuration,
+    creating it on first use.
+
+    Args:
+        host_persistence_config (dict): The Redis configuration with
+            `host`, `port` and `db` keys.
+
+    Returns:
+        MemoryCheckpointer: The long-lived checkpointer.
+    """
+    key = _get_pool_key(host_persistence_config)
+    checkpointer = _checkpointers.get(key)
+    if checkpointer is None:
+        checkpointer = CompactCheckpointer(
+            create_redis_client(host_persistence_config)
+        )
+        _checkpointers[key] = checkpointer
+        _sweepers[key] = CheckpointSweeper(
+            checkpointer.conn,
+            blob_prefix=BLOB_PREFIX,
+            blob_ttl=checkpointer.blobs.ttl
+        )
+    # The retention limits are enforced in background, from the first
+    # call made inside the event loop
+    _sweepers[key].start()
+    return checkpointer
+
+
+def get_sweep_stats() -> dict[str, dict[str, float]]:
+    """
+    Return the counters of the checkpoint sweepers.
+
+    Returns:
+        dict: The counters by "host:port/db".
+    """
+    return {
+        f"{key[0]}:{key[1]}/{key[2]}": sweeper.stats.as_dict()
+        for key, sweeper in _sweepers.items()
+    }
+
+
+def get_blob_stats() -> dict[str, dict[str, float]]:
+    """
+    Return the counters of the message blob stores.
+
+    Returns:
+        dict: The counters by "host:port/db".
+    """
+    return {
+        f"{key[0]}:{key[1]}/{key[2]}": checkpointer.blobs.stats.as_dict()
+        for key, checkpointer in _checkpointers.items()
+        if isinstance(checkpointer, CompactCheckpointer)
+    }
+
+
+async def close_checkpointers() -> None:
+    """
+    Close every shared checkpointer and disconnect its connection pool.
+    """
+    while _sweepers:
+        _, sweeper = _sweepers.popitem()
+        await sweeper.stop()
+    while _checkpointers:
+        key, checkpointer = _checkpointers.popitem()
+        try:
+            await checkpointer.conn.aclose()
+            logger.info(f"Redis pool closed for {key[0]}:{key[1]}/{key[2]}")
+        except Exception as e:
+            logger.error(f"Error closing Redis pool {key}: {e}")
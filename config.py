@@ -4,12 +4,19 @@ This module handles environment-specific configuration loading, parsing,
 and management
 for the application. It includes environment detection, .env file loading, and
 configuration value parsing.
+
+The settings are built on first use by `get_settings`, which loads the
+.env files, so importing the module reads, creates and logs nothing.
+`settings` stands for them and builds them on its first attribute access:
+the modules importing it read it in their functions, never at import
+time (their defaults are `None`, resolved when called).
 """
 
 import os
 from enum import Enum
+from functools import cache, cached_property
 from dotenv import load_dotenv
-from typing import Literal
+from typing import Any, Literal, cast
 from log import logger
 
 TypeStorage = Literal["s3", "local"]
@@ -79,7 +86,7 @@ def get_environment() -> Environment:
 def load_env_file():
     """Load environment-specific .env file."""
     env = get_environment()
-    print(f"Loading environment: {env}")
+    logger.debug(f"Loading environment: {env}")
     path_env = os.path.dirname(os.path.abspath(__file__))
 
     # Define env files in priority order
@@ -94,7 +101,7 @@ def load_env_file():
     for env_file in env_files:
         if os.path.exists(env_file):
             load_dotenv(dotenv_path=env_file)
-            print(f"Loaded environment from {env_file}")
+            logger.debug(f"Loaded environment from {env_file}")
             return env_file
 
     # Fall back to default if no env file found
@@ -105,17 +112,14 @@ def load_env_llm(model: str):
     """Load environment variables for LLM configuration."""
     env = get_environment()
     env_file_llm = f".env.{model}.{env.value}"
-    print(f"Loading LLM environment: {env_file_llm}")
+    logger.debug(f"Loading LLM environment: {env_file_llm}")
 
     # leggi la cartella corrente del file
     path_env = os.path.dirname(os.path.abspath(__file__))
     env_llm = os.path.join(path_env, env_file_llm)
     if os.path.exists(env_llm):
         load_dotenv(dotenv_path=env_llm)
-        print(f"Loaded LLM environment from {env_llm}")
-
-
-ENV_FILE = load_env_file()
+        logger.debug(f"Loaded LLM environment from {env_llm}")
 
 
 def get_path_ingestion(collection_name: str) -> str:
@@ -194,39 +198,120 @@ class Settings:
         self.OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", None)
         self.COLLECTION_NAME = os.getenv('COLLECTION_NAME', 'kgrag_data')
 
-        self.PATH_DOWNLOAD = get_path_ingestion(
-            f"{self.COLLECTION_NAME}"
-        )
-        logger.info(f"Path Download: {self.PATH_DOWNLOAD}")
-
         # Neo4j settings
         self.NEO4J_URL = os.getenv('NEO4J_URL', 'neo4j://localhost:7687')
         self.NEO4J_USERNAME = os.getenv('NEO4J_USERNAME', 'neo4j')
         self.NEO4J_PASSWORD = os.getenv('NEO4J_PASSWORD', 'neo4j')
         self.NEO4J_DB_NAME = os.getenv('NEO4J_DB_NAME', None)
-        logger.info(f"Neo4j URL: {self.NEO4J_URL}")
-        logger.info(f"Neo4j Username: {self.NEO4J_USERNAME}")
-        if self.NEO4J_DB_NAME:
-            logger.info(f"Neo4j DB Name: {self.NEO4J_DB_NAME}")
 
         # Redis settings
         self.REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
         self.REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
         self.REDIS_PORT = os.getenv("REDIS_PORT", 6379)
         self.REDIS_DB = os.getenv("REDIS_DB", 4)
-        logger.info(f"Redis URL: {self.REDIS_URL}")
-        logger.info(f"Redis Host: {self.REDIS_HOST}")
-        logger.info(f"Redis Port: {self.REDIS_PORT}")
-        logger.info(f"Redis DB: {self.REDIS_DB}")
+        self.REDIS_MAX_CONNECTIONS = int(
+            os.getenv("REDIS_MAX_CONNECTIONS", 20)
+        )
+        self.REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+        self.REDIS_SOCKET_TIMEOUT = float(
+            os.getenv("REDIS_SOCKET_TIMEOUT", 5)
+        )
+        self.REDIS_HEALTH_CHECK_INTERVAL = int(
+            os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30)
+        )
+        self.REDIS_RETRIES = int(os.getenv("REDIS_RETRIES", 3))
+        # Retention of the checkpoints
+        self.CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", 900))
+        self.CHECKPOINT_MAX_AGE = float(
+            os.getenv("CHECKPOINT_MAX_AGE", 86400)
+        )
+        self.CHECKPOINT_MAX_PER_THREAD = int(
+            os.getenv("CHECKPOINT_MAX_PER_THREAD", 100)
+        )
+        self.CHECKPOINT_SWEEP_INTERVAL = float(
+            os.getenv("CHECKPOINT_SWEEP_INTERVAL", 60)
+        )
+        # Encoding of the checkpoints
+        self.CHECKPOINT_COMPRESSION = os.getenv(
+            "CHECKPOINT_COMPRESSION",
+            "true"
+        ).lower() in ("1", "true", "yes")
+        self.CHECKPOINT_COMPRESSION_LEVEL = int(
+            os.getenv("CHECKPOINT_COMPRESSION_LEVEL", 3)
+        )
+        self.CHECKPOINT_COMPRESSION_MIN_SIZE = int(
+            os.getenv("CHECKPOINT_COMPRESSION_MIN_SIZE", 512)
+        )
+        self.CHECKPOINT_BLOB_MIN_SIZE = int(
+            os.getenv("CHECKPOINT_BLOB_MIN_SIZE", 4096)
+        )
+        # Stores of the A2A tasks and push notification configs
+        self.TASK_STORE = os.getenv("TASK_STORE", "redis").lower()
+        self.TASK_STORE_TTL = int(os.getenv("TASK_STORE_TTL", 86400))
+
+        # Delivery of the push notifications
+        self.PUSH_WORKERS = int(os.getenv("PUSH_WORKERS", 4))
+        self.PUSH_MAX_CONNECTIONS_PER_ENDPOINT = int(
+            os.getenv("PUSH_MAX_CONNECTIONS_PER_ENDPOINT", 4)
+        )
+        self.PUSH_QUEUE_SIZE = int(os.getenv("PUSH_QUEUE_SIZE", 1000))
+        self.PUSH_RETRIES = int(os.getenv("PUSH_RETRIES", 3))
+        self.PUSH_RETRY_BACKOFF = float(
+            os.getenv("PUSH_RETRY_BACKOFF", 0.5)
+        )
+        self.PUSH_TIMEOUT = float(os.getenv("PUSH_TIMEOUT", 10))
+
+        # Address published in the agent card, shared by the workers
+        self.AGENT_HOST = os.getenv("AGENT_HOST", "localhost")
+        self.AGENT_PORT = int(os.getenv("AGENT_PORT", 10000))
+        # Warm-up of the cold paths before the worker reports ready
+        self.WARMUP_ENABLED = os.getenv(
+            "WARMUP_ENABLED",
+            "true"
+        ).lower() in ("1", "true", "yes")
+        self.WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", 60))
+        self.WARMUP_RETRY_INTERVAL = float(
+            os.getenv("WARMUP_RETRY_INTERVAL", 5)
+        )
 
         self.QDRANT_URL = os.getenv('QDRANT_URL', 'http://localhost:6333')
-        logger.info(f"Qdrant URL: {self.QDRANT_URL}")
 
         self.LOKI_URL = os.getenv(
             'LOKI_URL',
             'http://localhost:3100/loki/api/v1/push'
         )
         self.MAX_RECURSION_LIMIT = os.getenv("MAX_RECURSION_LIMIT", 25)
+        # "messages" streams the LLM tokens to the A2A clients,
+        # "updates" only streams the progress of the agent nodes
+        self.AGENT_STREAM_MODE = os.getenv("AGENT_STREAM_MODE", "messages")
+        # Conversation summarization
+        self.SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", 384))
+        self.SUMMARY_MAX_SUMMARY_TOKENS = int(
+            os.getenv("SUMMARY_MAX_SUMMARY_TOKENS", 128)
+        )
+        self.SUMMARY_HARD_LIMIT = int(os.getenv("SUMMARY_HARD_LIMIT", 4096))
+        # Message token counts memoized by the summarization hook
+        self.TOKEN_COUNTER_CACHE_SIZE = int(
+            os.getenv("TOKEN_COUNTER_CACHE_SIZE", 65536)
+        )
+        # Long-term memories injected in the system prompt
+        self.MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", 5))
+        self.MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", 512))
+        self.MEMORY_CACHE_THREADS = int(
+            os.getenv("MEMORY_CACHE_THREADS", 1024)
+        )
+        # Admission control of the agent executor
+        self.AGENT_MAX_CONCURRENCY = int(
+            os.getenv("AGENT_MAX_CONCURRENCY", 8)
+        )
+        self.AGENT_MAX_QUEUE = int(os.getenv("AGENT_MAX_QUEUE", 32))
+        self.AGENT_QUEUE_TIMEOUT = float(
+            os.getenv("AGENT_QUEUE_TIMEOUT", 10)
+        )
+        self.AGENT_PRIORITIES = parse_list_from_env(
+            "AGENT_PRIORITIES",
+            ["high", "normal", "low"]
+        )
 
         self.LLM_MODEL_TYPE = os.getenv('LLM_MODEL_TYPE', 'openai')
         load_env_llm(self.LLM_MODEL_TYPE)
@@ -241,6 +326,32 @@ class Settings:
         )
         # LLM settings
         self.LLM_URL = os.getenv("LLM_URL", None)
+        # Replicas of the LLM: the calls are routed across them (see
+        # llm_router)
+        self.LLM_URLS = parse_list_from_env(
+            "LLM_URLS",
+            [self.LLM_URL] if self.LLM_URL else []
+        )
+        if self.LLM_URL is None and self.LLM_URLS:
+            self.LLM_URL = self.LLM_URLS[0]
+        self.LLM_FIRST_TOKEN_TIMEOUT = float(
+            os.getenv("LLM_FIRST_TOKEN_TIMEOUT", 30)
+        )
+        self.LLM_EWMA_DECAY = float(os.getenv("LLM_EWMA_DECAY", 0.3))
+        self.LLM_EJECT_FAILURES = int(os.getenv("LLM_EJECT_FAILURES", 3))
+        self.LLM_EJECT_SECONDS = float(os.getenv("LLM_EJECT_SECONDS", 30))
+        # Keep-alive connection pool shared by the chat models
+        self.LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 100))
+        self.LLM_MAX_KEEPALIVE_CONNECTIONS = int(
+            os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 20)
+        )
+        self.LLM_KEEPALIVE_EXPIRY = float(
+            os.getenv("LLM_KEEPALIVE_EXPIRY", 60)
+        )
+        self.LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))
+        self.LLM_CONNECT_TIMEOUT = float(
+            os.getenv("LLM_CONNECT_TIMEOUT", 10)
+        )
 
         self.VECTORDB_SENTENCE_MODEL = os.getenv(
             "VECTORDB_SENTENCE_MODEL",
@@ -256,10 +367,90 @@ class Settings:
             "MCP_SERVER_KGRAG",
             "http://localhost:8000/sse"
         )
+        self.MCP_POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", 2))
+        self.MCP_TOOLS_TTL = float(os.getenv("MCP_TOOLS_TTL", 300))
+        self.MCP_PING_INTERVAL = float(os.getenv("MCP_PING_INTERVAL", 30))
+        self.MCP_PING_TIMEOUT = float(os.getenv("MCP_PING_TIMEOUT", 5))
+
+        # Cache of the MCP tool results
+        self.TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", 512))
+        self.TOOL_CACHE_TTL = float(os.getenv("TOOL_CACHE_TTL", 300))
+        self.TOOL_CACHE_TTL_OVERRIDES = {
+            tool: float(ttl[0])
+            for tool, ttl in parse_dict_of_lists_from_env(
+                "TOOL_CACHE_TTL_"
+            ).items()
+        }
+
+        # Exact-match cache of the agent responses
+        self.RESPONSE_CACHE_ENABLED = os.getenv(
+            "RESPONSE_CACHE_ENABLED",
+            "true"
+        ).lower() in ("1", "true", "yes")
+        self.RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 256))
+        self.RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 600))
+
+        # Cache of the embeddings
+        self.EMBEDDING_CACHE_SIZE = int(
+            os.getenv("EMBEDDING_CACHE_SIZE", 4096)
+        )
+        self.EMBEDDING_CACHE_DISK_SIZE = int(
+            os.getenv("EMBEDDING_CACHE_DISK_SIZE", 20000)
+        )
+        self.EMBEDDING_CACHE_PATH = os.getenv(
+            "EMBEDDING_CACHE_PATH",
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "tmp",
+                "embedding_cache"
+            )
+        )
+
+        # Semantic cache of the agent answers
+        self.SEMANTIC_CACHE_ENABLED = os.getenv(
+            "SEMANTIC_CACHE_ENABLED",
+            "true"
+        ).lower() in ("1", "true", "yes")
+        self.SEMANTIC_CACHE_COLLECTION = os.getenv(
+            "SEMANTIC_CACHE_COLLECTION",
+            "kgrag_semantic_cache"
+        )
+        self.SEMANTIC_CACHE_THRESHOLD = float(
+            os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)
+        )
+        self.SEMANTIC_CACHE_TTL = float(
+            os.getenv("SEMANTIC_CACHE_TTL", 3600)
+        )
 
         # Apply environment-specific settings
         self.apply_environment_settings()
 
+    @cached_property
+    def PATH_DOWNLOAD(self) -> str:
+        """
+        The folder of the downloaded files, created on first use.
+        """
+        path = get_path_ingestion(f"{self.COLLECTION_NAME}")
+        logger.info(f"Path Download: {path}")
+        return path
+
+    def log_settings(self):
+        """
+        Log the addresses of the services used by the agent.
+
+        Called once by the server at startup, so importing the settings
+        (e.g. from a CLI or a benchmark) writes nothing.
+        """
+        logger.info(f"Neo4j URL: {self.NEO4J_URL}")
+        logger.info(f"Neo4j Username: {self.NEO4J_USERNAME}")
+        if self.NEO4J_DB_NAME:
+            logger.info(f"Neo4j DB Name: {self.NEO4J_DB_NAME}")
+        logger.info(f"Redis URL: {self.REDIS_URL}")
+        logger.info(f"Redis Host: {self.REDIS_HOST}")
+        logger.info(f"Redis Port: {self.REDIS_PORT}")
+        logger.info(f"Redis DB: {self.REDIS_DB}")
+        logger.info(f"Qdrant URL: {self.QDRANT_URL}")
+
     def apply_environment_settings(self):
         """
         Apply environment-specific settings based
@@ -297,5 +488,26 @@ class Settings:
                 setattr(self, key, value)
 
 
-# Create settings instance
-settings = Settings()
+@cache
+def get_settings() -> Settings:
+    """
+    Load the .env files and build the settings of the process, once.
+
+    Returns:
+        Settings: The settings.
+    """
+    load_env_file()
+    return Settings()
+
+
+class _LazySettings:
+    """The settings of the process, built on first attribute access."""
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(get_settings(), name, value)
+
+
+settings = cast(Settings, _LazySettings())
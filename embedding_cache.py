@@ -0,0 +1,525 @@
+"""
+Content-addressed cache of the embeddings.
+
+The same texts are embedded over and over: user prompts for the memory
+search and the semantic cache, memory records on write, repeated
+questions. `CachedEmbeddings` wraps the embedding model of the agent, and
+`CachedTextEmbedding` the local sentence model of the vector store
+(`VECTORDB_SENTENCE_MODEL`); both key every vector by the hash of the
+model name and the text:
+
+- an in-memory LRU answers the hot texts;
+- a compact on-disk tier, a memory-mapped float32 matrix with a parallel
+  matrix of digests used as ring buffer, keeps the vectors across
+  restarts and beyond the LRU size, and is shared by the workers.
+
+Only the texts missing from both tiers reach the embedding model. On the
+event loop, the lookups and writes touching the disk tier (file lock,
+memmap pages) run in a worker thread.
+"""
+
+import asyncio
+import atexit
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import IO, Any, Callable, Iterable, Iterator, TypeVar
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config import settings
+from log import logger
+
+DIGEST_SIZE = 16
+
+T = TypeVar("T")
+
+
+@dataclass
+class EmbeddingCacheStats:
+    """Counters of the embedding cache."""
+
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """The fraction of texts not sent to the embedding model."""
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class EmbeddingDiskCache:
+    """
+    Fixed-size on-disk store of embeddings, shared by the workers.
+
+    Vectors live in a `capacity x dim` float32 memmap and their digests in
+    a `capacity x 16` uint8 memmap; slots are reused in ring order once the
+    store is full, the ring position being kept in a third memmap. The
+    server workers map the same files: writers serialize on a file lock,
+    so that two workers never pick the same slot, and readers check the
+    digest of a slot, which another worker may have overwritten, before
+    and after copying its vector. The digest index of each worker is
+    rebuilt from the digests file when the cache is opened.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        """
+        Initialize the store; files are created with the first vector.
+
+        Args:
+            path (str): The directory of the cache files.
+            capacity (int): The number of vectors kept.
+        """
+        self.path = path
+        self.capacity = capacity
+        self.dim: int | None = None
+        self._vectors: np.memmap | None = None
+        self._digests: np.memmap | None = None
+        self._ring: np.memmap | None = None
+        self._index: dict[bytes, int] = {}
+        # Reverse of the index, keeping it within `capacity` entries
+        self._slots: dict[int, bytes] = {}
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock_file: IO[str] | None = None
+        if os.path.exists(self._meta_path):
+            self._open()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the file lock of the cache, shared by the processes."""
+        if self._lock_file is None:
+            os.makedirs(self.path, exist_ok=True)
+            self._lock_file = open(os.path.join(self.path, "lock"), "a")
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open(self, dim: int | None = None) -> None:
+        """Open, or create with the given dimension, the cache files."""
+        with self._locked():
+            meta = {}
+            if os.path.exists(self._meta_path):
+                with open(self._meta_path) as f:
+                    meta = json.load(f)
+                if meta.get("capacity") != self.capacity or (
+                    dim is not None and meta.get("dim") != dim
+                ):
+                    logger.info(
+                        f"Embedding cache at {self.path} reset "
+                        f"(layout changed: {meta})"
+                    )
+                    meta = {}
+
+            mode = "r+" if meta else "w+"
+            self.dim = int(meta.get("dim", dim or 0))
+            if not self.dim:
+                return
+            self._vectors = np.memmap(
+                os.path.join(self.path, "vectors.f32"),
+                dtype=np.float32,
+                mode=mode,
+                shape=(self.capacity, self.dim)
+            )
+            self._digests = np.memmap(
+                os.path.join(self.path, "digests.u8"),
+                dtype=np.uint8,
+                mode=mode,
+                shape=(self.capacity, DIGEST_SIZE)
+            )
+            ring_path = os.path.join(self.path, "ring.u64")
+            self._ring = np.memmap(
+                ring_path,
+                dtype=np.uint64,
+                mode="r+" if meta and os.path.exists(ring_path) else "w+",
+                shape=(1,)
+            )
+            if not meta:
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self.dim, "capacity": self.capacity}, f)
+        self._slots = {
+            int(slot): self._digests[slot].tobytes()
+            for slot in np.flatnonzero(self._digests.any(axis=1))
+        }
+        self._index = {digest: slot for slot, digest in self._slots.items()}
+        logger.info(
+            f"Embedding cache opened at {self.path}: "
+            f"{len(self._index)}/{self.capacity} vectors of dim {self.dim}"
+        )
+
+    def _holds(self, slot: int, digest: bytes) -> bool:
+        """Return True if a slot still holds the vector of a digest."""
+        assert self._digests is not None
+        return self._digests[slot].tobytes() == digest
+
+    def get(self, digest: bytes) -> np.ndarray | None:
+        """Return a copy of the vector of a digest, if stored."""
+        slot = self._index.get(digest)
+        if slot is None or self._vectors is None:
+            return None
+        if self._holds(slot, digest):
+            vector = np.array(self._vectors[slot])
+            if self._holds(slot, digest):
+                return vector
+        # Overwritten by another worker
+        self._forget(slot)
+        return None
+
+    def _forget(self, slot: int) -> None:
+        """Drop the digest a slot holds from the index."""
+        digest = self._slots.pop(slot, None)
+        if digest is not None:
+            del self._index[digest]
+
+    def put(self, digest: bytes, vector: np.ndarray) -> None:
+        """Store a vector, overwriting the oldest slot when full."""
+        if self._vectors is None:
+            self._open(dim=len(vector))
+        if self._vectors is None or len(vector) != self.dim:
+            return
+        slot = self._index.get(digest)
+        if slot is not None and self._holds(slot, digest):
+            return
+        assert self._digests is not None and self._ring is not None
+        with self._locked():
+            slot = int(self._ring[0]) % self.capacity
+            self._ring[0] = (slot + 1) % self.capacity
+            # Readers of the slot see a mismatch while it is rewritten
+            self._digests[slot] = 0
+            self._vectors[slot] = vector
+            self._digests[slot] = np.frombuffer(digest, dtype=np.uint8)
+        self._forget(slot)
+        if digest in self._index:
+            self._forget(self._index[digest])
+        self._index[digest] = slot
+        self._slots[slot] = digest
+
+    def flush(self) -> None:
+        """Flush the memmaps to disk."""
+        if self._vectors is None:
+            return
+        self._vectors.flush()
+        self._digests.flush()
+        self._ring.flush()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper serving repeated texts from the cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        max_size: int | None = None,
+        disk_path: str | None = None,
+        disk_size: int | None = None,
+        flush_every: int = 64
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            embeddings (Embeddings): The embedding model.
+            model_name (str): The name of the model, part of the keys.
+            max_size (int | None): The number of vectors of the LRU tier.
+                `EMBEDDING_CACHE_SIZE` by default.
+            disk_path (str | None): The directory of the disk tier.
+                `EMBEDDING_CACHE_PATH` by default.
+            disk_size (int | None): The number of vectors of the disk tier (`0`
+                disables it). `EMBEDDING_CACHE_DISK_SIZE` by default.
+            flush_every (int): New vectors between two disk flushes.
+        """
+        if max_size is None:
+            max_size = settings.EMBEDDING_CACHE_SIZE
+        if disk_path is None:
+            disk_path = settings.EMBEDDING_CACHE_PATH
+        if disk_size is None:
+            disk_size = settings.EMBEDDING_CACHE_DISK_SIZE
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_size = max(1, max_size)
+        self.flush_every = max(1, flush_every)
+        self.stats = EmbeddingCacheStats()
+        self._lru: OrderedDict[bytes, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.disk: EmbeddingDiskCache | None = None
+        if disk_path and disk_size > 0:
+            path = os.path.join(
+                disk_path,
+                hashlib.sha1(model_name.encode("utf-8")).hexdigest()[:12]
+            )
+            try:
+                self.disk = EmbeddingDiskCache(path, disk_size)
+                atexit.register(self.flush)
+            except Exception as e:
+                logger.warning(f"Embedding disk cache disabled: {e}")
+
+    def _get_digest(self, text: str, kind: str) -> bytes:
+        """
+        Hash the model name, the kind of embedding (`query` or
+        `document`, which some models embed differently) and the text.
+        """
+        return hashlib.blake2b(
+            f"{self.model_name}\0{kind}\0{text}".encode("utf-8"),
+            digest_size=DIGEST_SIZE
+        ).digest()
+
+    def _lookup(self, digests: list[bytes]) -> dict[bytes, np.ndarray]:
+        """Return the cached vectors among the given digests."""
+        found: dict[bytes, np.ndarray] = {}
+        seen: set[bytes] = set()
+        with self._lock:
+            for digest in digests:
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                vector = self._lru.get(digest)
+                if vector is not None:
+                    self._lru.move_to_end(digest)
+                    self.stats.memory_hits += 1
+                    found[digest] = vector
+                    continue
+                if self.disk is not None:
+                    vector = self.disk.get(digest)
+                    if vector is not None:
+                        self.stats.disk_hits += 1
+                        self._remember(digest, vector)
+                        found[digest] = vector
+                        continue
+                self.stats.misses += 1
+        return found
+
+    def _remember(self, digest: bytes, vector: np.ndarray) -> None:
+        """Insert a vector in the LRU tier; the lock must be held."""
+        self._lru[digest] = vector
+        self._lru.move_to_end(digest)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _store(
+        self,
+        digests: list[bytes],
+        vectors: list[list[float]] | list[np.ndarray]
+    ) -> None:
+        """Insert new vectors in both tiers."""
+        with self._lock:
+            for digest, vector in zip(digests, vectors):
+                array = np.asarray(vector, dtype=np.float32)
+                self._remember(digest, array)
+                if self.disk is not None:
+                    self.disk.put(digest, array)
+                    self._pending += 1
+
+    @property
+    def _flush_due(self) -> bool:
+        """True when `flush_every` vectors were stored since the flush."""
+        return self.disk is not None and self._pending >= self.flush_every
+
+    def _split(
+        self,
+        texts: list[str],
+        kind: str
+    ) -> tuple[list[bytes], dict[bytes, np.ndarray], list[str]]:
+        """
+        Hash the texts and split them into cached and missing ones.
+
+        Returns:
+            tuple: The digests of the texts, the cached vectors and the
+                distinct texts to embed.
+        """
+        digests = [self._get_digest(text, kind) for text in texts]
+        found = self._lookup(digests)
+        missing: dict[bytes, str] = {}
+        for digest, text in zip(digests, texts):
+            if digest not in found and digest not in missing:
+                missing[digest] = text
+        return digests, found, list(missing.values())
+
+    def _merge(
+        self,
+        digests: list[bytes],
+        found: dict[bytes, np.ndarray],
+        missing: list[str],
+        vectors: list[list[float]] | list[np.ndarray],
+        kind: str
+    ) -> list[np.ndarray]:
+        """Store the new vectors and return all vectors in order."""
+        if missing:
+            missing_digests = [
+                self._get_digest(text, kind) for text in missing
+            ]
+            self._store(missing_digests, vectors)
+            for digest, vector in zip(missing_digests, vectors):
+                found[digest] = np.asarray(vector, dtype=np.float32)
+        return [found[digest] for digest in digests]
+
+    async def _off_loop(self, function: Callable[..., T], *args: Any) -> T:
+        """
+        Run a step of the cache from the event loop, in a worker thread
+        when it may touch the disk tier.
+        """
+        if self.disk is None:
+            return function(*args)
+        return await asyncio.to_thread(function, *args)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        digests, found, missing = self._split(texts, "document")
+        vectors = self.embeddings.embed_documents(missing) if missing else []
+        result = self._merge(digests, found, missing, vectors, "document")
+        if self._flush_due:
+            self.flush()
+        return [vector.tolist() for vector in result]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        digests, found, missing = await self._off_loop(
+            self._split, texts, "document"
+        )
+        vectors = (
+            await self.embeddings.aembed_documents(missing) if missing
+            else []
+        )
+        result = await self._off_loop(
+            self._merge, digests, found, missing, vectors, "document"
+        )
+        if self._flush_due:
+            await asyncio.to_thread(self.flush)
+        return [vector.tolist() for vector in result]
+
+    def embed_query(self, text: str) -> list[float]:
+        digests, found, missing = self._split([text], "query")
+        vectors = [self.embeddings.embed_query(text)] if missing else []
+        result = self._merge(digests, found, missing, vectors, "query")[0]
+        if self._flush_due:
+            self.flush()
+        return result.tolist()
+
+    async def aembed_query(self, text: str) -> list[float]:
+        digests, found, missing = await self._off_loop(
+            self._split, [text], "query"
+        )
+        vectors = (
+            [await self.embeddings.aembed_query(text)] if missing else []
+        )
+        result = await self._off_loop(
+            self._merge, digests, found, missing, vectors, "query"
+        )
+        if self._flush_due:
+            await asyncio.to_thread(self.flush)
+        return result[0].tolist()
+
+    def flush(self) -> None:
+        """
+        Flush the disk tier, e.g. when the server shuts down.
+
+        The lookups are not blocked meanwhile: the memmaps are shared
+        with the page cache, the flush only makes them durable.
+        """
+        with self._lock:
+            if self.disk is None or not self._pending:
+                return
+            self._pending = 0
+        self.disk.flush()
+
+
+class CachedTextEmbedding(CachedEmbeddings):
+    """
+    Cache in front of a fastembed `TextEmbedding`, the local sentence
+    model of the vector store.
+
+    `embed`, `query_embed` and `passage_embed` keep the fastembed
+    interface and yield numpy vectors; `embed_documents` and
+    `embed_query` make the model usable as LangChain embeddings. Other
+    attributes are read from the model.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def _embed(
+        self,
+        texts: str | Iterable[str],
+        kind: str,
+        embed: Callable[..., Iterable[np.ndarray]],
+        **kwargs: Any
+    ) -> Iterator[np.ndarray]:
+        """
+        Embed texts through the cache.
+
+        Args:
+            texts (str | Iterable[str]): The texts.
+            kind (str): The kind of embedding, part of the keys.
+            embed (Callable): The method of the model embedding the
+                missing texts.
+            kwargs: The arguments of the method.
+        Returns:
+            Iterator[np.ndarray]: The vectors, in the order of the texts.
+        """
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        digests, found, missing = self._split(texts, kind)
+        vectors = list(embed(missing, **kwargs)) if missing else []
+        result = self._merge(digests, found, missing, vectors, kind)
+        if self._flush_due:
+            self.flush()
+        # Copies: the cached arrays must not be changed by the callers
+        return (vector.copy() for vector in result)
+
+    def embed(
+        self,
+        documents: str | Iterable[str],
+        **kwargs: Any
+    ) -> Iterator[np.ndarray]:
+        return self._embed(
+            documents, "document", self.embeddings.embed, **kwargs
+        )
+
+    def query_embed(
+        self,
+        query: str | Iterable[str],
+        **kwargs: Any
+    ) -> Iterator[np.ndarray]:
+        return self._embed(
+            query, "query", self.embeddings.query_embed, **kwargs
+        )
+
+    def passage_embed(
+        self,
+        texts: Iterable[str],
+        **kwargs: Any
+    ) -> Iterator[np.ndarray]:
+        return self._embed(
+            texts, "passage", self.embeddings.passage_embed, **kwargs
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [vector.tolist() for vector in self.embed(texts)]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        return next(self.query_embed(text)).tolist()
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await asyncio.to_thread(self.embed_query, text)
@@ -0,0 +1,236 @@
+"""
+Process-wide registry of the chat model clients.
+
+The agent gets its chat models, for the summarization hook and for every
+compilation of the agent, from `get_chat_model`, so the connections to
+the OpenAI, Ollama or vLLM endpoints are reused. It caches one model per
+(type, name, url) and the OpenAI-compatible models (`openai`, `vllm`)
+share one keep-alive connection pool, tuned by `LLM_MAX_CONNECTIONS`,
+`LLM_MAX_KEEPALIVE_CONNECTIONS` and `LLM_KEEPALIVE_EXPIRY`. The Ollama
+client does not accept an external HTTP client: each Ollama model keeps
+its own pool, with the same limits. The pools are closed when the
+server shuts down.
+"""
+
+import threading
+from dataclasses import dataclass
+import httpx
+from langchain_core.language_models import BaseChatModel
+from config import settings
+from log import logger
+
+ModelKey = tuple[str, str, str | None]
+
+
+@dataclass
+class LLMClientStats:
+    """Counters of the chat model registry."""
+
+    created: int = 0
+    reused: int = 0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "created": self.created,
+            "reused": self.reused,
+            "models": len(_models),
+        }
+
+
+_models: dict[ModelKey, BaseChatModel] = {}
+# Endpoints served by a model given to `register_chat_model`
+_registered: set[ModelKey] = set()
+_lock = threading.Lock()
+_http_client: httpx.Client | None = None
+_http_async_client: httpx.AsyncClient | None = None
+stats = LLMClientStats()
+
+
+def _get_limits() -> httpx.Limits:
+    """Return the connection limits of the LLM pools."""
+    return httpx.Limits(
+        max_connections=settings.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+    )
+
+
+def _get_timeout() -> httpx.Timeout:
+    """Return the timeouts of the LLM requests."""
+    return httpx.Timeout(
+        settings.LLM_TIMEOUT,
+        connect=settings.LLM_CONNECT_TIMEOUT
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Return the shared synchronous HTTP client of the LLM endpoints.
+
+    Returns:
+        httpx.Client: The client owning the keep-alive pool.
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=_get_limits(),
+                timeout=_get_timeout()
+            )
+        return _http_client
+
+
+def get_http_async_client() -> httpx.AsyncClient:
+    """
+    Return the shared asyncio HTTP client of the LLM endpoints.
+
+    Returns:
+        httpx.AsyncClient: The client owning the keep-alive pool.
+    """
+    global _http_async_client
+    with _lock:
+        if _http_async_client is None:
+            _http_async_client = httpx.AsyncClient(
+                limits=_get_limits(),
+                timeout=_get_timeout()
+            )
+        return _http_async_client
+
+
+def _get_key(
+    model_type: str | None,
+    model_name: str | None,
+    url: str | None
+) -> ModelKey:
+    """Build the registry key of an endpoint, with the defaults."""
+    return (
+        (model_type or settings.LLM_MODEL_TYPE).lower(),
+        model_name or settings.LLM_MODEL_NAME,
+        url if url is not None else settings.LLM_URL
+    )
+
+
+def _create_chat_model(
+    model_type: str,
+    model_name: str,
+    url: str | None
+) -> BaseChatModel:
+    """
+    Create a chat model bound to the shared connection pool.
+
+    Raises:
+        ValueError: If the model type is not supported.
+    """
+    match model_type:
+        case "openai" | "vllm":
+            from langchain_openai import ChatOpenAI
+
+            if model_type == "vllm" and not url:
+                raise ValueError("LLM_URL must be provided for vllm")
+            return ChatOpenAI(
+                model=model_name,
+                base_url=url,
+                # vLLM accepts any key unless started with --api-key
+                api_key=settings.OPENAI_API_KEY or "EMPTY",
+                http_client=get_http_client(),
+                http_async_client=get_http_async_client()
+            )
+        case "ollama":
+            from langchain_ollama import ChatOllama
+
+            if not url:
+                raise ValueError("LLM_URL must be provided for ollama")
+            return ChatOllama(
+                model=model_name,
+                base_url=url,
+                client_kwargs={
+                    "limits": _get_limits(),
+                    "timeout": _get_timeout(),
+                }
+            )
+    raise ValueError(f"Unsupported LLM_MODEL_TYPE '{model_type}'")
+
+
+def get_chat_model(
+    model_type: str | None = None,
+    model_name: str | None = None,
+    url: str | None = None
+) -> BaseChatModel:
+    """
+    Return the shared chat model for the given endpoint, creating it on
+    first use.
+
+    Without an explicit URL and with more than one URL in `LLM_URLS`,
+    the model routes the calls across them (see `llm_router`), unless a
+    model was registered for the default endpoint.
+    Args:
+        model_type (str | None): `openai`, `ollama` or `vllm`
+            (default settings.LLM_MODEL_TYPE).
+        model_name (str | None): The model (default
+            settings.LLM_MODEL_NAME).
+        url (str | None): The endpoint (default settings.LLM_URL).
+    Returns:
+        BaseChatModel: The long-lived chat model.
+    """
+    key = _get_key(model_type, model_name, url)
+    with _lock:
+        model = _models.get(key)
+        registered = key in _registered
+    if url is None and len(settings.LLM_URLS) > 1 and not registered:
+        from llm_router import get_routed_chat_model
+
+        return get_routed_chat_model(key[0], key[1], settings.LLM_URLS)
+    if model is not None:
+        stats.reused += 1
+        return model
+
+    model = _create_chat_model(*key)
+    with _lock:
+        # Another thread may have created it meanwhile
+        model = _models.setdefault(key, model)
+    stats.created += 1
+    logger.info(f"Chat model created for {key[0]}:{key[1]} ({key[2]})")
+    return model
+
+
+def register_chat_model(
+    model: BaseChatModel,
+    model_type: str | None = None,
+    model_name: str | None = None,
+    url: str | None = None
+) -> None:
+    """
+    Serve a given chat model for an endpoint, e.g. a scripted model in
+    the benchmarks.
+
+    Args:
+        model (BaseChatModel): The chat model.
+        model_type (str | None): As in `get_chat_model`.
+        model_name (str | None): As in `get_chat_model`.
+        url (str | None): As in `get_chat_model`.
+    """
+    key = _get_key(model_type, model_name, url)
+    with _lock:
+        _models[key] = model
+        _registered.add(key)
+
+
+async def close_llm_clients() -> None:
+    """
+    Close the shared connection pools and forget the chat models, the
+    routed ones included.
+    """
+    from llm_router import clear_routers
+
+    global _http_client, _http_async_client
+    clear_routers()
+    with _lock:
+        _models.clear()
+        _registered.clear()
+        http_client, _http_client = _http_client, None
+        http_async_client, _http_async_client = _http_async_client, None
+    if http_async_client is not None:
+        await http_async_client.aclose()
+    if http_client is not None:
+        http_client.close()
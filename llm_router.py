@@ -0,0 +1,482 @@
+"""
+Latency-aware routing of the chat model across several LLM endpoints.
+
+With more than one URL in `LLM_URLS` (e.g. Ollama or vLLM replicas),
+`get_chat_model` returns a `RoutedChatModel` spreading the calls over
+the endpoints:
+
+- each call goes to the endpoint with the lowest EWMA of its time to the
+  first token multiplied by its outstanding requests plus one, so a slow
+  or busy replica receives less traffic;
+- a call fails over to the next endpoint when the first token does not
+  arrive within `LLM_FIRST_TOKEN_TIMEOUT` seconds or the request fails
+  before it; once a token was streamed, errors are raised to the caller;
+- an endpoint failing `LLM_EJECT_FAILURES` times in a row is ejected for
+  `LLM_EJECT_SECONDS`, then probed again with a reset latency estimate.
+
+Each endpoint is a shared model of `llm_clients`, so the replicas are
+reached through the keep-alive connection pool.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from itertools import chain
+from typing import Any, AsyncIterator, Iterator, Sequence
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.language_models.chat_models import (
+    agenerate_from_stream,
+    generate_from_stream,
+)
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import ConfigDict, Field, PrivateAttr
+from llm_clients import get_chat_model
+from config import settings
+from log import logger
+
+# The endpoint calls are not traced again: the routed model reports them
+_INNER_CONFIG: RunnableConfig = {"callbacks": []}
+
+
+class FirstTokenTimeoutError(TimeoutError):
+    """The first token of an LLM endpoint did not arrive in time."""
+
+
+@dataclass
+class EndpointStats:
+    """Counters of an LLM endpoint."""
+
+    requests: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    ejections: int = 0
+    outstanding: int = 0
+    ewma_first_token: float = 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "ejections": self.ejections,
+            "outstanding": self.outstanding,
+            "ewma_first_token": self.ewma_first_token,
+        }
+
+
+class Endpoint:
+    """
+    An LLM endpoint with its load, latency estimate and health.
+    """
+
+    def __init__(self, url: str, model: BaseChatModel):
+        self.url = url
+        self.model = model
+        self.stats = EndpointStats()
+        # None until measured: new and readmitted endpoints are tried
+        # first
+        self.ewma: float | None = None
+        self.consecutive_failures: int = 0
+        self.ejected_until: float = 0.0
+
+    def score(self) -> float:
+        """The expected wait of a new call; lower is better."""
+        return (self.ewma or 0.0) * (self.stats.outstanding + 1)
+
+
+class LLMRouter:
+    """
+    Picks the endpoint of each call and tracks the health of the
+    endpoints.
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[Endpoint],
+        decay: float | None = None,
+        eject_failures: int | None = None,
+        eject_seconds: float | None = None
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            endpoints (Sequence[Endpoint]): The endpoints.
+            decay (float | None): The weight of a new sample in the EWMA.
+                `LLM_EWMA_DECAY` by default.
+            eject_failures (int | None): The consecutive failures ejecting an
+                endpoint. `LLM_EJECT_FAILURES` by default.
+            eject_seconds (float | None): Seconds an endpoint stays ejected.
+                `LLM_EJECT_SECONDS` by default.
+        """
+        if decay is None:
+            decay = settings.LLM_EWMA_DECAY
+        if eject_failures is None:
+            eject_failures = settings.LLM_EJECT_FAILURES
+        if eject_seconds is None:
+            eject_seconds = settings.LLM_EJECT_SECONDS
+        self.endpoints = list(endpoints)
+        self.decay = decay
+        self.eject_failures = max(1, eject_failures)
+        self.eject_seconds = eject_seconds
+        self._lock = threading.Lock()
+
+    def pick(self, tried: set[str]) -> Endpoint | None:
+        """
+        Pick the endpoint of a call, excluding those already tried.
+
+        Ejected endpoints are only picked when all the others were tried.
+        Returns:
+            Endpoint | None: The endpoint, or None if all were tried.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                endpoint for endpoint in self.endpoints
+                if endpoint.url not in tried
+            ]
+            if not candidates:
+                return None
+            healthy = [
+                endpoint for endpoint in candidates
+                if endpoint.ejected_until <= now
+            ]
+            if healthy:
+                endpoint = min(
+                    healthy,
+                    key=lambda e: (
+                        e.score(), e.stats.outstanding, random.random()
+                    )
+                )
+            else:
+                # Last resort: the endpoint readmitted soonest
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+            if 0 < endpoint.ejected_until <= now:
+                # Back from an ejection: its latency is measured again
+                endpoint.ejected_until = 0.0
+                endpoint.ewma = None
+            endpoint.stats.requests += 1
+            endpoint.stats.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint) -> None:
+        """Record the end of a call."""
+        with self._lock:
+            endpoint.stats.outstanding -= 1
+
+    def first_token(self, endpoint: Endpoint, seconds: float) -> None:
+        """Record the time to the first token of a successful call."""
+        with self._lock:
+            self._update_ewma(endpoint, seconds)
+            endpoint.consecutive_failures = 0
+
+    def failure(
+        self,
+        endpoint: Endpoint,
+        error: BaseException,
+        seconds: float
+    ) -> None:
+        """Record a call failed before its first token."""
+        with self._lock:
+            endpoint.stats.failures += 1
+            if isinstance(error, FirstTokenTimeoutError):
+                endpoint.stats.timeouts += 1
+                # The wait counts as a sample: the endpoint is slow
+                self._update_ewma(endpoint, seconds)
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_failures:
+                endpoint.consecutive_failures = 0
+                endpoint.ejected_until = (
+                    time.monotonic() + self.eject_seconds
+                )
+                endpoint.stats.ejections += 1
+                logger.warning(
+                    f"LLM endpoint {endpoint.url} ejected for "
+                    f"{self.eject_seconds}s: {error}"
+                )
+
+    def _update_ewma(self, endpoint: Endpoint, seconds: float) -> None:
+        """Add a latency sample to the EWMA of an endpoint."""
+        if endpoint.ewma is None:
+            endpoint.ewma = seconds
+        else:
+            endpoint.ewma += self.decay * (seconds - endpoint.ewma)
+        endpoint.stats.ewma_first_token = endpoint.ewma
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """
+        Return the counters of the endpoints.
+
+        Returns:
+            dict: The counters by URL.
+        """
+        return {
+            endpoint.url: endpoint.stats.as_dict()
+            for endpoint in self.endpoints
+        }
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model routing each call to one of several endpoints, with
+    failover before the first token.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    router: LLMRouter
+    model_type: str
+    model_name: str
+    first_token_timeout: float = Field(
+        default_factory=lambda: settings.LLM_FIRST_TOKEN_TIMEOUT
+    )
+    tools: Sequence[Any] | None = None
+    tool_kwargs: dict[str, Any] = {}
+    _bound: dict[str, Runnable] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {
+            "model_type": self.model_type,
+            "model_name": self.model_name,
+            "urls": [endpoint.url for endpoint in self.router.endpoints],
+        }
+
+    def _get_ls_params(self, stop: list[str] | None = None, **kwargs: Any):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_provider"] = self.model_type
+        params["ls_model_name"] = self.model_name
+        return params
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        """
+        Bind the tools to the model of every endpoint.
+
+        Returns:
+            RoutedChatModel: A routed model calling the tools.
+        """
+        model = self.model_copy(
+            update={"tools": list(tools), "tool_kwargs": kwargs}
+        )
+        # The copy must not share the bindings of other tools
+        model._bound = {}
+        return model
+
+    def _get_runnable(self, endpoint: Endpoint) -> Runnable:
+        """Return the model of an endpoint, with the tools bound."""
+        if self.tools is None:
+            return endpoint.model
+        runnable = self._bound.get(endpoint.url)
+        if runnable is None:
+            runnable = endpoint.model.bind_tools(
+                self.tools,
+                **self.tool_kwargs
+            )
+            self._bound[endpoint.url] = runnable
+        return runnable
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        tried: set[str] = set()
+        error: Exception = RuntimeError("No LLM endpoint available")
+        while (endpoint := self.router.pick(tried)) is not None:
+            tried.add(endpoint.url)
+            stream = self._get_runnable(endpoint).astream(
+                messages,
+                config=_INNER_CONFIG,
+                stop=stop,
+                **kwargs
+            )
+            start = time.perf_counter()
+            try:
+                first = await asyncio.wait_for(
+                    anext(stream, None),
+                    self.first_token_timeout
+                )
+            except asyncio.CancelledError:
+                self.router.release(endpoint)
+                raise
+            except Exception as e:
+                self.router.release(endpoint)
+                await stream.aclose()
+                if isinstance(e, asyncio.TimeoutError):
+                    e = FirstTokenTimeoutError(
+                        f"no token in {self.first_token_timeout}s"
+                    )
+                self.router.failure(endpoint, e, time.perf_counter() - start)
+                logger.warning(
+                    f"LLM endpoint {endpoint.url} failed, failing over: {e}"
+                )
+                error = e
+                continue
+            self.router.first_token(endpoint, time.perf_counter() - start)
+            try:
+                if first is not None:
+                    yield await self._aemit(first, run_manager)
+                async for chunk in stream:
+                    yield await self._aemit(chunk, run_manager)
+            finally:
+                self.router.release(endpoint)
+            return
+        raise error
+
+    @staticmethod
+    def _get_text(chunk: AIMessageChunk) -> str:
+        """Return the text of a chunk, for the token callbacks."""
+        return chunk.content if isinstance(chunk.content, str) else ""
+
+    async def _aemit(
+        self,
+        chunk: AIMessageChunk,
+        run_manager: AsyncCallbackManagerForLLMRun | None
+    ) -> ChatGenerationChunk:
+        """Wrap a chunk of an endpoint and report its token."""
+        generation = ChatGenerationChunk(message=chunk)
+        if run_manager is not None:
+            await run_manager.on_llm_new_token(
+                self._get_text(chunk),
+                chunk=generation
+            )
+        return generation
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        # Streamed, so the first-token deadline applies
+        return await agenerate_from_stream(
+            self._astream(messages, stop, run_manager, **kwargs)
+        )
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        # Synchronous calls fail over on errors only, without deadline
+        tried: set[str] = set()
+        error: Exception = RuntimeError("No LLM endpoint available")
+        while (endpoint := self.router.pick(tried)) is not None:
+            tried.add(endpoint.url)
+            stream = self._get_runnable(endpoint).stream(
+                messages,
+                config=_INNER_CONFIG,
+                stop=stop,
+                **kwargs
+            )
+            start = time.perf_counter()
+            try:
+                first = next(stream, None)
+            except Exception as e:
+                self.router.release(endpoint)
+                self.router.failure(endpoint, e, time.perf_counter() - start)
+                error = e
+                continue
+            self.router.first_token(endpoint, time.perf_counter() - start)
+            try:
+                chunks = stream if first is None else chain([first], stream)
+                for chunk in chunks:
+                    generation = ChatGenerationChunk(message=chunk)
+                    if run_manager is not None:
+                        run_manager.on_llm_new_token(
+                            self._get_text(chunk),
+                            chunk=generation
+                        )
+                    yield generation
+            finally:
+                self.router.release(endpoint)
+            return
+        raise error
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        return generate_from_stream(
+            self._stream(messages, stop, run_manager, **kwargs)
+        )
+
+
+_routers: dict[tuple[str, str, tuple[str, ...]], RoutedChatModel] = {}
+_lock = threading.Lock()
+
+
+def get_routed_chat_model(
+    model_type: str,
+    model_name: str,
+    urls: Sequence[str]
+) -> RoutedChatModel:
+    """
+    Return the shared routed model over the given endpoints, creating it
+    on first use.
+
+    Args:
+        model_type (str): `openai`, `ollama` or `vllm`.
+        model_name (str): The model served by every endpoint.
+        urls (Sequence[str]): The URLs of the endpoints.
+    Returns:
+        RoutedChatModel: The routed model.
+    """
+    key = (model_type, model_name, tuple(urls))
+    with _lock:
+        model = _routers.get(key)
+        if model is None:
+            router = LLMRouter([
+                Endpoint(url, get_chat_model(model_type, model_name, url))
+                for url in urls
+            ])
+            model = _routers[key] = RoutedChatModel(
+                router=router,
+                model_type=model_type,
+                model_name=model_name
+            )
+            logger.info(
+                f"Chat model {model_type}:{model_name} routed across "
+                f"{list(urls)}"
+            )
+        return model
+
+
+def clear_routers() -> None:
+    """Forget the routed models, whose endpoints are being closed."""
+    with _lock:
+        _routers.clear()
+
+
+def get_endpoint_stats() -> dict[str, dict[str, float]]:
+    """
+    Return the counters of the endpoints of every routed model.
+
+    Returns:
+        dict: The counters by endpoint URL.
+    """
+    stats: dict[str, dict[str, float]] = {}
+    for model in list(_routers.values()):
+        stats.update(model.router.get_stats())
+    return stats
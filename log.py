@@ -1,15 +1,247 @@
 """
 This module sets up a logger that sends logs to a Loki instance.
 Info: https://github.com/xente/loki-logger-handler
+
+The handlers (Loki or console) never run on the calling thread: records
+go through a bounded queue to a listener thread, and the Loki handler
+ships them in batches every `LOKI_FLUSH_INTERVAL` seconds. When the queue
+fills up over `LOG_QUEUE_SAMPLE_THRESHOLD`, only one DEBUG/INFO record
+out of `LOG_SAMPLE_RATE` is kept; when it is full, records are dropped.
+Messages, and each of their arguments before they are merged, are
+truncated to `LOG_MAX_MESSAGE_LENGTH` characters before being queued.
+The counters are returned by `get_log_stats`.
 """
 
+import atexit
 import logging
+import logging.handlers
 import os
 import json
+import queue
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass
 from loki_logger_handler.loki_logger_handler import LokiLoggerHandler
 from typing import Any
 
 
+@dataclass
+class LogStats:
+    """Counters of the log queue."""
+
+    enqueued: int = 0
+    sampled_out: int = 0
+    dropped: int = 0
+    truncated: int = 0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "enqueued": self.enqueued,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "truncated": self.truncated,
+        }
+
+
+_stats = LogStats()
+# The counters are updated by every thread logging
+_stats_lock = threading.Lock()
+_listeners: list[logging.handlers.QueueListener] = []
+
+
+def get_log_stats() -> dict[str, float]:
+    """
+    Return the counters of the log queue.
+
+    Returns:
+        dict: The counters, with the current queue depth.
+    """
+    with _stats_lock:
+        stats = _stats.as_dict()
+    return {
+        **stats,
+        "queue_depth": sum(
+            listener.queue.qsize() for listener in _listeners
+        ),
+    }
+
+
+def _count(counter: str) -> None:
+    """Increment a counter of the log queue."""
+    with _stats_lock:
+        setattr(_stats, counter, getattr(_stats, counter) + 1)
+
+
+def _truncate(text: str, max_length: int) -> str:
+    """Truncate a text, noting the characters removed."""
+    if len(text) <= max_length:
+        return text
+    return (
+        f"{text[:max_length]}... "
+        f"[{len(text) - max_length} characters truncated]"
+    )
+
+
+class _TruncatedArg:
+    """Argument of a log call rendered with at most `max_length` chars."""
+
+    __slots__ = ("text", "representation")
+
+    def __init__(self, text: str, representation: str):
+        self.text = text
+        self.representation = representation
+
+    def __str__(self) -> str:
+        return self.text
+
+    def __repr__(self) -> str:
+        return self.representation
+
+
+def _truncate_arg(value: Any, max_length: int) -> tuple[Any, bool]:
+    """
+    Truncate an argument of a log call; numbers are kept as they are,
+    so that `%d` and `%f` still apply.
+
+    Returns:
+        tuple: The argument to merge, and whether it was truncated.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value, False
+    text = str(value)
+    if len(text) <= max_length:
+        return value, False
+    return _TruncatedArg(
+        _truncate(text, max_length),
+        _truncate(repr(value), max_length)
+    ), True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the caller.
+
+    The drop and sampling decisions are taken before the record is
+    formatted, so the records discarded under load do not pay for the
+    formatting of their arguments.
+    """
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        max_length: int,
+        sample_rate: int,
+        sample_threshold: float
+    ):
+        """
+        Initialize the handler.
+
+        Args:
+            log_queue (queue.Queue): The bounded queue of the listener.
+            max_length (int): The characters kept of a message and of its
+                traceback.
+            sample_rate (int): One DEBUG/INFO record out of `sample_rate`
+                is kept while the queue is over the threshold.
+            sample_threshold (float): The fraction of the queue over which
+                the records are sampled.
+        """
+        super().__init__(log_queue)
+        self.max_length = max_length
+        self.sample_rate = max(1, sample_rate)
+        self.high_watermark = int(log_queue.maxsize * sample_threshold)
+        self._sampled = 0
+        self._lock = threading.Lock()
+
+    def _keep(self, record: logging.LogRecord) -> bool:
+        """Apply the sampling policy of a loaded queue."""
+        if (
+            record.levelno >= logging.WARNING
+            or self.queue.qsize() < self.high_watermark
+        ):
+            return True
+        with self._lock:
+            self._sampled += 1
+            return self._sampled % self.sample_rate == 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if not self._keep(record):
+            _count("sampled_out")
+            return
+        try:
+            self.queue.put_nowait(self.prepare(record))
+            _count("enqueued")
+        except queue.Full:
+            _count("dropped")
+        except Exception:
+            self.handleError(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Merge and truncate the message, and render the traceback, so the
+        listener thread does not touch the objects of the caller.
+
+        The arguments are truncated before being merged, so a large
+        argument is never copied whole into the message.
+        """
+        prepared = logging.makeLogRecord(record.__dict__)
+        truncated = False
+        if isinstance(record.args, Mapping):
+            args = {}
+            for key, value in record.args.items():
+                args[key], cut = _truncate_arg(value, self.max_length)
+                truncated = truncated or cut
+            prepared.args = args
+        elif record.args:
+            args = []
+            for value in record.args:
+                value, cut = _truncate_arg(value, self.max_length)
+                args.append(value)
+                truncated = truncated or cut
+            prepared.args = tuple(args)
+        message = prepared.getMessage()
+        truncated = truncated or len(message) > self.max_length
+        prepared.msg = _truncate(message, self.max_length)
+        prepared.message = prepared.msg
+        prepared.args = None
+        if record.exc_info:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+            prepared.exc_text = _truncate(exc_text, self.max_length)
+            truncated = truncated or len(exc_text) > self.max_length
+        prepared.exc_info = None
+        if truncated:
+            _count("truncated")
+        return prepared
+
+
+def _attach_queue(logger: logging.Logger, handler: logging.Handler) -> None:
+    """
+    Route a handler through a bounded queue served by a listener thread.
+    """
+    log_queue: queue.Queue = queue.Queue(
+        maxsize=int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    )
+    logger.addHandler(
+        BoundedQueueHandler(
+            log_queue,
+            max_length=int(os.getenv("LOG_MAX_MESSAGE_LENGTH", 4096)),
+            sample_rate=int(os.getenv("LOG_SAMPLE_RATE", 10)),
+            sample_threshold=float(
+                os.getenv("LOG_QUEUE_SAMPLE_THRESHOLD", 0.8)
+            )
+        )
+    )
+    listener = logging.handlers.QueueListener(
+        log_queue,
+        handler,
+        respect_handler_level=True
+    )
+    listener.start()
+    _listeners.append(listener)
+    # Deliver the queued records when the process exits
+    atexit.register(listener.stop)
+
+
 def get_logger(**kwargs) -> logging.Logger:
     """
     Returns the logger instance.
@@ -74,21 +306,22 @@ def get_logger(**kwargs) -> logging.Logger:
         # Add a console handler for local development
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+        _attach_queue(logger, console_handler)
     else:
         # Create an instance of the custom handler
         agent_logger_handler = LokiLoggerHandler(
             url=loki_url,
             labels=labels,
             label_keys={},
-            timeout=10,
+            # Seconds between two batches sent to Loki
+            timeout=float(os.getenv("LOKI_FLUSH_INTERVAL", 10)),
             enable_structured_loki_metadata=True,
             loki_metadata=metadata_default,
             loki_metadata_keys=["thread_id"]
         )
         agent_logger_handler.setFormatter(formatter)
         agent_logger_handler.setLevel(level)
-        logger.addHandler(agent_logger_handler)
+        _attach_queue(logger, agent_logger_handler)
 
     return logger
 
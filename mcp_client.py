@@ -1,12 +1,373 @@
+import asyncio
+import itertools
+import time
+from functools import cache, cached_property
+from typing import Any
+from mcp import ClientSession, McpError, types
 from config import settings
+from langchain_core.tools import BaseTool
 from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.sessions import create_session
+from langchain_mcp_adapters.tools import load_mcp_tools
+from agent_graph import get_tools_version
+from log import logger
 
-mcp_client = MultiServerMCPClient(
-    {
-        "kgrag": {
-            # Ensure you start your kgrag server on port 8001
-            "url": settings.MCP_SERVER_KGRAG,
-            "transport": "sse",
+
+@cache
+def get_mcp_client() -> MultiServerMCPClient:
+    """
+    Create the MCP client of the process on first use.
+
+    Returns:
+        MultiServerMCPClient: The client with the connections of the
+            MCP servers.
+    """
+    return MultiServerMCPClient(
+        {
+            "kgrag": {
+                # Ensure you start your kgrag server on port 8001
+                "url": settings.MCP_SERVER_KGRAG,
+                "transport": "sse",
+            }
+        }
+    )
+
+
+class PooledSession:
+    """
+    Minimal `ClientSession` stand-in that forwards every request to a warm
+    session of the pool, so the LangChain tools built from it never open
+    a session of their own.
+    """
+
+    def __init__(self, pool: "MCPSessionPool"):
+        self.pool = pool
+
+    async def call_tool(
+        self,
+        name: str,
+        arguments: dict[str, Any] | None = None
+    ) -> types.CallToolResult:
+        session = await self.pool.acquire()
+        try:
+            result = await session.call_tool(name, arguments)
+        except Exception as e:
+            self.pool.discard(session, e)
+            raise
+        self.pool.touch(session)
+        return result
+
+    async def list_tools(
+        self,
+        cursor: str | None = None
+    ) -> types.ListToolsResult:
+        session = await self.pool.acquire()
+        try:
+            result = await session.list_tools(cursor=cursor)
+        except Exception as e:
+            self.pool.discard(session, e)
+            raise
+        self.pool.touch(session)
+        return result
+
+
+class MCPSessionPool:
+    """
+    Process-wide pool of warm MCP sessions and cached tool catalog.
+
+    Every pooled session is owned by a background task that keeps the SSE
+    connection open until the pool is closed or the connection breaks, in
+    which case a new session is opened on the next request. MCP sessions
+    multiplex requests, so a session is shared by concurrent tool calls and
+    picked round-robin.
+
+    A session idle for more than `MCP_PING_INTERVAL` seconds is pinged
+    before it is reused, and replaced if it does not answer.
+
+    The tool catalog is cached for `MCP_TOOLS_TTL` seconds and invalidated
+    as soon as the server sends a `notifications/tools/list_changed`.
+    """
+
+    def __init__(
+        self,
+        server_name: str = "kgrag",
+        size: int | None = None,
+        tools_ttl: float | None = None,
+        ping_interval: float | None = None,
+        ping_timeout: float | None = None
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            server_name (str): The name of the server in the MCP client.
+            size (int | None): The number of warm sessions to keep open.
+                `MCP_POOL_SIZE` by default.
+            tools_ttl (float | None): Seconds the tool catalog is cached.
+                `MCP_TOOLS_TTL` by default.
+            ping_interval (float | None): Seconds a session may stay idle
+                before it is pinged on reuse. `MCP_PING_INTERVAL` by default.
+            ping_timeout (float | None): Seconds to wait for the ping.
+                `MCP_PING_TIMEOUT` by default.
+        """
+        self.server_name = server_name
+        # Read from the settings on first use, not when the module-level
+        # pool is built at import
+        self._size = size
+        self._tools_ttl = tools_ttl
+        self._ping_interval = ping_interval
+        self._ping_timeout = ping_timeout
+        self.tools_version: str | None = None
+        self._sessions: list[ClientSession] = []
+        self._owners: dict[ClientSession, asyncio.Event] = {}
+        self._last_used: dict[ClientSession, float] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._round_robin = itertools.count()
+        self._lock = asyncio.Lock()
+        self._tools_lock = asyncio.Lock()
+        self._tools: list[BaseTool] | None = None
+        self._tools_expire_at: float = 0.0
+
+    @cached_property
+    def size(self) -> int:
+        """The number of warm sessions to keep open."""
+        return max(
+            1, settings.MCP_POOL_SIZE if self._size is None else self._size
+        )
+
+    @cached_property
+    def tools_ttl(self) -> float:
+        """Seconds the tool catalog is cached."""
+        if self._tools_ttl is None:
+            return settings.MCP_TOOLS_TTL
+        return self._tools_ttl
+
+    @cached_property
+    def ping_interval(self) -> float:
+        """Seconds a session may stay idle before it is pinged on reuse."""
+        if self._ping_interval is None:
+            return settings.MCP_PING_INTERVAL
+        return self._ping_interval
+
+    @cached_property
+    def ping_timeout(self) -> float:
+        """Seconds to wait for the ping."""
+        if self._ping_timeout is None:
+            return settings.MCP_PING_TIMEOUT
+        return self._ping_timeout
+
+    @cached_property
+    def connection(self) -> dict[str, Any]:
+        """
+        The connection of the server, read from the MCP client on the
+        first session.
+        """
+        connection: dict[str, Any] = dict(
+            get_mcp_client().connections[self.server_name]
+        )
+        connection["session_kwargs"] = {
+            **(connection.get("session_kwargs") or {}),
+            "message_handler": self._on_message,
         }
-    }
-)
+        return connection
+
+    async def _on_message(self, message: Any) -> None:
+        """
+        Handle messages pushed by the server on any pooled session.
+        """
+        if (
+            isinstance(message, types.ServerNotification)
+            and isinstance(message.root, types.ToolListChangedNotification)
+        ):
+            logger.info(
+                f"MCP server '{self.server_name}' tool list changed"
+            )
+            self.invalidate_tools()
+
+    async def _own_session(self, ready: asyncio.Future) -> None:
+        """
+        Open a session and keep it alive until asked to stop.
+        """
+        stop = asyncio.Event()
+        session: ClientSession | None = None
+        try:
+            async with create_session(self.connection) as session:
+                await session.initialize()
+                self._owners[session] = stop
+                self._last_used[session] = time.monotonic()
+                self._sessions.append(session)
+                ready.set_result(session)
+                await stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning(
+                    f"MCP session to '{self.server_name}' closed: {e}"
+                )
+        finally:
+            if session is not None:
+                self._owners.pop(session, None)
+                self._last_used.pop(session, None)
+                if session in self._sessions:
+                    self._sessions.remove(session)
+
+    async def start(self) -> None:
+        """
+        Open sessions until the pool holds `size` live sessions.
+        """
+        async with self._lock:
+            missing = self.size - len(self._sessions)
+            if missing <= 0:
+                return
+            loop = asyncio.get_running_loop()
+            readies: list[asyncio.Future] = []
+            for _ in range(missing):
+                ready = loop.create_future()
+                task = asyncio.create_task(self._own_session(ready))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                readies.append(ready)
+            results = await asyncio.gather(*readies, return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if errors:
+                logger.error(
+                    f"Unable to open {len(errors)} MCP session(s) to "
+                    f"'{self.server_name}': {errors[0]}"
+                )
+            if not self._sessions:
+                raise errors[0]
+
+    async def acquire(self) -> ClientSession:
+        """
+        Return a live session, reconnecting if the pool is short.
+
+        Returns:
+            ClientSession: An initialized MCP session.
+        Raises:
+            ConnectionError: If no session could be opened.
+        """
+        for _ in range(self.size + 1):
+            if len(self._sessions) < self.size:
+                await self.start()
+            if not self._sessions:
+                # Discarded meanwhile by a concurrent request
+                continue
+            session = self._sessions[
+                next(self._round_robin) % len(self._sessions)
+            ]
+            if await self._check(session):
+                return session
+        raise ConnectionError(
+            f"No live MCP session to '{self.server_name}'"
+        )
+
+    async def _check(self, session: ClientSession) -> bool:
+        """
+        Ping a session idle for more than `ping_interval` seconds.
+
+        Returns:
+            bool: False if the session did not answer and was discarded.
+        """
+        idle = time.monotonic() - self._last_used.get(session, 0.0)
+        if idle < self.ping_interval:
+            return True
+        try:
+            await asyncio.wait_for(session.send_ping(), self.ping_timeout)
+        except Exception as e:
+            self.discard(session, e)
+            return False
+        self.touch(session)
+        return True
+
+    def touch(self, session: ClientSession) -> None:
+        """Record that a session just answered a request."""
+        if session in self._owners:
+            self._last_used[session] = time.monotonic()
+
+    @staticmethod
+    def is_application_error(error: Exception) -> bool:
+        """
+        Return True for a JSON-RPC error answered by the server, e.g.
+        unknown tool or invalid arguments.
+
+        `McpError` also reports a closed connection (`CONNECTION_CLOSED`)
+        and a request timed out on a dead stream: those are not
+        application errors.
+        """
+        return isinstance(error, McpError) and error.error.code in (
+            types.PARSE_ERROR,
+            types.INVALID_REQUEST,
+            types.METHOD_NOT_FOUND,
+            types.INVALID_PARAMS,
+            types.INTERNAL_ERROR,
+        )
+
+    def discard(self, session: ClientSession, error: Exception) -> None:
+        """
+        Close a session whose transport failed, so it gets replaced.
+
+        Errors answered by the server leave the session untouched.
+        """
+        if self.is_application_error(error):
+            return
+        stop = self._owners.get(session)
+        if stop is not None:
+            logger.warning(
+                f"Discarding MCP session to '{self.server_name}': {error}"
+            )
+            if session in self._sessions:
+                self._sessions.remove(session)
+            stop.set()
+
+    @property
+    def tools_fresh(self) -> bool:
+        """True while the cached catalog, and its version, are valid."""
+        return (
+            self._tools is not None
+            and time.monotonic() < self._tools_expire_at
+        )
+
+    def invalidate_tools(self) -> None:
+        """Force the next `get_tools` call to reload the catalog."""
+        self._tools_expire_at = 0.0
+
+    async def get_tools(self) -> list[BaseTool]:
+        """
+        Get the tools of the server from the cached catalog.
+
+        Returns:
+            list[BaseTool]: A new list with the LangChain tools, whose
+                calls are served by the pooled sessions.
+        """
+        if not self.tools_fresh:
+            # Concurrent cold requests wait for a single load
+            async with self._tools_lock:
+                if not self.tools_fresh:
+                    await self._load_tools()
+        return list(self._tools or [])
+
+    async def _load_tools(self) -> None:
+        """Load the tool catalog from the server."""
+        tools = await load_mcp_tools(PooledSession(self))  # type: ignore
+        self._tools = tools
+        self._tools_expire_at = time.monotonic() + self.tools_ttl
+        version = get_tools_version(tools)
+        if version != self.tools_version:
+            logger.info(
+                f"MCP tool catalog of '{self.server_name}' loaded: "
+                f"{[tool.name for tool in tools]} (version {version})"
+            )
+            self.tools_version = version
+
+    async def close(self) -> None:
+        """Close every pooled session."""
+        for stop in list(self._owners.values()):
+            stop.set()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._sessions.clear()
+        self._tools = None
+
+
+mcp_pool = MCPSessionPool()
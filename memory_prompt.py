@@ -0,0 +1,204 @@
+"""
+Long-term memory injection in the system prompt.
+
+Before every model call the memories relevant to the current user request
+are searched in the agent store and injected in the system prompt. The
+search is an embedding call plus a vector search, so it runs
+asynchronously and its result is cached per thread: the model is called
+several times in a ReAct loop for the same user request, and only the
+first call searches the store. The cache is invalidated whenever the
+manage-memory tool writes, and the injected block is bounded both in the
+number of memories (`MEMORY_TOP_K`) and in tokens (`MEMORY_MAX_TOKENS`).
+"""
+
+import functools
+from collections import OrderedDict
+from typing import Any
+from langchain_core.messages import AnyMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool
+from langgraph.store.base import BaseStore
+from config import settings
+from log import logger, get_metadata
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+class MemoryPrompt:
+    """
+    Async prompt builder with a per-thread cache of retrieved memories.
+    """
+
+    def __init__(
+        self,
+        store: BaseStore,
+        namespace: tuple[str, ...] = ("memories",),
+        top_k: int | None = None,
+        max_tokens: int | None = None,
+        max_threads: int | None = None
+    ):
+        """
+        Initialize the prompt builder.
+
+        Args:
+            store (BaseStore): The store holding the memories.
+            namespace (tuple[str, ...]): The namespace of the memories.
+            top_k (int | None): The maximum number of memories injected.
+                `MEMORY_TOP_K` by default.
+            max_tokens (int | None): The token budget of the memories block.
+                `MEMORY_MAX_TOKENS` by default.
+            max_threads (int | None): The number of threads whose memories are
+                cached. `MEMORY_CACHE_THREADS` by default.
+        """
+        if top_k is None:
+            top_k = settings.MEMORY_TOP_K
+        if max_tokens is None:
+            max_tokens = settings.MEMORY_MAX_TOKENS
+        if max_threads is None:
+            max_threads = settings.MEMORY_CACHE_THREADS
+        self.store = store
+        self.namespace = namespace
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        self.max_threads = max(1, max_threads)
+        self._cache: OrderedDict[str, tuple[str, str]] = OrderedDict()
+
+    @staticmethod
+    def _get_query(messages: list[AnyMessage]) -> str:
+        """Get the text of the last user message."""
+        for message in reversed(messages):
+            if getattr(message, "type", None) == "human":
+                content = message.content
+                if isinstance(content, list):
+                    content = " ".join(
+                        block.get("text", "") if isinstance(block, dict)
+                        else str(block)
+                        for block in content
+                    )
+                return content
+        return ""
+
+    def _format(self, items: list[Any]) -> str:
+        """
+        Format the memories, most relevant first, within the token budget.
+
+        Args:
+            items (list[SearchItem]): The memories found in the store.
+        Returns:
+            str: The memories block, empty if there is nothing to inject.
+        """
+        lines: list[str] = []
+        used = 0
+        for item in items:
+            value = item.value
+            content = (
+                value.get("content", value) if isinstance(value, dict)
+                else value
+            )
+            line = f"- [{item.key}] {content}"
+            tokens = count_tokens_approximately([line])
+            if used + tokens > self.max_tokens:
+                break
+            lines.append(line)
+            used += tokens
+        return "\n".join(lines)
+
+    async def get_memories(self, thread_id: str | None, query: str) -> str:
+        """
+        Get the memories block for a user request of a thread.
+
+        Args:
+            thread_id (str | None): The thread of the request.
+            query (str): The text of the user request.
+        Returns:
+            str: The memories block.
+        """
+        if not query:
+            return ""
+        if thread_id is not None:
+            cached = self._cache.get(thread_id)
+            if cached is not None and cached[0] == query:
+                self._cache.move_to_end(thread_id)
+                return cached[1]
+
+        items = await self.store.asearch(
+            self.namespace,
+            query=query,
+            limit=self.top_k
+        )
+        memories = self._format(items)
+        logger.debug(
+            f"Memories retrieved: {len(items)}",
+            extra=get_metadata(thread_id=thread_id)
+        )
+        if thread_id is not None:
+            self._cache[thread_id] = (query, memories)
+            self._cache.move_to_end(thread_id)
+            while len(self._cache) > self.max_threads:
+                self._cache.popitem(last=False)
+        return memories
+
+    async def prompt(
+        self,
+        state: dict[str, Any],
+        config: RunnableConfig
+    ) -> list[AnyMessage]:
+        """
+        Prepare the messages for the LLM.
+
+        Args:
+            state (dict): The agent state; its messages are the ones
+                selected by the pre-model hook.
+            config (RunnableConfig): The configuration of the run.
+        Returns:
+            list[AnyMessage]: The system prompt followed by the messages.
+        """
+        messages = state["messages"]
+        thread_id = config.get("configurable", {}).get("thread_id")
+        memories = await self.get_memories(
+            thread_id,
+            self._get_query(messages)
+        )
+        system_msg = SYSTEM_PROMPT
+        if memories:
+            system_msg += (
+                f"\n\n## Memories\n<memories>\n{memories}\n</memories>"
+            )
+        return [SystemMessage(system_msg), *messages]
+
+    def invalidate(self) -> None:
+        """Drop the cached memories of every thread."""
+        self._cache.clear()
+
+    def wrap_manage_tool(self, tool: BaseTool) -> BaseTool:
+        """
+        Wrap the manage-memory tool so that its writes invalidate the
+        cached memories.
+
+        Args:
+            tool (BaseTool): The tool created by
+                `create_manage_memory_tool`.
+        Returns:
+            BaseTool: A copy of the tool invalidating the cache.
+        """
+        coroutine = tool.coroutine  # type: ignore[attr-defined]
+        func = tool.func  # type: ignore[attr-defined]
+
+        @functools.wraps(coroutine)
+        async def amanage_memory(*args, **kwargs):
+            try:
+                return await coroutine(*args, **kwargs)
+            finally:
+                self.invalidate()
+
+        @functools.wraps(func)
+        def manage_memory(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.invalidate()
+
+        return tool.model_copy(
+            update={"coroutine": amanage_memory, "func": manage_memory}
+        )
@@ -0,0 +1,479 @@
+"""
+Latency breakdown and Prometheus metrics of the agent.
+
+Each request is traced as a set of spans, one per phase:
+
+- `admission`: the wait for a free execution slot;
+- `checkpointer`, `get_tools`, `build_agent`: the setup of the run;
+- `cache_lookup`: the response and semantic cache lookup;
+- `agent_run`: the ReAct loop, with its `llm` calls, `tool` calls and
+  `summarization` (the pre-model hook) measured by `MetricsCallbackHandler`;
+- `request`: the whole request.
+
+Spans feed the `kgrag_phase_seconds`, `kgrag_llm_call_seconds` and
+`kgrag_tool_call_seconds` histograms, tagged by model and tool name, and
+are summed per request in a breakdown logged at the end of the request.
+The counters of the caches, of the admission controller and of the other
+components are exported by `StatsCollector`. Everything is served on the
+`/metrics` route of the server.
+
+With several workers, `__main__` sets `PROMETHEUS_MULTIPROC_DIR` and the
+histograms and counters are aggregated over every worker from the files
+of that directory (`prometheus_client` multiprocess mode). The counters
+of the components live in the worker answering the scrape, and are
+exported with its pid in the `worker` label.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Iterator,
+    TypeVar,
+)
+from uuid import UUID
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.registry import Collector
+from starlette.requests import Request
+from starlette.responses import Response
+from config import settings
+from log import logger, get_metadata
+
+BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0, 120.0
+)
+
+PHASE_SECONDS = Histogram(
+    "kgrag_phase_seconds",
+    "Seconds spent in each phase of a request.",
+    ["phase"],
+    buckets=BUCKETS
+)
+LLM_CALL_SECONDS = Histogram(
+    "kgrag_llm_call_seconds",
+    "Seconds of each LLM call.",
+    ["model", "status"],
+    buckets=BUCKETS
+)
+LLM_TOKENS = Counter(
+    "kgrag_llm_tokens",
+    "Tokens sent to and generated by the LLM.",
+    ["model", "kind"]
+)
+TOOL_CALL_SECONDS = Histogram(
+    "kgrag_tool_call_seconds",
+    "Seconds of each tool call.",
+    ["tool", "status"],
+    buckets=BUCKETS
+)
+REQUESTS = Counter(
+    "kgrag_requests",
+    "Requests handled by the agent executor.",
+    ["outcome"]
+)
+
+T = TypeVar("T")
+
+# Seconds per phase of the current request
+_trace: ContextVar[dict[str, float] | None] = ContextVar(
+    "kgrag_trace",
+    default=None
+)
+
+
+def observe(phase: str, seconds: float) -> None:
+    """
+    Record the duration of a phase of the current request.
+
+    Args:
+        phase (str): The name of the phase.
+        seconds (float): The duration.
+    """
+    PHASE_SECONDS.labels(phase).observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace[phase] = trace.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def span(phase: str) -> Iterator[None]:
+    """
+    Measure a phase of the current request.
+
+    Args:
+        phase (str): The name of the phase.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(phase, time.perf_counter() - start)
+
+
+async def timed(
+    phase: str,
+    iterable: AsyncIterable[T]
+) -> AsyncIterator[T]:
+    """
+    Measure the time spent waiting for the items of an async iterable,
+    excluding the time the consumer spends on each item.
+
+    Args:
+        phase (str): The name of the phase.
+        iterable (AsyncIterable): The iterable, e.g. the agent stream.
+    Returns:
+        AsyncIterator: The items of the iterable.
+    """
+    iterator = aiter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = await anext(iterator)
+            except StopAsyncIteration:
+                break
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        observe(phase, elapsed)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+@contextmanager
+def trace_request(thread_id: str) -> Iterator[dict[str, float]]:
+    """
+    Collect the spans of a request and log their breakdown at the end.
+
+    Nested calls (e.g. the agent stream inside the executor) join the
+    trace of the outer request.
+    Args:
+        thread_id (str): The thread of the request, for the log.
+    Returns:
+        dict[str, float]: The seconds per phase.
+    """
+    trace = _trace.get()
+    if trace is not None:
+        yield trace
+        return
+
+    trace = {}
+    token = _trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        try:
+            _trace.reset(token)
+        except ValueError:
+            # Generator closed from another context
+            _trace.set(None)
+        observe("request", time.perf_counter() - start)
+        logger.info(
+            "Request latency breakdown: "
+            + ", ".join(
+                f"{phase}={seconds:.3f}s"
+                for phase, seconds in sorted(trace.items())
+            ),
+            extra=get_metadata(
+                thread_id=thread_id,
+                metadata={
+                    phase: round(seconds, 6)
+                    for phase, seconds in trace.items()
+                }
+            )
+        )
+
+
+class MetricsCallbackHandler(AsyncCallbackHandler):
+    """
+    Callback handler measuring the LLM calls, the tool calls and the
+    summarization hook of the ReAct loop.
+    """
+
+    def __init__(self):
+        self._started: dict[UUID, tuple[float, str]] = {}
+
+    def _start(self, run_id: UUID, label: str) -> None:
+        """Remember the start of a run."""
+        self._started[run_id] = (time.perf_counter(), label)
+
+    def _stop(self, run_id: UUID) -> tuple[float, str] | None:
+        """Return the duration and the label of a run."""
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return None
+        return time.perf_counter() - started[0], started[1]
+
+    async def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list,
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any
+    ) -> None:
+        model = (metadata or {}).get(
+            "ls_model_name",
+            settings.LLM_MODEL_NAME
+        )
+        self._start(run_id, str(model))
+
+    async def on_llm_start(
+        self,
+        serialized: dict[str, Any],
+        prompts: list[str],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any
+    ) -> None:
+        await self.on_chat_model_start(
+            serialized,
+            [],
+            run_id=run_id,
+            metadata=metadata
+        )
+
+    async def on_llm_end(
+        self,
+        response: LLMResult,
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        stopped = self._stop(run_id)
+        if stopped is None:
+            return
+        seconds, model = stopped
+        LLM_CALL_SECONDS.labels(model, "ok").observe(seconds)
+        observe("llm", seconds)
+        input_tokens, output_tokens = self._get_usage(response)
+        if input_tokens:
+            LLM_TOKENS.labels(model, "input").inc(input_tokens)
+        if output_tokens:
+            LLM_TOKENS.labels(model, "output").inc(output_tokens)
+
+    async def on_llm_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        stopped = self._stop(run_id)
+        if stopped is not None:
+            LLM_CALL_SECONDS.labels(stopped[1], "error").observe(stopped[0])
+            observe("llm", stopped[0])
+
+    @staticmethod
+    def _get_usage(response: LLMResult) -> tuple[int, int]:
+        """Get the input and output tokens of an LLM response."""
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(
+                    getattr(generation, "message", None),
+                    "usage_metadata",
+                    None
+                )
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not input_tokens and not output_tokens:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens = usage.get("prompt_tokens", 0)
+            output_tokens = usage.get("completion_tokens", 0)
+        return input_tokens, output_tokens
+
+    async def on_tool_start(
+        self,
+        serialized: dict[str, Any],
+        input_str: str,
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        self._start(run_id, str(name or "unknown"))
+
+    async def on_tool_end(
+        self,
+        output: Any,
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        stopped = self._stop(run_id)
+        if stopped is not None:
+            TOOL_CALL_SECONDS.labels(stopped[1], "ok").observe(stopped[0])
+            observe("tool", stopped[0])
+
+    async def on_tool_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        stopped = self._stop(run_id)
+        if stopped is not None:
+            TOOL_CALL_SECONDS.labels(stopped[1], "error").observe(stopped[0])
+            observe("tool", stopped[0])
+
+    async def on_chain_start(
+        self,
+        serialized: dict[str, Any],
+        inputs: dict[str, Any],
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any
+    ) -> None:
+        # Only the node of the summarization hook is measured
+        if (
+            kwargs.get("name") == "pre_model_hook"
+            and (metadata or {}).get("langgraph_node") == "pre_model_hook"
+        ):
+            self._start(run_id, "summarization")
+
+    async def on_chain_end(
+        self,
+        outputs: dict[str, Any],
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        stopped = self._stop(run_id)
+        if stopped is not None:
+            observe(stopped[1], stopped[0])
+
+    async def on_chain_error(
+        self,
+        error: BaseException,
+        *,
+        run_id: UUID,
+        **kwargs: Any
+    ) -> None:
+        await self.on_chain_end({}, run_id=run_id)
+
+
+class StatsCollector(Collector):
+    """
+    Exports the counters of the components as gauges.
+
+    A source returns a flat dictionary of numbers, or a dictionary of
+    them keyed by a label value (e.g. the tool name).
+    """
+
+    def __init__(self):
+        self._sources: dict[str, tuple[Callable[[], dict], str | None]] = {}
+        # The pid of the worker, labelling the gauges in multiprocess mode
+        self.worker: str | None = None
+
+    def register(
+        self,
+        name: str,
+        get_stats: Callable[[], dict],
+        label: str | None = None
+    ) -> None:
+        """
+        Register a source of counters.
+
+        Args:
+            name (str): The name of the component, part of the metric
+                names (`kgrag_<name>_<counter>`).
+            get_stats (Callable): Returns the counters.
+            label (str | None): The label of the keys of nested counters.
+        """
+        self._sources[name] = (get_stats, label)
+
+    def collect(self):
+        for name, (get_stats, label) in self._sources.items():
+            try:
+                stats = get_stats()
+            except Exception as e:
+                logger.error(f"Stats of {name} not collected: {e}")
+                continue
+            rows = (
+                stats.items() if label is not None
+                else [(None, stats)]
+            )
+            labels = [label] if label is not None else []
+            worker = [self.worker] if self.worker is not None else []
+            if worker:
+                labels.append("worker")
+            families: dict[str, GaugeMetricFamily] = {}
+            for value, counters in rows:
+                for key, number in counters.items():
+                    if not isinstance(number, (int, float)):
+                        continue
+                    family = families.get(key)
+                    if family is None:
+                        family = families[key] = GaugeMetricFamily(
+                            f"kgrag_{name}_{key}",
+                            f"{key} of the {name}.",
+                            labels=labels
+                        )
+                    family.add_metric(
+                        ([str(value)] if label is not None else []) + worker,
+                        number
+                    )
+            yield from families.values()
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+@cache
+def get_registry() -> CollectorRegistry:
+    """
+    Get the registry served on `/metrics`.
+
+    In multiprocess mode (`PROMETHEUS_MULTIPROC_DIR` set), the histograms
+    and counters are read from the files of every worker, and the
+    counters of the components are tagged with the pid of this worker.
+
+    Returns:
+        CollectorRegistry: The registry.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    stats_collector.worker = str(os.getpid())
+    registry.register(stats_collector)
+    return registry
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    """
+    Serve the metrics in the Prometheus text format.
+    """
+    return Response(
+        generate_latest(get_registry()),
+        media_type=CONTENT_TYPE_LATEST
+    )
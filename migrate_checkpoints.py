@@ -0,0 +1,151 @@
+"""
+Rewrite the existing Redis checkpoints in the compact format.
+
+The checkpointer reads the checkpoints written before the compact format
+as they are, so the migration is optional: it reclaims the memory of the
+checkpoints still alive by compressing them and moving their large message
+bodies to the shared blobs (see `checkpoint_serde`). The expiration of the
+rewritten keys is preserved; the keys written without one get
+`CHECKPOINT_TTL`, so that they do not outlive their blobs.
+
+Usage:
+    python migrate_checkpoints.py --dry-run
+    python migrate_checkpoints.py --host localhost --port 6379 --db 4
+"""
+
+import asyncio
+from dataclasses import dataclass
+import click
+from checkpoint_serde import CompactCheckpointer
+from checkpointer import create_redis_client
+from memory_agent.memory_redis import REDIS_KEY_SEPARATOR
+from config import settings
+
+
+@dataclass
+class MigrationStats:
+    """Counters of a migration."""
+
+    keys: int = 0
+    rewritten: int = 0
+    errors: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+
+async def _scan(checkpointer: CompactCheckpointer, prefix: str) -> list:
+    """Scan the keys with a prefix."""
+    return [
+        key async for key in checkpointer.conn.scan_iter(
+            match=f"{prefix}{REDIS_KEY_SEPARATOR}*",
+            count=1000
+        )
+    ]
+
+
+async def _migrate_key(
+    checkpointer: CompactCheckpointer,
+    key: bytes,
+    field: str,
+    stats: MigrationStats,
+    dry_run: bool
+) -> None:
+    """Re-encode the value stored in a field of a checkpoint hash."""
+    type_, data = await checkpointer.conn.hmget(key, "type", field)
+    if type_ is None or data is None:
+        return
+    stats.keys += 1
+    value = checkpointer.serde.loads_typed((type_.decode(), data))
+    blobs: dict[str, str] = {}
+    if field == "checkpoint":
+        value = checkpointer.blobs.extract_checkpoint(value, blobs)
+    else:
+        value = checkpointer.blobs.extract_writes(
+            [("", value)],
+            blobs
+        )[0][1]
+    new_type, new_data = checkpointer.serde.dumps_typed(value)
+    stats.bytes_before += len(data)
+    stats.bytes_after += len(new_data)
+    if dry_run or (new_type == type_.decode() and new_data == data):
+        return
+    await checkpointer.blobs.write(blobs)
+    # HSET keeps the expiration of the key
+    await checkpointer.conn.hset(
+        key,
+        mapping={"type": new_type, field: new_data}
+    )
+    if (
+        blobs
+        and checkpointer.ttl > 0
+        and await checkpointer.conn.ttl(key) == -1
+    ):
+        # Expire the key before its blobs, written with a longer TTL
+        await checkpointer.conn.expire(key, checkpointer.ttl)
+    stats.rewritten += 1
+
+
+async def migrate(
+    host_persistence_config: dict[str, str | int],
+    dry_run: bool = False
+) -> MigrationStats:
+    """
+    Rewrite every checkpoint and pending write in the compact format.
+
+    Args:
+        host_persistence_config (dict): The Redis configuration with
+            `host`, `port` and `db` keys.
+        dry_run (bool): Only measure the sizes, without writing.
+    Returns:
+        MigrationStats: The counters of the migration.
+    """
+    checkpointer = CompactCheckpointer(
+        create_redis_client(host_persistence_config)
+    )
+    stats = MigrationStats()
+    try:
+        for prefix, field in (("checkpoint", "checkpoint"),
+                              ("writes", "value")):
+            for key in await _scan(checkpointer, prefix):
+                try:
+                    await _migrate_key(
+                        checkpointer,
+                        key,
+                        field,
+                        stats,
+                        dry_run
+                    )
+                except Exception as e:
+                    stats.errors += 1
+                    click.echo(f"{key!r}: {e}", err=True)
+    finally:
+        await checkpointer.conn.aclose()
+    return stats
+
+
+@click.command()
+@click.option('--host', 'host', default=lambda: settings.REDIS_HOST)
+@click.option('--port', 'port', type=int,
+              default=lambda: int(settings.REDIS_PORT))
+@click.option('--db', 'db', type=int, default=lambda: int(settings.REDIS_DB))
+@click.option('--dry-run', is_flag=True, help='Only report the sizes.')
+def main(host, port, db, dry_run):
+    """
+    Migrate the checkpoints of a Redis database.
+    """
+    stats = asyncio.run(
+        migrate({"host": host, "port": port, "db": db}, dry_run)
+    )
+    ratio = (
+        stats.bytes_after / stats.bytes_before if stats.bytes_before
+        else 1.0
+    )
+    click.echo(
+        f"{stats.keys} keys, {stats.rewritten} rewritten, "
+        f"{stats.errors} errors: {stats.bytes_before} -> "
+        f"{stats.bytes_after} bytes ({ratio:.1%}), blobs excluded"
+    )
+
+
+if __name__ == '__main__':
+    main()
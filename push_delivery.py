@@ -0,0 +1,318 @@
+"""
+Queued delivery of the A2A push notifications.
+
+`BasePushNotificationSender` posts every task update to the webhooks
+inline, so the latency of a slow endpoint delayed the event handling of
+the agent. `QueuedPushNotificationSender` only enqueues the update and a
+pool of workers delivers it in background:
+
+- the updates of a task are delivered in order, one at a time; a
+  `working` update still waiting is replaced by the next update of the
+  task, so a slow endpoint only receives the latest state;
+- when `PUSH_QUEUE_SIZE` tasks have pending updates, the `working`
+  updates of the other tasks are shed; the other states (terminal ones,
+  `input-required`, ...) are always queued, so the client learns how its
+  task ended;
+- at most `PUSH_MAX_CONNECTIONS_PER_ENDPOINT` requests are in flight per
+  endpoint, on a shared keep-alive connection pool;
+- failed deliveries (network errors, `429` and `5xx`) are retried
+  `PUSH_RETRIES` times with exponential backoff.
+
+The queue depth and the delivery latency are reported in
+`PushDeliveryStats`.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+import httpx
+from a2a.server.tasks import (
+    PushNotificationConfigStore,
+    PushNotificationSender,
+)
+from a2a.types import PushNotificationConfig, Task, TaskState
+from config import settings
+from log import logger
+
+
+@dataclass
+class PushDeliveryStats:
+    """Counters of the push notification delivery."""
+
+    enqueued: int = 0
+    coalesced: int = 0
+    dropped: int = 0
+    delivered: int = 0
+    failed: int = 0
+    retries: int = 0
+    queue_depth: int = 0
+    latency_total: float = 0.0
+    latency_max: float = 0.0
+
+    @property
+    def latency_mean(self) -> float:
+        """The mean seconds between enqueue and delivery."""
+        return self.latency_total / self.delivered if self.delivered else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+            "queue_depth": self.queue_depth,
+            "latency_mean": self.latency_mean,
+            "latency_max": self.latency_max,
+        }
+
+
+@dataclass
+class _Update:
+    """A task update waiting for delivery."""
+
+    state: TaskState
+    payload: dict
+    enqueued_at: float
+
+
+class QueuedPushNotificationSender(PushNotificationSender):
+    """
+    Push notification sender delivering the task updates in background.
+    """
+
+    def __init__(
+        self,
+        config_store: PushNotificationConfigStore,
+        workers: int | None = None,
+        max_connections_per_endpoint: int | None = None,
+        max_queue: int | None = None,
+        retries: int | None = None,
+        backoff: float | None = None,
+        timeout: float | None = None
+    ):
+        """
+        Initialize the sender; the workers start with the first update.
+
+        Args:
+            config_store (PushNotificationConfigStore): The store of the
+                push notification configs.
+            workers (int | None): The updates delivered at the same time.
+                `PUSH_WORKERS` by default.
+            max_connections_per_endpoint (int | None): The requests in flight
+                per endpoint (scheme, host and port).
+                `PUSH_MAX_CONNECTIONS_PER_ENDPOINT` by default.
+            max_queue (int | None): The tasks with pending updates; `working`
+                updates of other tasks are dropped when full. `PUSH_QUEUE_SIZE`
+                by default.
+            retries (int | None): The retries of a failed delivery.
+                `PUSH_RETRIES` by default.
+            backoff (float | None): The seconds before the first retry, doubled
+                at each retry. `PUSH_RETRY_BACKOFF` by default.
+            timeout (float | None): The timeout of a delivery request.
+                `PUSH_TIMEOUT` by default.
+        """
+        if workers is None:
+            workers = settings.PUSH_WORKERS
+        if max_connections_per_endpoint is None:
+            max_connections_per_endpoint = (
+                settings.PUSH_MAX_CONNECTIONS_PER_ENDPOINT
+            )
+        if max_queue is None:
+            max_queue = settings.PUSH_QUEUE_SIZE
+        if retries is None:
+            retries = settings.PUSH_RETRIES
+        if backoff is None:
+            backoff = settings.PUSH_RETRY_BACKOFF
+        if timeout is None:
+            timeout = settings.PUSH_TIMEOUT
+        self.config_store = config_store
+        self.workers = max(1, workers)
+        self.max_connections_per_endpoint = max(
+            1, max_connections_per_endpoint
+        )
+        self.max_queue = max(1, max_queue)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.stats = PushDeliveryStats()
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=(
+                    self.workers * self.max_connections_per_endpoint
+                ),
+                max_keepalive_connections=self.workers
+            )
+        )
+        # Pending updates by task; a task is in the queue, or being
+        # delivered, as long as it has an entry
+        self._pending: dict[str, deque[_Update]] = {}
+        self._queue: asyncio.Queue[str] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._endpoints: dict[str, asyncio.Semaphore] = {}
+
+    def _start(self) -> asyncio.Queue[str]:
+        """Start the workers in the running event loop, once."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [
+                asyncio.create_task(
+                    self._work(),
+                    name=f"push-delivery-{i}"
+                )
+                for i in range(self.workers)
+            ]
+        return self._queue
+
+    async def send_notification(self, task: Task) -> None:
+        """
+        Enqueue the latest state of a task for delivery.
+
+        Args:
+            task (Task): The task.
+        """
+        queue = self._start()
+        # The task is serialized now: the handler keeps updating it
+        update = _Update(
+            state=task.status.state,
+            payload=task.model_dump(mode='json', exclude_none=True),
+            enqueued_at=time.monotonic()
+        )
+        pending = self._pending.get(task.id)
+        if pending is None:
+            if (
+                len(self._pending) >= self.max_queue
+                and update.state == TaskState.working
+            ):
+                # Only the progress is shed: the next state of the task
+                # is queued anyway
+                self.stats.dropped += 1
+                logger.warning(
+                    f"Push queue full: update of task {task.id} dropped"
+                )
+                return
+            self._pending[task.id] = deque([update])
+            queue.put_nowait(task.id)
+            self.stats.queue_depth += 1
+        elif pending and pending[-1].state == TaskState.working:
+            # Only the latest progress of a task is worth delivering
+            pending[-1] = update
+            self.stats.coalesced += 1
+        else:
+            pending.append(update)
+            self.stats.queue_depth += 1
+        self.stats.enqueued += 1
+
+    async def _work(self) -> None:
+        """Deliver the updates of the queued tasks."""
+        assert self._queue is not None
+        while True:
+            task_id = await self._queue.get()
+            pending = self._pending.get(task_id)
+            if not pending:
+                self._pending.pop(task_id, None)
+                continue
+            update = pending.popleft()
+            self.stats.queue_depth -= 1
+            try:
+                await self._deliver(task_id, update)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats.failed += 1
+                logger.error(
+                    f"Push notification of task {task_id} failed: {e}"
+                )
+            if pending:
+                # Next update of the task, after the other tasks
+                self._queue.put_nowait(task_id)
+            else:
+                del self._pending[task_id]
+
+    def _get_endpoint(self, url: str) -> asyncio.Semaphore:
+        """Return the semaphore limiting the requests to an endpoint."""
+        parts = urlsplit(url)
+        endpoint = f"{parts.scheme}://{parts.netloc}"
+        semaphore = self._endpoints.get(endpoint)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_connections_per_endpoint)
+            self._endpoints[endpoint] = semaphore
+        return semaphore
+
+    async def _deliver(self, task_id: str, update: _Update) -> None:
+        """Post an update to every webhook of the task."""
+        push_configs = await self.config_store.get_info(task_id)
+        if not push_configs:
+            return
+        results = await asyncio.gather(*[
+            self._post(task_id, update, push_config)
+            for push_config in push_configs
+        ])
+        if any(results):
+            latency = time.monotonic() - update.enqueued_at
+            self.stats.delivered += 1
+            self.stats.latency_total += latency
+            self.stats.latency_max = max(self.stats.latency_max, latency)
+        if not all(results):
+            self.stats.failed += 1
+
+    async def _post(
+        self,
+        task_id: str,
+        update: _Update,
+        push_config: PushNotificationConfig
+    ) -> bool:
+        """Post an update to a webhook, with retries."""
+        headers = None
+        if push_config.token:
+            headers = {'X-A2A-Notification-Token': push_config.token}
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats.retries += 1
+                delay = self.backoff * 2 ** (attempt - 1)
+                await asyncio.sleep(delay * (0.5 + random.random()))
+            try:
+                async with self._get_endpoint(push_config.url):
+                    response = await self.client.post(
+                        push_config.url,
+                        json=update.payload,
+                        headers=headers
+                    )
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+                continue
+            if response.status_code < 400:
+                return True
+            error = f"HTTP {response.status_code}"
+            if response.status_code != 429 and response.status_code < 500:
+                break
+        logger.warning(
+            f"Push notification of task {task_id} to {push_config.url} "
+            f"failed: {error}"
+        )
+        return False
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """
+        Deliver the pending updates for up to `timeout` seconds, then stop
+        the workers and close the connection pool.
+        """
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for worker in self._workers:
+            worker.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        if self._pending:
+            self.stats.dropped += sum(map(len, self._pending.values()))
+            self._pending.clear()
+            self.stats.queue_depth = 0
+        await self.client.aclose()
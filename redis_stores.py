@@ -0,0 +1,400 @@
+"""
+Redis-backed stores and event queues of the A2A tasks.
+
+The in-memory stores and queue manager of the A2A SDK keep the tasks and
+their events in the process that created them, so with more than one
+worker (or replica) a `tasks/get`, a push config lookup or a
+`tasks/resubscribe` routed to another process does not find the task.
+The classes below share them through Redis, with every process connected
+to the `REDIS_*` database:
+
+- `RedisTaskStore` stores each task as JSON under `kgrag:task:<id>`;
+- `RedisPushNotificationConfigStore` stores the configs of a task in the
+  hash `kgrag:push:<id>`, one field per config id;
+- `RedisQueueManager` publishes the events of the tasks running in the
+  worker on the channel `kgrag:events:<id>`, marked as running by the
+  key `kgrag:queue:<id>`: a resubscribe reaching another worker taps the
+  channel and receives the next events of the task.
+
+They expire their keys `TASK_STORE_TTL` seconds after the last update.
+"""
+
+import asyncio
+import json
+from a2a.server.events import (
+    Event,
+    EventQueue,
+    NoTaskQueue,
+    QueueManager,
+    TaskQueueExists,
+)
+from a2a.server.tasks import PushNotificationConfigStore, TaskStore
+from a2a.types import (
+    Message,
+    PushNotificationConfig,
+    Task,
+    TaskArtifactUpdateEvent,
+    TaskStatusUpdateEvent,
+)
+from redis.asyncio import Redis
+from redis.asyncio.client import PubSub
+from redis.exceptions import RedisError
+from config import settings
+from log import logger
+
+TASK_PREFIX = "kgrag:task:"
+PUSH_CONFIG_PREFIX = "kgrag:push:"
+QUEUE_PREFIX = "kgrag:queue:"
+EVENT_CHANNEL_PREFIX = "kgrag:events:"
+# Published on the channel of a task when its queue is closed
+CLOSE_EVENT = "close"
+EVENT_TYPES: dict[str, type[Event]] = {
+    "message": Message,
+    "task": Task,
+    "status-update": TaskStatusUpdateEvent,
+    "artifact-update": TaskArtifactUpdateEvent,
+}
+
+
+class RedisTaskStore(TaskStore):
+    """
+    Task store shared by every worker through Redis.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: int | None = None,
+        prefix: str = TASK_PREFIX
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            redis (Redis): The Redis client.
+            ttl (int | None): Seconds a task is kept after its last update (`0`
+                disables the expiration). `TASK_STORE_TTL` by default.
+            prefix (str): The prefix of the keys.
+        """
+        ttl = settings.TASK_STORE_TTL if ttl is None else ttl
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_key(self, task_id: str) -> str:
+        """Return the Redis key of a task."""
+        return f"{self.prefix}{task_id}"
+
+    async def save(self, task: Task) -> None:
+        await self.redis.set(
+            self.get_key(task.id),
+            task.model_dump_json(exclude_none=True),
+            ex=self.ttl if self.ttl > 0 else None
+        )
+
+    async def get(self, task_id: str) -> Task | None:
+        data = await self.redis.get(self.get_key(task_id))
+        if data is None:
+            return None
+        try:
+            return Task.model_validate_json(data)
+        except ValueError as e:
+            logger.error(f"Invalid task {task_id} in Redis: {e}")
+            return None
+
+    async def delete(self, task_id: str) -> None:
+        await self.redis.delete(self.get_key(task_id))
+
+
+class RedisPushNotificationConfigStore(PushNotificationConfigStore):
+    """
+    Push notification config store shared by every worker through Redis.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: int | None = None,
+        prefix: str = PUSH_CONFIG_PREFIX
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            redis (Redis): The Redis client.
+            ttl (int | None): Seconds the configs of a task are kept after
+                their last update (`0` disables the expiration).
+                `TASK_STORE_TTL` by default.
+            prefix (str): The prefix of the keys.
+        """
+        ttl = settings.TASK_STORE_TTL if ttl is None else ttl
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get_key(self, task_id: str) -> str:
+        """Return the Redis key of the configs of a task."""
+        return f"{self.prefix}{task_id}"
+
+    async def set_info(
+        self,
+        task_id: str,
+        notification_config: PushNotificationConfig
+    ) -> None:
+        if notification_config.id is None:
+            notification_config.id = task_id
+        key = self.get_key(task_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                key,
+                notification_config.id,
+                notification_config.model_dump_json(exclude_none=True)
+            )
+            if self.ttl > 0:
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def get_info(self, task_id: str) -> list[PushNotificationConfig]:
+        configs = []
+        for data in await self.redis.hvals(self.get_key(task_id)):
+            try:
+                configs.append(
+                    PushNotificationConfig.model_validate_json(data)
+                )
+            except ValueError as e:
+                logger.error(
+                    f"Invalid push config of task {task_id} in Redis: {e}"
+                )
+        return configs
+
+    async def delete_info(
+        self,
+        task_id: str,
+        config_id: str | None = None
+    ) -> None:
+        await self.redis.hdel(self.get_key(task_id), config_id or task_id)
+
+
+def parse_event(data: bytes | str) -> Event | None:
+    """
+    Parse an event published on the channel of a task.
+
+    Args:
+        data (bytes | str): The JSON of the event.
+    Returns:
+        Event | None: The event, None if it is not valid.
+    """
+    try:
+        payload = json.loads(data)
+        return EVENT_TYPES[payload["kind"]].model_validate(payload)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Invalid event in Redis: {e}")
+        return None
+
+
+class PublishingEventQueue(EventQueue):
+    """
+    Event queue of a task running in the worker, publishing its events on
+    the channel of the task for the taps of the other workers.
+    """
+
+    def __init__(self, redis: Redis, key: str, channel: str):
+        """
+        Initialize the queue.
+
+        Args:
+            redis (Redis): The Redis client.
+            key (str): The key marking the task as running.
+            channel (str): The channel of the events of the task.
+        """
+        super().__init__()
+        self.redis = redis
+        self.key = key
+        self.channel = channel
+
+    async def publish(self, data: str) -> None:
+        """Publish on the channel; the local consumers are not affected."""
+        try:
+            await self.redis.publish(self.channel, data)
+        except RedisError as e:
+            logger.warning(f"Cannot publish on {self.channel}: {e}")
+
+    async def enqueue_event(self, event: Event) -> None:
+        if self.is_closed():
+            return
+        await super().enqueue_event(event)
+        await self.publish(event.model_dump_json(exclude_none=True))
+
+    async def close(self) -> None:
+        if not self.is_closed():
+            # The key goes first: a tap subscribing after the close
+            # finds no key instead of waiting for the close event
+            try:
+                await self.redis.delete(self.key)
+            except RedisError as e:
+                logger.warning(f"Cannot delete {self.key}: {e}")
+            await self.publish(CLOSE_EVENT)
+        await super().close()
+
+
+class RedisQueueManager(QueueManager):
+    """
+    Queue manager sharing the events of the tasks across workers through
+    Redis.
+
+    The queues of the tasks running in the worker are kept in process,
+    like `InMemoryQueueManager`, and publish their events; a tap of a task
+    running in another worker subscribes to its channel and receives the
+    events published from then on, until the task closes its queue.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        ttl: int | None = None,
+        prefix: str = QUEUE_PREFIX,
+        channel_prefix: str = EVENT_CHANNEL_PREFIX
+    ):
+        """
+        Initialize the manager.
+
+        Args:
+            redis (Redis): The Redis client.
+            ttl (int | None): Seconds a task is considered running when
+                its worker stops without closing its queue (`0` disables
+                the expiration). `TASK_STORE_TTL` by default.
+            prefix (str): The prefix of the keys of the running tasks.
+            channel_prefix (str): The prefix of the channels of the
+                events.
+        """
+        ttl = settings.TASK_STORE_TTL if ttl is None else ttl
+        self.redis = redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self.channel_prefix = channel_prefix
+        self._queues: dict[str, EventQueue] = {}
+        self._lock = asyncio.Lock()
+        self._forwarders: set[asyncio.Task] = set()
+
+    def get_key(self, task_id: str) -> str:
+        """Return the Redis key marking a task as running."""
+        return f"{self.prefix}{task_id}"
+
+    def get_channel(self, task_id: str) -> str:
+        """Return the Redis channel of the events of a task."""
+        return f"{self.channel_prefix}{task_id}"
+
+    async def add(self, task_id: str, queue: EventQueue) -> None:
+        """
+        Add the queue of a task; the events of a queue not created by
+        the manager are not published to the other workers.
+
+        Raises:
+            TaskQueueExists: If the task already has a queue.
+        """
+        async with self._lock:
+            if task_id in self._queues:
+                raise TaskQueueExists
+            self._queues[task_id] = queue
+
+    async def get(self, task_id: str) -> EventQueue | None:
+        async with self._lock:
+            return self._queues.get(task_id)
+
+    async def tap(self, task_id: str) -> EventQueue | None:
+        async with self._lock:
+            if task_id in self._queues:
+                return self._queues[task_id].tap()
+        return await self._tap_remote(task_id)
+
+    async def close(self, task_id: str) -> None:
+        """
+        Close and remove the queue of a task running in the worker.
+
+        Raises:
+            NoTaskQueue: If the task has no queue in the worker.
+        """
+        async with self._lock:
+            if task_id not in self._queues:
+                raise NoTaskQueue
+            queue = self._queues.pop(task_id)
+        await queue.close()
+
+    async def create_or_tap(self, task_id: str) -> EventQueue:
+        async with self._lock:
+            if task_id in self._queues:
+                return self._queues[task_id].tap()
+            key = self.get_key(task_id)
+            queue = PublishingEventQueue(
+                self.redis,
+                key,
+                self.get_channel(task_id)
+            )
+            self._queues[task_id] = queue
+        try:
+            await self.redis.set(
+                key,
+                1,
+                ex=self.ttl if self.ttl > 0 else None
+            )
+        except RedisError as e:
+            logger.warning(f"Cannot mark task {task_id} as running: {e}")
+        return queue
+
+    async def _tap_remote(self, task_id: str) -> EventQueue | None:
+        """
+        Tap the queue of a task running in another worker.
+
+        Returns:
+            EventQueue | None: The queue receiving the next events of the
+                task, None if the task is not running.
+        """
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Subscribe before checking the key, so the close event of a
+            # task still running is not missed
+            await pubsub.subscribe(self.get_channel(task_id))
+            running = await self.redis.exists(self.get_key(task_id))
+        except RedisError as e:
+            logger.warning(f"Cannot tap the events of task {task_id}: {e}")
+            running = False
+        if not running:
+            await pubsub.aclose()
+            return None
+        queue = EventQueue()
+        forwarder = asyncio.create_task(
+            self._forward(task_id, pubsub, queue),
+            name=f"task-events-{task_id}"
+        )
+        self._forwarders.add(forwarder)
+        forwarder.add_done_callback(self._forwarders.discard)
+        return queue
+
+    async def _forward(
+        self,
+        task_id: str,
+        pubsub: PubSub,
+        queue: EventQueue
+    ) -> None:
+        """Copy the events published for a task into a local queue."""
+        try:
+            async for message in pubsub.listen():
+                data = message["data"]
+                if isinstance(data, bytes):
+                    data = data.decode("utf-8")
+                if data == CLOSE_EVENT:
+                    break
+                event = parse_event(data)
+                if event is not None:
+                    await queue.enqueue_event(event)
+        except RedisError as e:
+            logger.warning(f"Events of task {task_id} interrupted: {e}")
+        finally:
+            await pubsub.aclose()
+            await queue.close()
+
+    async def shutdown(self) -> None:
+        """Stop forwarding the events of the other workers."""
+        for forwarder in list(self._forwarders):
+            forwarder.cancel()
+        await asyncio.gather(*self._forwarders, return_exceptions=True)
@@ -0,0 +1,230 @@
+"""
+Exact-match cache of the agent responses.
+
+Identical prompts (dashboards, retries after client timeouts) used to
+re-run the whole agent. Responses are cached under a key made of the
+normalized prompt, the LLM model, the version of the MCP tool catalog,
+the data collection the request queries and a digest of the conversation
+before the prompt, so a follow-up is only answered from a thread with the
+same history, in two tiers:
+
+- a bounded in-process LRU, answering without any network round trip;
+- a shared Redis tier on the `REDIS_*` settings, so that every worker
+  benefits from the answers computed by the others.
+
+An entry is the list of results yielded by `KGragAgent.stream`, so a
+cached answer is replayed with the same event shape as a live one.
+"""
+
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Sequence
+from langchain_core.messages import BaseMessage
+from redis.asyncio import Redis
+from log import logger
+from config import settings
+
+KEY_PREFIX = "kgrag:response:"
+
+
+@dataclass
+class ResponseCacheStats:
+    """Counters of the response cache."""
+
+    local_hits: int = 0
+    redis_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    errors: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """The fraction of lookups answered from either tier."""
+        hits = self.local_hits + self.redis_hits
+        total = hits + self.misses
+        return hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "errors": self.errors,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class ResponseCache:
+    """
+    Two-tier (in-process LRU and Redis) exact-match response cache.
+
+    Redis failures are logged and counted but never raised: the cache
+    then behaves as a local-only cache.
+    """
+
+    def __init__(
+        self,
+        redis: Redis | None = None,
+        max_size: int | None = None,
+        ttl: int | None = None,
+        enabled: bool | None = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            redis (Redis | None): The client of the shared tier; only the
+                local tier is used when it is not provided.
+            max_size (int | None): The number of entries of the local tier.
+                `RESPONSE_CACHE_SIZE` by default.
+            ttl (int | None): Seconds an entry is served. `RESPONSE_CACHE_TTL`
+                by default.
+            enabled (bool | None): Whether lookups and stores are performed.
+                `RESPONSE_CACHE_ENABLED` by default.
+        """
+        if max_size is None:
+            max_size = settings.RESPONSE_CACHE_SIZE
+        if ttl is None:
+            ttl = settings.RESPONSE_CACHE_TTL
+        if enabled is None:
+            enabled = settings.RESPONSE_CACHE_ENABLED
+        self.redis = redis
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.enabled = enabled
+        self.stats = ResponseCacheStats()
+        self._entries: OrderedDict[
+            str, tuple[float, list[dict[str, Any]]]
+        ] = OrderedDict()
+
+    @staticmethod
+    def get_key(
+        prompt: str,
+        tools_version: str | None,
+        history: Sequence[BaseMessage] = (),
+        collection: str = ""
+    ) -> str:
+        """
+        Build the cache key of a prompt.
+
+        Args:
+            prompt (str): The user prompt.
+            tools_version (str | None): The version of the tool catalog.
+            history (Sequence[BaseMessage]): The messages of the thread
+                before the prompt, empty on its first turn.
+            collection (str): The data collection the request queries.
+        Returns:
+            str: The hex digest identifying the response.
+        """
+        normalized = " ".join(prompt.split()).lower()
+        context = hashlib.sha256(
+            json.dumps(
+                [[message.type, message.content] for message in history],
+                default=str
+            ).encode("utf-8")
+        ).hexdigest() if history else ""
+        raw = json.dumps([
+            normalized,
+            settings.LLM_MODEL_NAME,
+            tools_version or "",
+            context,
+            collection
+        ])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _set_local(self, key: str, results: list[dict[str, Any]]) -> None:
+        """Insert an entry in the LRU, evicting the oldest one."""
+        self._entries[key] = (time.monotonic() + self.ttl, results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> list[dict[str, Any]] | None:
+        """
+        Get the recorded results of a response.
+
+        Args:
+            key (str): The key built by `get_key`.
+        Returns:
+            list[dict] | None: The results, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, results = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats.local_hits += 1
+                return results
+            del self._entries[key]
+
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(KEY_PREFIX + key)
+            except Exception as e:
+                self.stats.errors += 1
+                logger.warning(f"Response cache lookup failed: {e}")
+                raw = None
+            if raw is not None:
+                try:
+                    results = json.loads(raw)
+                except ValueError as e:
+                    self.stats.errors += 1
+                    logger.warning(f"Invalid response cache entry: {e}")
+                else:
+                    self._set_local(key, results)
+                    self.stats.redis_hits += 1
+                    return results
+
+        self.stats.misses += 1
+        return None
+
+    async def set(self, key: str, results: list[dict[str, Any]]) -> None:
+        """
+        Store the recorded results of a response in both tiers.
+
+        Args:
+            key (str): The key built by `get_key`.
+            results (list[dict]): The results yielded by the agent.
+        """
+        if not self.enabled or not results:
+            return
+        self._set_local(key, results)
+        self.stats.stores += 1
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(
+                KEY_PREFIX + key,
+                json.dumps(results),
+                ex=self.ttl
+            )
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning(f"Response cache store failed: {e}")
+
+    async def clear(self) -> None:
+        """Drop every entry of both tiers, e.g. after new data is ingested."""
+        self._entries.clear()
+        if self.redis is None:
+            return
+        try:
+            keys = [
+                key
+                async for key in self.redis.scan_iter(
+                    match=f"{KEY_PREFIX}*",
+                    count=500
+                )
+            ]
+            for i in range(0, len(keys), 500):
+                await self.redis.unlink(*keys[i:i + 500])
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning(f"Response cache clear failed: {e}")
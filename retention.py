@@ -0,0 +1,377 @@
+"""
+Retention of the Redis checkpoints.
+
+Every request used to scan and delete the checkpoints of its thread
+(`adelete_by_thread_id`) before running the agent, paying a `KEYS` scan
+and several round trips in the latency path. Retention is now enforced
+out of band:
+
+- `RetentionCheckpointer` writes every checkpoint and pending-writes key
+  with a Redis expiration (`CHECKPOINT_TTL`), so idle threads vanish on
+  their own;
+- `CheckpointSweeper` runs in background every
+  `CHECKPOINT_SWEEP_INTERVAL` seconds and enforces the per-thread limits:
+  at most `CHECKPOINT_MAX_PER_THREAD` checkpoints, none older than
+  `CHECKPOINT_MAX_AGE`, and an expiration on keys written without one
+  (e.g. before this change), message blobs included (see
+  `checkpoint_serde`). Only one worker sweeps at a time.
+
+The work done by the sweeper is reported in `SweepStats`.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+)
+from memory_agent import MemoryCheckpointer
+from memory_agent.memory_redis import (
+    REDIS_KEY_SEPARATOR,
+    _make_redis_checkpoint_key,
+    _make_redis_checkpoint_writes_key,
+    _parse_configurable,
+)
+from redis.asyncio import Redis
+from config import settings
+from log import logger
+
+# 100-ns intervals between the UUID epoch and the Unix epoch
+UUID_EPOCH_OFFSET = 0x01B21DD213814000
+SWEEPER_LOCK_KEY = "kgrag:checkpoint_sweeper"
+BATCH_SIZE = 500
+
+
+def get_checkpoint_time(checkpoint_id: str) -> float | None:
+    """
+    Get the creation time of a checkpoint from its id.
+
+    LangGraph checkpoint ids are time-ordered UUIDv6.
+    Args:
+        checkpoint_id (str): The checkpoint id.
+    Returns:
+        float | None: The Unix timestamp, or None if the id is not a
+            UUIDv6.
+    """
+    try:
+        value = uuid.UUID(checkpoint_id)
+    except ValueError:
+        return None
+    if value.version != 6:
+        return None
+    timestamp = ((value.int >> 80) << 12) | ((value.int >> 64) & 0x0FFF)
+    return (timestamp - UUID_EPOCH_OFFSET) / 1e7
+
+
+class RetentionCheckpointer(MemoryCheckpointer):
+    """
+    `MemoryCheckpointer` writing its keys with an expiration.
+    """
+
+    def __init__(self, conn: Redis, ttl: int | None = None):
+        """
+        Initialize the checkpointer.
+
+        Args:
+            conn (Redis): The Redis client.
+            ttl (int | None): Seconds a checkpoint is kept after being written
+                (`0` disables the expiration). `CHECKPOINT_TTL` by default.
+        """
+        ttl = settings.CHECKPOINT_TTL if ttl is None else ttl
+        super().__init__(conn)
+        self.ttl = ttl
+
+    async def _expire(self, keys: list[str]) -> None:
+        """Set the expiration of the given keys in one round trip."""
+        if self.ttl <= 0 or not keys:
+            return
+        async with self.conn.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        next_config = await super().aput(
+            config,
+            checkpoint,
+            metadata,
+            new_versions
+        )
+        thread_id, checkpoint_ns, _ = _parse_configurable(config)
+        await self._expire([
+            _make_redis_checkpoint_key(
+                thread_id,
+                checkpoint_ns,
+                checkpoint["id"]
+            )
+        ])
+        return next_config
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: Optional[str] = None,
+    ):
+        await super().aput_writes(config, writes, task_id, task_path)
+        thread_id, checkpoint_ns, checkpoint_id = _parse_configurable(config)
+        await self._expire(list({
+            _make_redis_checkpoint_writes_key(
+                thread_id,
+                checkpoint_ns,
+                str(checkpoint_id),
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+            )
+            for idx, (channel, _) in enumerate(writes)
+        }))
+
+
+@dataclass
+class SweepStats:
+    """Counters of the checkpoint sweeper."""
+
+    sweeps: int = 0
+    skipped: int = 0
+    keys_scanned: int = 0
+    checkpoints_deleted: int = 0
+    writes_deleted: int = 0
+    expirations_set: int = 0
+    errors: int = 0
+    last_duration: float = 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "sweeps": self.sweeps,
+            "skipped": self.skipped,
+            "keys_scanned": self.keys_scanned,
+            "checkpoints_deleted": self.checkpoints_deleted,
+            "writes_deleted": self.writes_deleted,
+            "expirations_set": self.expirations_set,
+            "errors": self.errors,
+            "last_duration": self.last_duration,
+        }
+
+
+class CheckpointSweeper:
+    """
+    Background task enforcing the per-thread checkpoint limits.
+    """
+
+    def __init__(
+        self,
+        conn: Redis,
+        interval: float | None = None,
+        max_per_thread: int | None = None,
+        max_age: float | None = None,
+        ttl: int | None = None,
+        blob_prefix: str | None = None,
+        blob_ttl: int = 0
+    ):
+        """
+        Initialize the sweeper.
+
+        Args:
+            conn (Redis): The Redis client of the checkpointer.
+            interval (float | None): Seconds between two sweeps.
+                `CHECKPOINT_SWEEP_INTERVAL` by default.
+            max_per_thread (int | None): The checkpoints kept per thread (`0`
+                for no limit). `CHECKPOINT_MAX_PER_THREAD` by default.
+            max_age (float | None): Seconds after which a checkpoint is deleted
+                (`0` for no limit). `CHECKPOINT_MAX_AGE` by default.
+            ttl (int | None): The expiration set on keys written without one.
+                `CHECKPOINT_TTL` by default.
+            blob_prefix (str | None): The key prefix of the message
+                blobs, None if the checkpointer stores none.
+            blob_ttl (int): The expiration set on blobs written without
+                one.
+        """
+        if interval is None:
+            interval = settings.CHECKPOINT_SWEEP_INTERVAL
+        if max_per_thread is None:
+            max_per_thread = settings.CHECKPOINT_MAX_PER_THREAD
+        if max_age is None:
+            max_age = settings.CHECKPOINT_MAX_AGE
+        if ttl is None:
+            ttl = settings.CHECKPOINT_TTL
+        self.conn = conn
+        self.interval = interval
+        self.max_per_thread = max_per_thread
+        self.max_age = max_age
+        self.ttl = ttl
+        self.blob_prefix = blob_prefix
+        self.blob_ttl = blob_ttl
+        self.stats = SweepStats()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """
+        Start the sweeper in the running event loop, once; nothing is
+        done when called outside of an event loop.
+        """
+        if self.interval <= 0:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(
+                self._run(),
+                name="checkpoint-sweeper"
+            )
+
+    async def stop(self) -> None:
+        """Stop the sweeper."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self) -> None:
+        """Sweep every `interval` seconds."""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # A single worker sweeps in each interval
+                acquired = await self.conn.set(
+                    SWEEPER_LOCK_KEY,
+                    "1",
+                    nx=True,
+                    ex=max(1, int(self.interval))
+                )
+                if not acquired:
+                    self.stats.skipped += 1
+                    continue
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats.errors += 1
+                logger.error(f"Checkpoint sweep failed: {e}")
+
+    async def _scan(self, pattern: str) -> list[str]:
+        """Scan the keys matching a pattern."""
+        keys = []
+        async for key in self.conn.scan_iter(match=pattern, count=1000):
+            keys.append(key.decode() if isinstance(key, bytes) else key)
+        self.stats.keys_scanned += len(keys)
+        return keys
+
+    async def _delete(self, keys: list[str]) -> None:
+        """Unlink keys in batches."""
+        for i in range(0, len(keys), BATCH_SIZE):
+            await self.conn.unlink(*keys[i:i + BATCH_SIZE])
+
+    async def _set_missing_expirations(
+        self,
+        keys: list[str],
+        ttl: int | None = None
+    ) -> None:
+        """Set the expiration of the keys written without one."""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        for i in range(0, len(keys), BATCH_SIZE):
+            batch = keys[i:i + BATCH_SIZE]
+            async with self.conn.pipeline(transaction=False) as pipe:
+                for key in batch:
+                    pipe.ttl(key)
+                ttls = await pipe.execute()
+            missing = [key for key, ttl in zip(batch, ttls) if ttl == -1]
+            if not missing:
+                continue
+            async with self.conn.pipeline(transaction=False) as pipe:
+                for key in missing:
+                    pipe.expire(key, ttl)
+                await pipe.execute()
+            self.stats.expirations_set += len(missing)
+
+    async def sweep(self) -> None:
+        """Run one sweep over every thread."""
+        started = time.monotonic()
+        now = time.time()
+
+        checkpoints: dict[tuple[str, str], list[tuple[str, str]]] = (
+            defaultdict(list)
+        )
+        for key in await self._scan(f"checkpoint{REDIS_KEY_SEPARATOR}*"):
+            parts = key.split(REDIS_KEY_SEPARATOR)
+            if len(parts) != 4:
+                continue
+            _, thread_id, checkpoint_ns, checkpoint_id = parts
+            checkpoints[(thread_id, checkpoint_ns)].append(
+                (checkpoint_id, key)
+            )
+
+        writes: dict[tuple[str, str, str], list[str]] = defaultdict(list)
+        for key in await self._scan(f"writes{REDIS_KEY_SEPARATOR}*"):
+            parts = key.split(REDIS_KEY_SEPARATOR)
+            if len(parts) < 5:
+                continue
+            writes[(parts[1], parts[2], parts[3])].append(key)
+
+        expired: list[str] = []
+        expired_writes: list[str] = []
+        kept: list[str] = []
+        for (thread_id, checkpoint_ns), items in checkpoints.items():
+            # Checkpoint ids are time-ordered: newest first
+            items.sort(reverse=True)
+            for position, (checkpoint_id, key) in enumerate(items):
+                created_at = get_checkpoint_time(checkpoint_id)
+                too_many = (
+                    self.max_per_thread > 0
+                    and position >= self.max_per_thread
+                )
+                too_old = (
+                    self.max_age > 0
+                    and created_at is not None
+                    and now - created_at > self.max_age
+                )
+                if too_many or too_old:
+                    expired.append(key)
+                    expired_writes.extend(
+                        writes.pop(
+                            (thread_id, checkpoint_ns, checkpoint_id), []
+                        )
+                    )
+                else:
+                    kept.append(key)
+
+        await self._delete(expired)
+        await self._delete(expired_writes)
+        await self._set_missing_expirations(
+            kept + [key for keys in writes.values() for key in keys]
+        )
+        if self.blob_prefix and self.blob_ttl > 0:
+            await self._set_missing_expirations(
+                await self._scan(f"{self.blob_prefix}*"),
+                self.blob_ttl
+            )
+
+        self.stats.sweeps += 1
+        self.stats.checkpoints_deleted += len(expired)
+        self.stats.writes_deleted += len(expired_writes)
+        self.stats.last_duration = time.monotonic() - started
+        if expired:
+            logger.info(
+                f"Checkpoint sweep: {len(expired)} checkpoints and "
+                f"{len(expired_writes)} writes deleted in "
+                f"{self.stats.last_duration:.2f}s"
+            )
@@ -0,0 +1,334 @@
+"""
+Semantic cache of the agent answers.
+
+Near-identical questions ("key points of the 2023 risk report") would
+otherwise each run a full ReAct loop with several LLM round trips. The
+cache embeds the prompt with the same embedding model used by the agent
+memory (`MODEL_EMBEDDING`) and stores prompt and answer in Qdrant
+(`QDRANT_URL`); a new prompt whose cosine similarity with a stored one is
+above `SEMANTIC_CACHE_THRESHOLD` gets the stored answer back.
+
+Only the first turn of a conversation is looked up and stored: the
+answer to a follow-up ("and the second one?") depends on the history of
+its thread, while its prompt is similar to many unrelated ones.
+
+Entries expire after `SEMANTIC_CACHE_TTL` seconds and are scoped by the
+data collection the request queries (the `collection` metadata of the A2A
+message, `COLLECTION_NAME` by default): a lookup only matches answers of
+the same collection, and ingesting new data in a collection (the
+collection argument of the ingestion tool call) invalidates only the
+answers computed on it.
+"""
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any
+from qdrant_client import models
+from memory_agent import MemoryPersistence
+from log import logger
+from config import settings
+
+
+@dataclass
+class SemanticCacheStats:
+    """Counters of the semantic cache."""
+
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    invalidations: int = 0
+    errors: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        """The fraction of lookups answered from the cache."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the counters as a plain dictionary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "hit_ratio": self.hit_ratio,
+        }
+
+
+class SemanticCache:
+    """
+    Qdrant-backed cache of answers keyed by prompt similarity.
+
+    Failures of Qdrant or of the embedding model are logged and counted
+    but never raised: a broken cache only means a cache miss.
+    """
+
+    def __init__(
+        self,
+        memory_store: MemoryPersistence,
+        collection_name: str | None = None,
+        threshold: float | None = None,
+        ttl: float | None = None,
+        enabled: bool | None = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            memory_store (MemoryPersistence): The memory of the agent,
+                providing the embedding model and the Qdrant client.
+            collection_name (str | None): The Qdrant collection of the cache.
+                `SEMANTIC_CACHE_COLLECTION` by default.
+            threshold (float | None): The minimum cosine similarity of a hit.
+                `SEMANTIC_CACHE_THRESHOLD` by default.
+            ttl (float | None): Seconds an answer is served from the cache.
+                `SEMANTIC_CACHE_TTL` by default.
+            enabled (bool | None): Whether lookups and stores are performed.
+                `SEMANTIC_CACHE_ENABLED` by default.
+        """
+        if collection_name is None:
+            collection_name = settings.SEMANTIC_CACHE_COLLECTION
+        if threshold is None:
+            threshold = settings.SEMANTIC_CACHE_THRESHOLD
+        if ttl is None:
+            ttl = settings.SEMANTIC_CACHE_TTL
+        if enabled is None:
+            enabled = settings.SEMANTIC_CACHE_ENABLED
+        self.memory_store = memory_store
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.enabled = enabled
+        self.stats = SemanticCacheStats()
+        self._ready = False
+        self._lock = asyncio.Lock()
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _normalize(prompt: str) -> str:
+        """Normalize case and whitespace of a prompt."""
+        return " ".join(prompt.lower().split())
+
+    def _get_filter(self, scope: str) -> models.Filter:
+        """
+        Build the filter matching the live entries of a scope.
+
+        Args:
+            scope (str): The data collection the answers refer to.
+        """
+        return models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="scope",
+                    match=models.MatchValue(value=scope)
+                ),
+                models.FieldCondition(
+                    key="model",
+                    match=models.MatchValue(value=settings.LLM_MODEL_NAME)
+                ),
+                models.FieldCondition(
+                    key="created_at",
+                    range=models.Range(gte=time.time() - self.ttl)
+                ),
+            ]
+        )
+
+    async def _ensure_collection(self, size: int) -> None:
+        """
+        Create the cache collection and its payload indexes if missing.
+
+        Args:
+            size (int): The dimension of the prompt embeddings.
+        """
+        if self._ready:
+            return
+        async with self._lock:
+            if self._ready:
+                return
+            client = self.memory_store.get_client_async()
+            if not await client.collection_exists(self.collection_name):
+                await client.create_collection(
+                    collection_name=self.collection_name,
+                    vectors_config=models.VectorParams(
+                        size=size,
+                        distance=models.Distance.COSINE
+                    )
+                )
+                for field, schema in (
+                    ("scope", models.PayloadSchemaType.KEYWORD),
+                    ("model", models.PayloadSchemaType.KEYWORD),
+                    ("created_at", models.PayloadSchemaType.FLOAT),
+                ):
+                    await client.create_payload_index(
+                        collection_name=self.collection_name,
+                        field_name=field,
+                        field_schema=schema
+                    )
+                logger.info(
+                    f"Semantic cache collection '{self.collection_name}' "
+                    "created"
+                )
+            self._ready = True
+
+    async def _embed(self, prompt: str) -> list[float]:
+        """Embed a normalized prompt and make sure the collection exists."""
+        embeddings = self.memory_store.model_embedding
+        if embeddings is None:
+            raise ValueError("No embedding model configured")
+        vector = await embeddings.aembed_query(self._normalize(prompt))
+        await self._ensure_collection(len(vector))
+        return vector
+
+    async def lookup(
+        self,
+        prompt: str,
+        scope: str | None = None
+    ) -> str | None:
+        """
+        Look up the answer of a similar prompt.
+
+        Args:
+            prompt (str): The user prompt.
+            scope (str | None): The data collection the answer must refer to.
+                `COLLECTION_NAME` by default.
+        Returns:
+            str | None: The cached answer, or None on a miss.
+        """
+        scope = settings.COLLECTION_NAME if scope is None else scope
+        if not self.enabled:
+            return None
+        try:
+            vector = await self._embed(prompt)
+            client = self.memory_store.get_client_async()
+            response = await client.query_points(
+                collection_name=self.collection_name,
+                query=vector,
+                query_filter=self._get_filter(scope),
+                score_threshold=self.threshold,
+                limit=1,
+                with_payload=True
+            )
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning(f"Semantic cache lookup failed: {e}")
+            return None
+
+        if not response.points:
+            self.stats.misses += 1
+            return None
+        point = response.points[0]
+        self.stats.hits += 1
+        logger.debug(
+            f"Semantic cache hit (score {point.score:.3f}) for "
+            f"'{point.payload.get('prompt')}'"
+        )
+        return point.payload.get("answer")
+
+    async def store(
+        self,
+        prompt: str,
+        answer: str,
+        scope: str | None = None
+    ) -> None:
+        """
+        Store the answer of a prompt.
+
+        Args:
+            prompt (str): The user prompt.
+            answer (str): The final answer of the agent.
+            scope (str | None): The data collection the answer refers to.
+                `COLLECTION_NAME` by default.
+        """
+        scope = settings.COLLECTION_NAME if scope is None else scope
+        if not self.enabled or not answer:
+            return
+        normalized = self._normalize(prompt)
+        payload: dict[str, Any] = {
+            "prompt": normalized,
+            "answer": answer,
+            "scope": scope,
+            "model": settings.LLM_MODEL_NAME,
+            "created_at": time.time(),
+        }
+        # The same prompt overwrites its previous answer
+        point_id = str(
+            uuid.uuid5(
+                uuid.NAMESPACE_URL,
+                f"{scope}|{settings.LLM_MODEL_NAME}|{normalized}"
+            )
+        )
+        try:
+            vector = await self._embed(prompt)
+            await self.memory_store.get_client_async().upsert(
+                collection_name=self.collection_name,
+                points=[
+                    models.PointStruct(
+                        id=point_id,
+                        vector=vector,
+                        payload=payload
+                    )
+                ]
+            )
+            self.stats.stores += 1
+            await self._purge_expired()
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning(f"Semantic cache store failed: {e}")
+
+    async def invalidate(self, scope: str | None = None) -> None:
+        """
+        Drop every answer computed on a data collection.
+
+        Args:
+            scope (str | None): The data collection that changed.
+                `COLLECTION_NAME` by default.
+        """
+        scope = settings.COLLECTION_NAME if scope is None else scope
+        if not self.enabled:
+            return
+        try:
+            client = self.memory_store.get_client_async()
+            if not await client.collection_exists(self.collection_name):
+                return
+            await client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.FilterSelector(
+                    filter=models.Filter(
+                        must=[
+                            models.FieldCondition(
+                                key="scope",
+                                match=models.MatchValue(value=scope)
+                            )
+                        ]
+                    )
+                )
+            )
+            self.stats.invalidations += 1
+            logger.info(f"Semantic cache invalidated for '{scope}'")
+        except Exception as e:
+            self.stats.errors += 1
+            logger.warning(f"Semantic cache invalidation failed: {e}")
+
+    async def _purge_expired(self) -> None:
+        """Delete the expired entries, at most once per TTL."""
+        now = time.time()
+        if now - self._last_purge < self.ttl:
+            return
+        self._last_purge = now
+        await self.memory_store.get_client_async().delete(
+            collection_name=self.collection_name,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="created_at",
+                            range=models.Range(lt=now - self.ttl)
+                        )
+                    ]
+                )
+            )
+        )
@@ -0,0 +1,237 @@
+"""
+Factory of the A2A server application.
+
+Each uvicorn worker builds its own application through `create_app`, so
+the server can run with more than one process. The tasks and the push
+notification configs are kept in Redis (`TASK_STORE=redis`), where every
+worker and replica finds them, and the events of a running task are
+published there, so a `tasks/resubscribe` routed to another worker still
+streams them (see `redis_stores`); `TASK_STORE=memory` keeps the
+in-process stores and queues of the A2A SDK, for a single worker. A
+`tasks/cancel` routed to another worker reaches the one running the task
+through Redis (see `cancellation`). The push notifications are
+delivered in background by `QueuedPushNotificationSender`. The metrics
+of the worker are served on `/metrics` (see `metrics`), its liveness and
+readiness on `/health/live` and `/health/ready` (see `warmup`).
+"""
+
+from contextlib import asynccontextmanager
+
+from a2a.server.apps import A2AStarletteApplication
+from a2a.server.events import InMemoryQueueManager, QueueManager
+from a2a.server.request_handlers import DefaultRequestHandler
+from a2a.server.tasks import (
+    InMemoryPushNotificationConfigStore,
+    InMemoryTaskStore,
+    PushNotificationConfigStore,
+    TaskStore,
+)
+from redis.asyncio import Redis
+from starlette.applications import Starlette
+from agent import get_host_persistence_config
+from agent_configurator import create_agent_card
+from agent_executor import KGragAgentExecutor
+from checkpointer import (
+    close_checkpointers,
+    get_blob_stats,
+    get_checkpointer,
+    get_sweep_stats,
+)
+from embedding_cache import CachedEmbeddings
+from llm_clients import close_llm_clients, stats as llm_client_stats
+from llm_router import get_endpoint_stats
+from mcp_client import mcp_pool
+from metrics import metrics_endpoint, stats_collector
+from push_delivery import QueuedPushNotificationSender
+from redis_stores import (
+    RedisPushNotificationConfigStore,
+    RedisQueueManager,
+    RedisTaskStore,
+)
+from warmup import Warmup, create_warmup, live_endpoint
+from config import settings
+from log import logger, get_log_stats
+
+
+def get_shared_redis() -> Redis | None:
+    """
+    Get the Redis client shared by the workers, the one of the
+    checkpointer; None with `TASK_STORE=memory`, for a single worker.
+    """
+    if settings.TASK_STORE == "memory":
+        return None
+    if settings.TASK_STORE != "redis":
+        logger.warning(
+            f"Unknown TASK_STORE '{settings.TASK_STORE}': using redis"
+        )
+    return get_checkpointer(get_host_persistence_config()).conn
+
+
+def create_stores(
+    redis: Redis | None
+) -> tuple[TaskStore, PushNotificationConfigStore, QueueManager]:
+    """
+    Create the task and push notification config stores and the manager
+    of the event queues.
+
+    Args:
+        redis (Redis | None): The shared Redis client; None for the
+            in-process stores.
+    Returns:
+        tuple: The task store, the push notification config store and
+            the queue manager.
+    """
+    if redis is None:
+        return (
+            InMemoryTaskStore(),
+            InMemoryPushNotificationConfigStore(),
+            InMemoryQueueManager()
+        )
+    return (
+        RedisTaskStore(redis),
+        RedisPushNotificationConfigStore(redis),
+        RedisQueueManager(redis)
+    )
+
+
+def register_stats(
+    executor: KGragAgentExecutor,
+    push_sender: QueuedPushNotificationSender,
+    warmup: Warmup
+) -> None:
+    """
+    Export the counters of the components on `/metrics`.
+
+    Args:
+        executor (KGragAgentExecutor): The agent executor.
+        push_sender (QueuedPushNotificationSender): The push sender.
+        warmup (Warmup): The warm-up of the worker.
+    """
+    agent = executor.agent
+    admission = executor.admission
+    stats_collector.register(
+        "admission",
+        lambda: {
+            **admission.stats.as_dict(),
+            "active_requests": admission.active,
+            "waiting_requests": admission.queued,
+        }
+    )
+    stats_collector.register(
+        "graph_cache",
+        agent.graph_cache.stats.as_dict
+    )
+    stats_collector.register(
+        "tool_cache",
+        agent.tool_cache.get_stats,
+        label="tool"
+    )
+    stats_collector.register(
+        "response_cache",
+        agent.response_cache.stats.as_dict
+    )
+    stats_collector.register(
+        "semantic_cache",
+        agent.semantic_cache.stats.as_dict
+    )
+    embeddings = agent.memory_store.model_embedding
+    if isinstance(embeddings, CachedEmbeddings):
+        stats_collector.register(
+            "embedding_cache",
+            embeddings.stats.as_dict
+        )
+
+    def get_sentence_cache_stats() -> dict[str, float]:
+        # The sentence model is loaded on first use
+        model = agent.memory_store.model_embedding_vs
+        if isinstance(model, CachedEmbeddings):
+            return model.stats.as_dict()
+        return {}
+
+    stats_collector.register(
+        "sentence_embedding_cache",
+        get_sentence_cache_stats
+    )
+    stats_collector.register(
+        "checkpoint_sweeper",
+        get_sweep_stats,
+        label="redis"
+    )
+    stats_collector.register(
+        "checkpoint_blobs",
+        get_blob_stats,
+        label="redis"
+    )
+    stats_collector.register("llm_clients", llm_client_stats.as_dict)
+    stats_collector.register(
+        "llm_endpoint",
+        get_endpoint_stats,
+        label="endpoint"
+    )
+    stats_collector.register("push", push_sender.stats.as_dict)
+    stats_collector.register("log", get_log_stats)
+    stats_collector.register("warmup", warmup.as_dict)
+
+
+def create_app(
+    host: str | None = None,
+    port: int | None = None
+) -> Starlette:
+    """
+    Build the A2A application of a worker.
+
+    Args:
+        host (str | None): The host published in the agent card. `AGENT_HOST`
+            by default.
+        port (int | None): The port published in the agent card. `AGENT_PORT`
+            by default.
+    Returns:
+        Starlette: The ASGI application.
+    """
+    host = settings.AGENT_HOST if host is None else host
+    port = settings.AGENT_PORT if port is None else port
+    settings.log_settings()
+    redis = get_shared_redis()
+    task_store, push_config_store, queue_manager = create_stores(redis)
+    push_sender = QueuedPushNotificationSender(push_config_store)
+
+    executor = KGragAgentExecutor(redis)
+    warmup = create_warmup(executor.agent)
+    register_stats(executor, push_sender, warmup)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        """
+        Warm the worker up in background once uvicorn starts, and release
+        the process-wide resources when it stops.
+        """
+        warmup.start()
+        executor.cancellations.start()
+        yield
+        await warmup.close()
+        await executor.cancellations.close()
+        if isinstance(queue_manager, RedisQueueManager):
+            await queue_manager.shutdown()
+        await push_sender.close()
+        await executor.agent.summary_scheduler.close()
+        await mcp_pool.close()
+        await close_llm_clients()
+        await close_checkpointers()
+
+    request_handler = DefaultRequestHandler(
+        agent_executor=executor,
+        task_store=task_store,
+        push_config_store=push_config_store,
+        push_sender=push_sender,
+        queue_manager=queue_manager
+    )
+
+    server = A2AStarletteApplication(
+        agent_card=create_agent_card(host, port),
+        http_handler=request_handler
+    )
+    app = server.build(lifespan=lifespan)
+    app.add_route("/metrics", metrics_endpoint, methods=["GET"])
+    app.add_route("/health/live", live_endpoint, methods=["GET"])
+    app.add_route("/health/ready", warmup.ready_endpoint, methods=["GET"])
+    return app
@@ -0,0 +1,54 @@
+"""
+Per-thread asyncio locks.
+
+Turns of the same conversation (LangGraph thread) must run one after the
+other, otherwise they would read and write the same checkpoints
+concurrently. Turns of different conversations do not share anything and
+run fully in parallel.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class ThreadLocks:
+    """
+    Registry of asyncio locks keyed by thread id.
+
+    A lock lives only while at least one turn holds or waits for it, so
+    the registry does not grow with the number of conversations served.
+    """
+
+    def __init__(self):
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._users: dict[str, int] = {}
+
+    @asynccontextmanager
+    async def hold(self, thread_id: str) -> AsyncIterator[None]:
+        """
+        Hold the lock of a thread for the duration of the context.
+
+        Args:
+            thread_id (str): The thread identifier.
+        """
+        lock = self._locks.get(thread_id)
+        if lock is None:
+            lock = self._locks[thread_id] = asyncio.Lock()
+        self._users[thread_id] = self._users.get(thread_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[thread_id] -= 1
+            if self._users[thread_id] == 0:
+                del self._users[thread_id]
+                del self._locks[thread_id]
+
+    def locked(self, thread_id: str) -> bool:
+        """Return True if a turn of the thread is running."""
+        lock = self._locks.get(thread_id)
+        return lock is not None and lock.locked()
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -0,0 +1,236 @@
+"""
+Concurrency of the A2A sessions: turns of different threads overlap,
+turns of the same thread run one after the other, and each A2A context
+runs on its own LangGraph thread.
+"""
+
+import asyncio
+import uuid
+from typing import AsyncIterable
+from session_locks import ThreadLocks
+
+
+class GatedAgent:
+    """
+    Fake agent serializing its turns like `KGragAgent.stream`; each turn
+    waits for its gate to be opened by the test before answering.
+    """
+
+    def __init__(self):
+        self.thread_locks = ThreadLocks()
+        self.gates: dict[str, asyncio.Event] = {}
+        self.events: list[tuple[str, str]] = []
+
+    def gate(self, prompt: str) -> asyncio.Event:
+        return self.gates.setdefault(prompt, asyncio.Event())
+
+    async def stream(
+        self,
+        prompt: str,
+        thread_id: str
+    ) -> AsyncIterable[str]:
+        async with self.thread_locks.hold(thread_id):
+            self.events.append(("start", prompt))
+            await self.gate(prompt).wait()
+            self.events.append(("end", prompt))
+            yield prompt
+
+
+async def run_turn(agent: GatedAgent, prompt: str, thread_id: str) -> None:
+    async for _ in agent.stream(prompt, thread_id):
+        pass
+
+
+async def wait_for(predicate, timeout: float = 1.0) -> None:
+    async with asyncio.timeout(timeout):
+        while not predicate():
+            await asyncio.sleep(0)
+
+
+def test_threads_overlap_and_turns_are_serialized():
+    async def scenario():
+        agent = GatedAgent()
+        turns = [
+            asyncio.create_task(run_turn(agent, "a1", "thread-a")),
+            asyncio.create_task(run_turn(agent, "b1", "thread-b")),
+            asyncio.create_task(run_turn(agent, "a2", "thread-a")),
+        ]
+
+        # Both threads are running at the same time, the second turn of
+        # thread-a waits for the first one
+        await wait_for(lambda: len(agent.events) == 2)
+        await asyncio.sleep(0.01)
+        assert set(agent.events) == {("start", "a1"), ("start", "b1")}
+        assert agent.thread_locks.locked("thread-a")
+        assert agent.thread_locks.locked("thread-b")
+
+        # Thread-b completes while thread-a is still busy
+        agent.gate("b1").set()
+        await wait_for(lambda: ("end", "b1") in agent.events)
+        assert ("start", "a2") not in agent.events
+
+        # The second turn starts only once the first one ended
+        agent.gate("a1").set()
+        await wait_for(lambda: ("start", "a2") in agent.events)
+        assert agent.events.index(("end", "a1")) < agent.events.index(
+            ("start", "a2")
+        )
+
+        agent.gate("a2").set()
+        await asyncio.gather(*turns)
+        assert len(agent.thread_locks) == 0
+
+    asyncio.run(scenario())
+
+
+def test_turns_of_a_thread_run_in_arrival_order():
+    async def scenario():
+        agent = GatedAgent()
+        prompts = [f"turn-{i}" for i in range(5)]
+        for prompt in prompts:
+            agent.gate(prompt).set()
+        await asyncio.gather(*[
+            run_turn(agent, prompt, "thread") for prompt in prompts
+        ])
+        starts = [p for kind, p in agent.events if kind == "start"]
+        assert starts == prompts
+        # No turn started before the previous one ended
+        for i in range(0, len(agent.events), 2):
+            assert agent.events[i][0] == "start"
+            assert agent.events[i + 1] == ("end", agent.events[i][1])
+
+    asyncio.run(scenario())
+
+
+class OfflineMemory:
+    """Memory persistence without embedding model nor Qdrant."""
+
+    model_embedding = None
+    model_embedding_vs = None
+
+    def get_in_memory_store(self):
+        from langgraph.store.memory import InMemoryStore
+        return InMemoryStore()
+
+
+def create_executor(monkeypatch, checkpointer, graph):
+    """
+    Build the real executor and agent, on a graph standing for the ReAct
+    agent and an in-memory checkpointer.
+    """
+    import agent
+    from agent_executor import KGragAgentExecutor
+
+    monkeypatch.setattr(agent, "get_checkpointer", lambda config: checkpointer)
+    monkeypatch.setattr(
+        agent.KGragAgent,
+        "_get_memory",
+        lambda self: OfflineMemory()
+    )
+    executor = KGragAgentExecutor()
+    kgrag_agent = executor.agent
+    kgrag_agent.semantic_cache.enabled = False
+    kgrag_agent.response_cache.enabled = False
+
+    async def get_agent(checkpointer):
+        return graph.compile(checkpointer=checkpointer)
+
+    monkeypatch.setattr(kgrag_agent, "_get_agent", get_agent)
+    monkeypatch.setattr(kgrag_agent, "_schedule_summary", lambda _: None)
+    return executor
+
+
+def test_contexts_run_in_separate_threads(monkeypatch):
+    from a2a.server.agent_execution import RequestContext
+    from a2a.server.events import EventQueue
+    from a2a.types import (
+        Message,
+        MessageSendParams,
+        Part,
+        Role,
+        TaskState,
+        TaskStatusUpdateEvent,
+        TextPart,
+    )
+    from langchain_core.messages import AIMessage
+    from langgraph.checkpoint.memory import InMemorySaver
+    from langgraph.graph import START, MessagesState, StateGraph
+
+    class Checkpointer(InMemorySaver):
+        # No Redis: the response cache of the agent stays in process
+        conn = None
+
+    started: list[str] = []
+    gates: dict[str, asyncio.Event] = {}
+
+    async def answer(state: MessagesState, config) -> dict:
+        thread_id = config["configurable"]["thread_id"]
+        started.append(thread_id)
+        await gates.setdefault(thread_id, asyncio.Event()).wait()
+        seen = [message.content for message in state["messages"]]
+        return {"messages": [AIMessage(f"{thread_id} saw {seen}")]}
+
+    graph = StateGraph(MessagesState)
+    graph.add_node("agent", answer)
+    graph.add_edge(START, "agent")
+    checkpointer = Checkpointer()
+
+    async def send(executor, context_id: str, text: str) -> str:
+        message = Message(
+            role=Role.user,
+            parts=[Part(root=TextPart(text=text))],
+            message_id=uuid.uuid4().hex,
+            context_id=context_id
+        )
+        queue = EventQueue()
+        await executor.execute(
+            RequestContext(
+                request=MessageSendParams(message=message),
+                context_id=context_id
+            ),
+            queue
+        )
+        answer = None
+        while not queue.queue.empty():
+            event = await queue.dequeue_event()
+            if isinstance(event, TaskStatusUpdateEvent):
+                assert event.status.state != TaskState.failed
+            elif hasattr(event, "artifact"):
+                answer = event.artifact.parts[0].root.text
+        return answer
+
+    async def scenario():
+        executor = create_executor(monkeypatch, checkpointer, graph)
+        context_a, context_b = str(uuid.uuid4()), str(uuid.uuid4())
+        turns = [
+            asyncio.create_task(send(executor, context_a, "question a")),
+            asyncio.create_task(send(executor, context_b, "question b")),
+        ]
+        # Both contexts run at the same time, each on its own thread
+        await wait_for(lambda: len(started) == 2)
+        assert set(started) == {context_a, context_b}
+        gates[context_b].set()
+        gates[context_a].set()
+        answers = await asyncio.gather(*turns)
+        first_a = f"{context_a} saw ['question a']"
+        assert answers == [first_a, f"{context_b} saw ['question b']"]
+
+        # The next turn of a context only sees its own checkpoint
+        assert await send(executor, context_a, "again a") == (
+            f"{context_a} saw {['question a', first_a, 'again a']}"
+        )
+        for context_id, prompt in (
+            (context_a, "again a"),
+            (context_b, "question b"),
+        ):
+            state = await checkpointer.aget_tuple(
+                {"configurable": {"thread_id": context_id}}
+            )
+            messages = state.checkpoint["channel_values"]["messages"]
+            assert messages[-2].content == prompt
+            assert all(
+                message.content.startswith(context_id)
+                for message in messages if isinstance(message, AIMessage)
+            )
+
+    asyncio.run(scenario())
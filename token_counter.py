@@ -0,0 +1,354 @@
+"""
+Incremental token counting for the summarization pre-model hook.
+
+`SummarizationNode` counts the tokens of the whole message history before
+every model call, so with `count_tokens_approximately` the cost of each
+ReAct step grows with the length of the thread. The counter below
+memoizes the count of every message by message id and the total of every
+counted history: on each step only the new messages are tokenized and
+added to the total of the previous step.
+
+Memoizing is not enough on its own: `asummarize_messages` also walks the
+messages not yet summarized, one `token_counter([message])` call each, to
+find the cut-off point. `IncrementalSummarizationNode` checks the running
+total of those messages first and skips the walk when it is below the
+summarization threshold, which is the case on almost every step.
+
+Messages are tokenized with the tiktoken encoding of `LLM_MODEL_NAME` when
+tiktoken knows the model, and approximately otherwise.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Sequence
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langmem.short_term import (
+    RunningSummary,
+    SummarizationNode,
+    SummarizationResult,
+)
+from pydantic import BaseModel
+from config import settings
+from log import logger
+
+# Tokens added by the chat format around every message
+TOKENS_PER_MESSAGE = 3
+# Trailing messages searched for an already counted prefix
+PREFIX_LOOKBACK = 32
+
+
+def get_encoder(model_name: str) -> Callable[[str], int] | None:
+    """
+    Get a function counting the tokens of a text for a model.
+
+    Args:
+        model_name (str): The name of the LLM model.
+    Returns:
+        Callable | None: The counting function, or None if tiktoken is not
+            installed, does not know the model or cannot download its
+            encoding (e.g. offline).
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        encoding = tiktoken.encoding_for_model(model_name)
+    except Exception as e:
+        logger.debug(f"No tiktoken encoding for '{model_name}': {e}")
+        return None
+    return lambda text: len(
+        encoding.encode(text, disallowed_special=())
+    )
+
+
+class IncrementalTokenCounter:
+    """
+    Token counter memoizing the count of each message by id.
+    """
+
+    def __init__(
+        self,
+        model_name: str | None = None,
+        max_size: int | None = None
+    ):
+        """
+        Initialize the counter.
+
+        Args:
+            model_name (str | None): The model whose tokenizer is used.
+                `LLM_MODEL_NAME` by default.
+            max_size (int | None): The number of message counts memoized.
+                `TOKEN_COUNTER_CACHE_SIZE` by default.
+        """
+        if model_name is None:
+            model_name = settings.LLM_MODEL_NAME
+        if max_size is None:
+            max_size = settings.TOKEN_COUNTER_CACHE_SIZE
+        self.encode = get_encoder(model_name)
+        self.max_size = max(1, max_size)
+        self.hits = 0
+        self.misses = 0
+        self._counts: OrderedDict[tuple[str, int], int] = OrderedDict()
+        self._prefixes: OrderedDict[
+            tuple[str, str, int], int
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+        logger.info(
+            f"Token counter for '{model_name}': "
+            f"{'tiktoken' if self.encode else 'approximate'}"
+        )
+
+    @staticmethod
+    def _get_text(message: BaseMessage) -> str:
+        """Get the text of a message, tool calls included."""
+        content = message.content
+        if isinstance(content, list):
+            content = "".join(
+                block.get("text", "") if isinstance(block, dict)
+                else str(block)
+                for block in content
+            )
+        tool_calls = getattr(message, "tool_calls", None)
+        if tool_calls:
+            content += json.dumps(
+                [
+                    {"name": call["name"], "args": call["args"]}
+                    for call in tool_calls
+                ],
+                default=str
+            )
+        return content
+
+    def count_message(self, message: BaseMessage) -> int:
+        """
+        Count the tokens of a single message.
+
+        Args:
+            message (BaseMessage): The message.
+        Returns:
+            int: The number of tokens.
+        """
+        if self.encode is None:
+            return count_tokens_approximately([message])
+        return TOKENS_PER_MESSAGE + self.encode(self._get_text(message))
+
+    def _count_messages(self, messages: Sequence[BaseMessage]) -> int:
+        """Sum the memoized counts of the messages, counting new ones."""
+        total = 0
+        missing: list[tuple[tuple[str, int] | None, BaseMessage]] = []
+        counts = self._counts
+        with self._lock:
+            for message in messages:
+                if not message.id:
+                    missing.append((None, message))
+                    continue
+                # The content length guards against messages edited in
+                # place
+                key = (message.id, len(message.content))
+                count = counts.get(key)
+                if count is None:
+                    missing.append((key, message))
+                else:
+                    counts.move_to_end(key)
+                    total += count
+            self.hits += len(messages) - len(missing)
+
+        if not missing:
+            return total
+        new_counts = [
+            (key, self.count_message(message)) for key, message in missing
+        ]
+        with self._lock:
+            for key, count in new_counts:
+                total += count
+                if key is None:
+                    continue
+                self.misses += 1
+                counts[key] = count
+            while len(counts) > self.max_size:
+                counts.popitem(last=False)
+        return total
+
+    def __call__(self, messages: Sequence[BaseMessage]) -> int:
+        """
+        Count the tokens of a list of messages.
+
+        The history only grows between two ReAct steps, so the total of
+        the longest already counted prefix (identified by its first and
+        last message ids and its length) is reused and only the messages
+        after it are counted.
+        Args:
+            messages (Sequence[BaseMessage]): The messages.
+        Returns:
+            int: The number of tokens.
+        """
+        if (
+            len(messages) < 2
+            or not messages[0].id
+            or not messages[-1].id
+        ):
+            # Single messages, counted one by one by the summarization,
+            # are not worth a prefix entry
+            return self._count_messages(messages)
+
+        first_id = messages[0].id
+        start, total = 0, 0
+        # Look for a counted prefix among the last messages only
+        for end in range(
+            len(messages),
+            max(0, len(messages) - PREFIX_LOOKBACK),
+            -1
+        ):
+            prefix = self._prefixes.get(
+                (first_id, messages[end - 1].id, end)
+            )
+            if prefix is not None:
+                start, total = end, prefix
+                break
+        total += self._count_messages(messages[start:])
+
+        with self._lock:
+            self._prefixes[(first_id, messages[-1].id, len(messages))] = (
+                total
+            )
+            self._prefixes.move_to_end(
+                (first_id, messages[-1].id, len(messages))
+            )
+            while len(self._prefixes) > self.max_size:
+                self._prefixes.popitem(last=False)
+        return total
+
+
+class IncrementalSummarizationNode(SummarizationNode):
+    """
+    `SummarizationNode` skipping the per-message walk of
+    `asummarize_messages` while no summary is due.
+
+    The messages after the running summary are counted in one call of
+    the incremental counter, which only tokenizes the new ones; when they
+    stay below `max_tokens_before_summary` nothing can be summarized, and
+    the node returns the same messages `asummarize_messages` would.
+    """
+
+    def __init__(
+        self,
+        max_size: int | None = None,
+        **kwargs: Any
+    ):
+        """
+        Initialize the node.
+
+        Args:
+            max_size (int | None): The number of threads whose summary position
+                is memoized. `TOKEN_COUNTER_CACHE_SIZE` by default.
+            kwargs: The arguments of `SummarizationNode`.
+        """
+        if max_size is None:
+            max_size = settings.TOKEN_COUNTER_CACHE_SIZE
+        super().__init__(**kwargs)
+        self.max_size = max(1, max_size)
+        # Position of the last summarized message, by message id
+        self._summarized: OrderedDict[str, int] = OrderedDict()
+
+    def _get_summarized_count(
+        self,
+        messages: Sequence[BaseMessage],
+        running_summary: RunningSummary | None
+    ) -> int:
+        """Return the number of messages covered by the running summary."""
+        if running_summary is None:
+            return 0
+        last_id = running_summary.last_summarized_message_id
+        index = self._summarized.get(last_id) if last_id else None
+        if index is None or index >= len(messages) or (
+            messages[index].id != last_id
+        ):
+            index = next(
+                (
+                    i for i, message in enumerate(messages)
+                    if message.id == last_id
+                ),
+                None
+            )
+            if index is None:
+                return 0
+            self._summarized[last_id] = index
+            while len(self._summarized) > self.max_size:
+                self._summarized.popitem(last=False)
+        return index + 1
+
+    def count_unsummarized(
+        self,
+        messages: Sequence[BaseMessage],
+        running_summary: RunningSummary | None
+    ) -> int:
+        """
+        Count the tokens of the messages after the running summary.
+
+        Args:
+            messages (Sequence[BaseMessage]): The messages of the thread.
+            running_summary (RunningSummary | None): Its running summary.
+        Returns:
+            int: The number of tokens not yet summarized.
+        """
+        start = self._get_summarized_count(messages, running_summary)
+        return self.token_counter(messages[start:])
+
+    def _skip_summary(
+        self,
+        input: dict[str, Any] | BaseModel
+    ) -> dict[str, Any] | None:
+        """
+        Build the state update without summarizing, if no summary is due.
+
+        Returns:
+            dict | None: The update, or None when `asummarize_messages`
+                must run.
+        """
+        messages, context = self._parse_input(input)
+        running_summary = context.get("running_summary")
+        system_message = None
+        history = list(messages)
+        if history and isinstance(history[0], SystemMessage):
+            system_message, history = history[0], history[1:]
+        history = history[
+            self._get_summarized_count(history, running_summary):
+        ]
+        threshold = self.max_tokens_before_summary or self.max_tokens
+        if self.token_counter(history) >= threshold:
+            return None
+
+        if running_summary is None:
+            result = SummarizationResult(messages=messages)
+        else:
+            include_system_message = system_message is not None and (
+                running_summary.summary not in system_message.content
+            )
+            prompt = self.final_prompt.invoke({
+                "system_message": (
+                    [system_message] if include_system_message else []
+                ),
+                "summary": running_summary.summary,
+                "messages": history,
+            })
+            result = SummarizationResult(
+                messages=prompt.messages,
+                running_summary=running_summary
+            )
+        return self._prepare_state_update(context, result)
+
+    def _func(self, input: dict[str, Any] | BaseModel) -> dict[str, Any]:
+        update = self._skip_summary(input)
+        return update if update is not None else super()._func(input)
+
+    async def _afunc(
+        self,
+        input: dict[str, Any] | BaseModel
+    ) -> dict[str, Any]:
+        update = self._skip_summary(input)
+        if update is not None:
+            return update
+        return await super()._afunc(input)
@@ -0,0 +1,247 @@
+"""
+Memoization of the MCP tool calls.
+
+The knowledge-graph tools of the kgrag MCP server are often called with
+identical arguments, within one ReAct loop and across sessions, and every
+call is a remote round trip hitting Neo4j and Qdrant. The cache wraps the
+MCP tools so that the result of a call is reused while it is fresh:
+
+- each tool has a cacheability policy and a TTL: the `readOnlyHint` and
+  `destructiveHint` annotations published by the server, overridden per
+  tool with `TOOL_CACHE_TTL_<TOOL NAME>` (`0` disables caching);
+- ingestion and memory-management tools always bypass the cache;
+- arguments are canonicalized (sorted keys, no null values) before
+  building the key;
+- the number of cached results is bounded by an LRU eviction;
+- hit rates are recorded per tool.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Sequence
+from langchain_core.tools import BaseTool, StructuredTool
+from agent_graph import CacheStats
+from config import settings
+from log import logger
+
+# Tools with side effects, never cached
+BYPASS_TOOLS = {"manage_memory", "search_memory"}
+
+
+class ToolResultCache:
+    """
+    LRU cache of tool results with per-tool TTLs and statistics.
+
+    Concurrent calls with the same arguments share a single remote call.
+    """
+
+    def __init__(
+        self,
+        max_size: int | None = None,
+        default_ttl: float | None = None,
+        ttl_overrides: dict[str, float] | None = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_size (int | None): The number of results kept.
+                `TOOL_CACHE_SIZE` by default.
+            default_ttl (float | None): Seconds a result of a read-only tool is
+                reused (`0` disables the cache). `TOOL_CACHE_TTL` by default.
+            ttl_overrides (dict[str, float] | None): TTL per tool name,
+                taking precedence over the annotations of the tool
+                (default `TOOL_CACHE_TTL_*`).
+        """
+        if max_size is None:
+            max_size = settings.TOOL_CACHE_SIZE
+        if default_ttl is None:
+            default_ttl = settings.TOOL_CACHE_TTL
+        self.max_size = max(1, max_size)
+        self.default_ttl = default_ttl
+        self.ttl_overrides = (
+            ttl_overrides
+            if ttl_overrides is not None
+            else settings.TOOL_CACHE_TTL_OVERRIDES
+        )
+        self.stats: dict[str, CacheStats] = {}
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._wrapped: dict[int, tuple[BaseTool, BaseTool]] = {}
+
+    def get_ttl(self, tool: BaseTool) -> float:
+        """
+        Get the TTL of the results of a tool.
+
+        Args:
+            tool (BaseTool): The MCP tool.
+        Returns:
+            float: Seconds a result is reused, `0` if it is not cacheable.
+        """
+        name = tool.name.lower()
+        if name in BYPASS_TOOLS or "ingest" in name:
+            return 0.0
+        if name in self.ttl_overrides:
+            return self.ttl_overrides[name]
+        annotations = tool.metadata or {}
+        if annotations.get("destructiveHint") or (
+            annotations.get("readOnlyHint") is False
+        ):
+            return 0.0
+        return self.default_ttl
+
+    @staticmethod
+    def get_key(tool_name: str, arguments: dict[str, Any]) -> str:
+        """
+        Build the cache key of a call from its canonical arguments.
+
+        Args:
+            tool_name (str): The name of the tool.
+            arguments (dict): The arguments of the call.
+        Returns:
+            str: The cache key.
+        """
+        canonical = json.dumps(
+            {k: v for k, v in arguments.items() if v is not None},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            default=str
+        )
+        return f"{tool_name}:{canonical}"
+
+    def _get_stats(self, tool_name: str) -> CacheStats:
+        """Get the counters of a tool."""
+        stats = self.stats.get(tool_name)
+        if stats is None:
+            stats = self.stats[tool_name] = CacheStats()
+        return stats
+
+    def _get_fresh(self, key: str) -> tuple[bool, Any]:
+        """Return (True, result) if the key holds a fresh result."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, result
+
+    def _set(self, key: str, result: Any, ttl: float) -> None:
+        """Insert a result, evicting the least recently used ones."""
+        self._entries[key] = (time.monotonic() + ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def call(
+        self,
+        tool: BaseTool,
+        ttl: float,
+        arguments: dict[str, Any]
+    ) -> Any:
+        """
+        Call a tool through the cache.
+
+        Args:
+            tool (BaseTool): The original MCP tool.
+            ttl (float): Seconds the result is reused.
+            arguments (dict): The arguments of the call.
+        Returns:
+            Any: The result of the tool coroutine.
+        """
+        key = self.get_key(tool.name, arguments)
+        stats = self._get_stats(tool.name)
+
+        found, result = self._get_fresh(key)
+        if found:
+            stats.hits += 1
+            return result
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # The same call is running: wait for its result
+            await asyncio.wait({inflight})
+            if not inflight.cancelled():
+                stats.hits += 1
+                return inflight.result()
+
+        stats.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await tool.coroutine(**arguments)  # type: ignore
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody waits for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            self._set(key, result, ttl)
+            return result
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def wrap(self, tool: BaseTool) -> BaseTool:
+        """
+        Wrap an MCP tool so that its calls go through the cache.
+
+        Args:
+            tool (BaseTool): The MCP tool.
+        Returns:
+            BaseTool: The wrapped tool, or the tool itself when its results
+                are not cacheable.
+        """
+        ttl = self.get_ttl(tool)
+        if ttl <= 0 or getattr(tool, "coroutine", None) is None:
+            return tool
+
+        async def cached_call(**arguments: Any) -> Any:
+            return await self.call(tool, ttl, arguments)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=cached_call,
+            response_format=tool.response_format,
+            metadata=tool.metadata,
+        )
+
+    def wrap_tools(self, tools: Sequence[BaseTool]) -> list[BaseTool]:
+        """
+        Wrap a tool catalog, reusing the wrappers of known tools.
+
+        Args:
+            tools (Sequence[BaseTool]): The MCP tools.
+        Returns:
+            list[BaseTool]: The wrapped tools.
+        """
+        wrapped: dict[int, tuple[BaseTool, BaseTool]] = {}
+        for tool in tools:
+            known = self._wrapped.get(id(tool))
+            if known is not None and known[0] is tool:
+                wrapped[id(tool)] = known
+            else:
+                wrapped[id(tool)] = (tool, self.wrap(tool))
+                logger.debug(
+                    f"Tool '{tool.name}' cache TTL: {self.get_ttl(tool)}s"
+                )
+        self._wrapped = wrapped
+        return [wrapped[id(tool)][1] for tool in tools]
+
+    def clear(self) -> None:
+        """Drop every cached result, e.g. after new data is ingested."""
+        self._entries.clear()
+
+    def get_stats(self) -> dict[str, dict[str, int | float]]:
+        """Return the counters of every tool."""
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
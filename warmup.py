@@ -0,0 +1,214 @@
+"""
+Background warm-up of a worker and its health routes.
+
+The first request of a worker used to pay for every cold path: the
+chat model client, the MCP SSE handshake and the tool
+catalog, the compilation of the agent graph, the embedding models and the
+first Redis and Qdrant connections. `Warmup` primes them concurrently in
+background when the worker starts (`WARMUP_ENABLED`):
+
+- `GET /health/live` answers as soon as the worker serves requests;
+- `GET /health/ready` answers `503` until every step succeeded, so the
+  orchestrator only sends traffic to a warm worker.
+
+A failed step (e.g. a service not reachable yet) is retried every
+`WARMUP_RETRY_INTERVAL` seconds; the worker stays not ready meanwhile.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from agent import KGragAgent, get_summarize_node
+from checkpointer import get_checkpointer
+from mcp_client import mcp_pool
+from config import settings
+from log import logger
+
+Step = Callable[[], Awaitable[Any]]
+
+
+class Warmup:
+    """
+    Runs the warm-up steps of a worker concurrently, retrying the failed
+    ones until all of them succeeded.
+    """
+
+    def __init__(
+        self,
+        steps: dict[str, Step],
+        enabled: bool | None = None,
+        timeout: float | None = None,
+        retry_interval: float | None = None
+    ):
+        """
+        Initialize the warm-up.
+
+        Args:
+            steps (dict[str, Step]): The steps by name.
+            enabled (bool | None): When False the worker is ready at once and
+                the cold paths are primed by the first requests.
+                `WARMUP_ENABLED` by default.
+            timeout (float | None): Seconds an attempt of a step may take.
+                `WARMUP_TIMEOUT` by default.
+            retry_interval (float | None): Seconds between the attempts of the
+                failed steps. `WARMUP_RETRY_INTERVAL` by default.
+        """
+        if enabled is None:
+            enabled = settings.WARMUP_ENABLED
+        if timeout is None:
+            timeout = settings.WARMUP_TIMEOUT
+        if retry_interval is None:
+            retry_interval = settings.WARMUP_RETRY_INTERVAL
+        self.steps = steps
+        self.enabled = enabled
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.status: dict[str, str] = {
+            name: "pending" if enabled else "skipped" for name in steps
+        }
+        self.errors: dict[str, str] = {}
+        self.seconds: dict[str, float] = {}
+        self.attempts: int = 0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def ready(self) -> bool:
+        """True when every step succeeded, or the warm-up is disabled."""
+        return all(
+            status in ("ok", "skipped") for status in self.status.values()
+        )
+
+    def start(self) -> None:
+        """Start the warm-up in background, in the running event loop."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run(), name="warmup")
+
+    async def _run(self) -> None:
+        """Run the steps until all of them succeeded."""
+        start = time.perf_counter()
+        pending = list(self.steps)
+        while True:
+            self.attempts += 1
+            results = await asyncio.gather(
+                *[self._step(name) for name in pending]
+            )
+            pending = [
+                name for name, ok in zip(pending, results) if not ok
+            ]
+            if not pending:
+                break
+            await asyncio.sleep(self.retry_interval)
+        logger.info(
+            f"Warm-up completed in {time.perf_counter() - start:.2f}s: "
+            + ", ".join(
+                f"{name}={seconds:.2f}s"
+                for name, seconds in self.seconds.items()
+            )
+        )
+
+    async def _step(self, name: str) -> bool:
+        """Run an attempt of a step; return True if it succeeded."""
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self.steps[name](), self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.status[name] = "failed"
+            self.errors[name] = str(e) or type(e).__name__
+            logger.warning(
+                f"Warm-up of {name} failed, retrying in "
+                f"{self.retry_interval}s: {self.errors[name]}"
+            )
+            return False
+        self.status[name] = "ok"
+        self.errors.pop(name, None)
+        self.seconds[name] = time.perf_counter() - start
+        return True
+
+    async def close(self) -> None:
+        """Stop the warm-up if it is still running."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def as_dict(self) -> dict[str, float]:
+        """Return the readiness and the seconds of each step."""
+        return {
+            "ready": int(self.ready),
+            "attempts": self.attempts,
+            **{
+                f"{name}_seconds": seconds
+                for name, seconds in self.seconds.items()
+            },
+        }
+
+    async def ready_endpoint(self, request: Request) -> JSONResponse:
+        """
+        Readiness probe: `200` once the worker is warm, `503` before.
+        """
+        return JSONResponse(
+            {
+                "status": "ready" if self.ready else "warming_up",
+                "steps": self.status,
+                "errors": self.errors,
+            },
+            status_code=200 if self.ready else 503
+        )
+
+
+async def live_endpoint(request: Request) -> JSONResponse:
+    """
+    Liveness probe: the worker is serving requests.
+    """
+    return JSONResponse({"status": "alive"})
+
+
+def create_warmup(agent: KGragAgent) -> Warmup:
+    """
+    Create the warm-up of the cold paths of an agent.
+
+    Args:
+        agent (KGragAgent): The agent of the worker.
+    Returns:
+        Warmup: The warm-up, started by the server.
+    """
+    checkpointer = get_checkpointer(agent.host_persistence_config)
+    memory_store = agent.memory_store
+
+    async def redis() -> None:
+        await checkpointer.conn.ping()
+
+    async def qdrant() -> None:
+        await memory_store.get_client_async().get_collections()
+
+    async def embeddings() -> None:
+        if memory_store.model_embedding is not None:
+            await memory_store.model_embedding.aembed_query("warm-up")
+
+    async def sentence_model() -> None:
+        # Downloads and loads the model of the vector store, kept by the
+        # store (see AgentMemoryPersistence)
+        await asyncio.to_thread(memory_store.get_embedding_model_vs)
+
+    async def agent_graph() -> None:
+        # The chat model is created off the event loop, while the MCP
+        # sessions are opened
+        await asyncio.gather(
+            asyncio.to_thread(get_summarize_node),
+            mcp_pool.start()
+        )
+        await agent._get_agent(checkpointer)
+
+    steps: dict[str, Step] = {
+        "redis": redis,
+        "qdrant": qdrant,
+        "embeddings": embeddings,
+        "agent": agent_graph,
+    }
+    if settings.VECTORDB_SENTENCE_MODEL:
+        steps["sentence_model"] = sentence_model
+    return Warmup(steps)